@@ -0,0 +1,251 @@
+"""
+Admission control: limit concurrent requests and shed load before Mongo saturates.
+
+`AdmissionMiddleware` sorts each request into a class and admits it only
+when both its class and the worker as a whole have a free slot. The worker
+limit defaults to the Mongo pool size, so requests wait here, in order,
+instead of piling up on pool checkouts where they all slow down together.
+Each class has its own concurrency limit and latency budget. Expensive lists
+and bulk writes get few slots and a long budget, cheap point reads many slots
+and a short one, so that a burst of lists cannot starve the point reads.
+
+A request that would wait longer than its class's budget is rejected at once
+with 503 and a Retry-After header. The wait is predicted from the queue
+length and the recent time requests hold a slot. A request that waits its
+whole budget anyway is rejected the same way. Rejected requests cost
+microseconds, so the requests that are admitted keep their latency.
+
+With RATE_LIMIT_PER_SECOND set, every client also has a token bucket. A
+client is identified by its IP address or, with RATE_LIMIT_KEY=api_key, by
+its X-API-Key header. A client that runs out of tokens gets 429 with a
+Retry-After header. Only use api_key behind a gateway that validates keys,
+or clients can escape the limit by sending new keys.
+
+Limits are per worker, so the server as a whole admits up to
+WEB_CONCURRENCY times as much. Event streams, metrics, docs and admin
+endpoints are never limited.
+
+Configuration is read from the environment:
+
+    ADMISSION_CONTROL              set to 0 to admit every request (1)
+    ADMISSION_CONCURRENCY          requests handled at once per worker (MONGO_MAX_POOL_SIZE, or 100)
+    ADMISSION_LIST_CONCURRENCY     lists, searches and bulk writes handled at once (16)
+    ADMISSION_LIST_BUDGET_MS       longest a list may wait for a slot (1000)
+    ADMISSION_READ_CONCURRENCY     point reads handled at once (100)
+    ADMISSION_READ_BUDGET_MS       longest a point read may wait for a slot (100)
+    ADMISSION_WRITE_CONCURRENCY    single creates, updates and deletes handled at once (50)
+    ADMISSION_WRITE_BUDGET_MS      longest a write may wait for a slot (500)
+    RATE_LIMIT_PER_SECOND          requests per second per client; 0 turns rate limiting off (0)
+    RATE_LIMIT_BURST               requests a client may make at once (RATE_LIMIT_PER_SECOND * 2)
+    RATE_LIMIT_KEY                 ip or api_key (ip)
+    TRUST_FORWARDED_FOR            set to 1 to take the client IP from X-Forwarded-For, behind a proxy (0)
+"""
+import asyncio
+import math
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+from responses import FastJSONResponse
+
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', '1') == '1'
+ADMISSION_CONCURRENCY = int(os.getenv('ADMISSION_CONCURRENCY', os.getenv('MONGO_MAX_POOL_SIZE', '100')))
+RATE_LIMIT_PER_SECOND = float(os.getenv('RATE_LIMIT_PER_SECOND', '0'))
+RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', str(RATE_LIMIT_PER_SECOND * 2)))
+RATE_LIMIT_KEY = os.getenv('RATE_LIMIT_KEY', 'ip')
+TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR', '0') == '1'
+
+# Concurrency limit and latency budget of each class, in milliseconds
+CLASS_LIMITS: Dict[str, Tuple[int, float]] = {
+    "list": (int(os.getenv('ADMISSION_LIST_CONCURRENCY', '16')), float(os.getenv('ADMISSION_LIST_BUDGET_MS', '1000'))),
+    "read": (int(os.getenv('ADMISSION_READ_CONCURRENCY', '100')), float(os.getenv('ADMISSION_READ_BUDGET_MS', '100'))),
+    "write": (int(os.getenv('ADMISSION_WRITE_CONCURRENCY', '50')), float(os.getenv('ADMISSION_WRITE_BUDGET_MS', '500'))),
+}
+
+# Long-lived or operational endpoints, which are admitted without limits
+EXEMPT_PATHS = re.compile(r"^/(metrics|docs|redoc|openapi\.json|admin/.*|posts/stream)$")
+# Reads of whole collections or many documents
+LIST_PATHS = re.compile(r"^/(posts|users|posts/search|users/[^/]+/posts)$")
+# Bulk endpoints such as POST /posts:bulk
+BULK_PATHS = re.compile(r"^/(posts|users):\w+$")
+
+# Clients whose token buckets are kept; the least recently seen are forgotten first
+MAX_TRACKED_CLIENTS = 100_000
+
+def classify(method: str, path: str) -> Optional[str]:
+    """Return the class of a request, or None if it is not limited."""
+    if EXEMPT_PATHS.match(path):
+        return None
+    if method in ("GET", "HEAD"):
+        return "list" if LIST_PATHS.match(path) else "read"
+    if BULK_PATHS.match(path):
+        return "list"
+    return "write"
+
+class ConcurrencyLimiter:
+    """
+    First come, first served slots with a prediction of the wait for one.
+
+    A released slot is handed straight to the oldest waiter. `service_time`
+    is a moving average of how long requests hold a slot.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self.waiting = 0
+        self.service_time = 0.0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def expected_wait(self) -> float:
+        """Predict how long a request arriving now would wait for a slot, in seconds."""
+        if self.active < self.limit and not self.waiting:
+            return 0.0
+        return (self.waiting // self.limit + 1) * self.service_time
+
+    async def acquire(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a slot and report whether one was taken."""
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return True
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self.waiting += 1
+        try:
+            await asyncio.wait((future,), timeout=max(0.0, timeout))
+        except BaseException:
+            # A slot handed over just as the request was cancelled goes to the next waiter
+            if future.done() and not future.cancelled():
+                self.release(None)
+            future.cancel()
+            raise
+        finally:
+            self.waiting -= 1
+        if future.done():
+            return True
+        future.cancel()
+        return False
+
+    def release(self, held: Optional[float]) -> None:
+        """Give a slot back, after holding it for `held` seconds."""
+        if held is not None:
+            self.service_time = held if not self.service_time else 0.9 * self.service_time + 0.1 * held
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+class RateLimiter:
+    """Token buckets per client, refilled at `rate` tokens per second up to `burst`."""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, client: str, now: float) -> float:
+        """
+        Take a token from a client's bucket.
+
+        Returns:
+            0 if the request may proceed, else the seconds until the bucket holds a token again.
+        """
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+def client_key(scope, key: str = RATE_LIMIT_KEY, trust_forwarded_for: bool = TRUST_FORWARDED_FOR) -> str:
+    """Identify the client of a request for rate limiting."""
+    forwarded_for = None
+    for name, value in scope["headers"]:
+        if name == b"x-api-key" and key == "api_key":
+            return "key:" + value.decode("latin-1")
+        if name == b"x-forwarded-for":
+            forwarded_for = value
+    # The proxy in front appends the address it saw, so the last entry is the one it vouches for
+    if trust_forwarded_for and forwarded_for:
+        return forwarded_for.decode("latin-1").split(",")[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def rejection(status: int, detail: str, retry_after: float) -> FastJSONResponse:
+    return FastJSONResponse(status_code=status, content={"detail": detail}, headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware admitting requests by class, worker-wide concurrency and client rate.
+
+    A request takes its class's slot before the worker-wide one, always in
+    that order, so two requests can never each hold the slot the other needs.
+    """
+
+    def __init__(
+        self,
+        app,
+        concurrency: int = ADMISSION_CONCURRENCY,
+        class_limits: Dict[str, Tuple[int, float]] = CLASS_LIMITS,
+        rate: float = RATE_LIMIT_PER_SECOND,
+        burst: float = RATE_LIMIT_BURST,
+    ):
+        self.app = app
+        self.worker = ConcurrencyLimiter(concurrency)
+        self.classes = {name: (ConcurrencyLimiter(limit), budget_ms / 1000) for name, (limit, budget_ms) in class_limits.items()}
+        self.rate_limiter = RateLimiter(rate, burst) if rate > 0 else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_class = classify(scope["method"], scope["path"])
+        if request_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.rate_limiter is not None:
+            retry_after = self.rate_limiter.take(client_key(scope), time.monotonic())
+            if retry_after:
+                ADMISSION_REJECTED.labels(request_class, "rate_limited").inc()
+                await rejection(429, "Too many requests", retry_after)(scope, receive, send)
+                return
+
+        limiter, budget = self.classes[request_class]
+        arrived = time.monotonic()
+        # Shed at once when the queues are already longer than the budget allows. The
+        # two queues mostly wait on the same requests, so the longer one predicts the wait
+        expected = max(limiter.expected_wait(), self.worker.expected_wait())
+        if expected > budget:
+            ADMISSION_REJECTED.labels(request_class, "overloaded").inc()
+            await rejection(503, "Server overloaded", expected)(scope, receive, send)
+            return
+        if not await limiter.acquire(budget):
+            ADMISSION_REJECTED.labels(request_class, "timeout").inc()
+            await rejection(503, "Server overloaded", limiter.expected_wait())(scope, receive, send)
+            return
+        if not await self.worker.acquire(budget - (time.monotonic() - arrived)):
+            limiter.release(None)
+            ADMISSION_REJECTED.labels(request_class, "timeout").inc()
+            await rejection(503, "Server overloaded", self.worker.expected_wait())(scope, receive, send)
+            return
+
+        admitted = time.monotonic()
+        ADMISSION_WAIT.labels(request_class).observe(admitted - arrived)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            held = time.monotonic() - admitted
+            self.worker.release(held)
+            limiter.release(held)
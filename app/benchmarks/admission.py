@@ -0,0 +1,114 @@
+"""
+Admission control benchmark: latency of a mixed burst with and without load shedding.
+
+Seeds a dataset, then starts the production server once with
+ADMISSION_CONTROL off and once with it on, against the same throwaway mongod
+(or --mongo-host). Many clients at once send a mix of expensive GET /posts
+pages and cheap GET /posts/{post_id} reads, more than the Mongo pool can
+serve. Rejected clients wait for the Retry-After they were given. Prints,
+per setting and class, the successful requests per second, their p50 and p99
+latency, and the requests rejected, so the latency protected by shedding can
+be weighed against the requests turned away.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    python -m benchmarks.admission --local --concurrency 500
+    python -m benchmarks.admission --local --pool-size 20 --list-share 0.3
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.concurrency import percentile
+from benchmarks.dataset import seed_database
+from benchmarks.local import free_port, start_server, stop_server, throwaway_mongod, wait_ready
+from dev_init import DATABASE_NAME
+
+async def burst(base_url: str, post_ids: List[str], args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    """Send the mixed load until the duration passes and report each class's results."""
+    rng = random.Random(args.seed)
+    latencies: Dict[str, List[float]] = {"list": [], "read": []}
+    rejected = {"list": 0, "read": 0}
+
+    async def client_loop(client: httpx.AsyncClient, deadline: float):
+        while time.perf_counter() < deadline:
+            if rng.random() < args.list_share:
+                request_class, path, params = "list", "/posts", {"limit": 100}
+            else:
+                request_class, path, params = "read", f"/posts/{rng.choice(post_ids)}", {}
+            started = time.perf_counter()
+            response = await client.get(path, params=params)
+            if response.status_code == 200:
+                latencies[request_class].append(time.perf_counter() - started)
+            else:
+                rejected[request_class] += 1
+                await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client, started + args.duration) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        request_class: {
+            "rps": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "rejected": rejected[request_class],
+        }
+        for request_class, samples in latencies.items()
+    }
+
+async def run_setting(args: argparse.Namespace, mongo_host: str, post_ids: List[str], env: Dict[str, str]) -> Dict[str, Dict[str, float]]:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(args.workers, port, {"MONGO_HOST": mongo_host, "MONGO_MAX_POOL_SIZE": str(args.pool_size), **env})
+    try:
+        await wait_ready(base_url, timeout=120)
+        return await burst(base_url, post_ids, args)
+    finally:
+        stop_server(server)
+
+async def benchmark(args: argparse.Namespace, mongo_host: str):
+    with MongoClient(mongo_host) as client:
+        post_ids = seed_database(client[DATABASE_NAME], args.users, args.posts, seed=args.seed)["posts"]
+    rows = []
+    for name, env in (("off", {"ADMISSION_CONTROL": "0"}), ("on", {"ADMISSION_CONTROL": "1"})):
+        rows.append((name, await run_setting(args, mongo_host, post_ids, env)))
+    print(f"{'admission':<10} {'class':<6} {'ok/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'rejected':>9}")
+    for name, results in rows:
+        for request_class, row in results.items():
+            print(f"{name:<10} {request_class:<6} {row['rps']:>8.1f} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['rejected']:>9}")
+
+def main(args: argparse.Namespace):
+    if args.local:
+        mongod = throwaway_mongod(args.mongod)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The target database is dropped and seeded first.")
+    with mongod as mongo_host:
+        asyncio.run(benchmark(args, mongo_host))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Database to drop and use instead of --local")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=20, help="MONGO_MAX_POOL_SIZE, which also sizes the admission limit")
+    parser.add_argument("--concurrency", type=int, default=500, help="Clients sending requests at once")
+    parser.add_argument("--list-share", type=float, default=0.2, help="Share of requests that are GET /posts pages")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds measured per setting")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
@@ -0,0 +1,112 @@
+"""
+Write coalescing benchmark: sustained POST /posts throughput with and without batching.
+
+Starts the production server once with WRITE_COALESCING off and once with it
+on, each time against a fresh throwaway mongod (or --mongo-host), and drives
+it with clients that create posts as fast as they can. Prints creates/sec and
+latency percentiles for each setting, so the throughput gained can be weighed
+against the latency WRITE_BATCH_DELAY_MS adds.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    python -m benchmarks.coalescing --local --concurrency 256
+    python -m benchmarks.coalescing --local --delays 1 5 10
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.concurrency import percentile
+from benchmarks.local import free_port, start_server, stop_server, throwaway_mongod, wait_ready
+from dev_init import DATABASE_NAME
+
+async def create_posts(base_url: str, user_id: str, concurrency: int, duration: float) -> Dict[str, float]:
+    """Create posts from many clients until the duration passes and report the throughput and latency."""
+    counter = itertools.count()
+    run_tag = time.time_ns()
+    latencies: List[float] = []
+    errors = 0
+
+    async def client_loop(client: httpx.AsyncClient, deadline: float):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            n = next(counter)
+            started = time.perf_counter()
+            response = await client.post("/posts", json={"title": f"Coalesced {run_tag} {n}", "content": "Benchmark content", "user_id": user_id})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + duration
+        await asyncio.gather(*(client_loop(client, deadline) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+async def run_setting(args: argparse.Namespace, mongo_host: str, env: Dict[str, str]) -> Dict[str, float]:
+    with MongoClient(mongo_host) as client:
+        for name in ("users", "posts", "counters"):
+            client[DATABASE_NAME].drop_collection(name)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(args.workers, port, {"MONGO_HOST": mongo_host, **env})
+    try:
+        await wait_ready(base_url, timeout=120)
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            response = await client.post("/users", json={"fullName": "Coalescing Bench", "email": f"coalescing{time.time_ns()}@example.com"})
+            user_id = response.json()["user_id"]
+        await create_posts(base_url, user_id, args.concurrency, 1.0)
+        return await create_posts(base_url, user_id, args.concurrency, args.duration)
+    finally:
+        stop_server(server)
+
+async def benchmark(args: argparse.Namespace, mongo_host: str):
+    settings = [("off", {"WRITE_COALESCING": "0"})]
+    settings += [
+        (f"{delay:g} ms", {"WRITE_COALESCING": "1", "WRITE_BATCH_DELAY_MS": str(delay), "WRITE_BATCH_SIZE": str(args.batch_size)})
+        for delay in args.delays
+    ]
+    rows = []
+    for name, env in settings:
+        rows.append((name, await run_setting(args, mongo_host, env)))
+    baseline = rows[0][1]["rps"] or 1
+    print(f"{'coalescing':<12} {'creates/s':>10} {'speedup':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, row in rows:
+        print(f"{name:<12} {row['rps']:>10.1f} {row['rps'] / baseline:>7.2f}x {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['errors']:>7}")
+
+def main(args: argparse.Namespace):
+    if args.local:
+        mongod = throwaway_mongod(args.mongod)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The target database is dropped between runs.")
+    with mongod as mongo_host:
+        asyncio.run(benchmark(args, mongo_host))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Database to drop and use instead of --local")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=256, help="Clients creating posts at once")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds measured per setting")
+    parser.add_argument("--delays", type=float, nargs="+", default=[5.0], help="WRITE_BATCH_DELAY_MS values to try")
+    parser.add_argument("--batch-size", type=int, default=256)
+    main(parser.parse_args())
@@ -0,0 +1,63 @@
+"""
+Compression micro-benchmark: CPU time against bytes saved, per encoding and level.
+
+Serializes pages of synthetic posts from benchmarks.dataset as GET /posts
+would, then compresses each with every available encoding at a range of
+levels. Reports the compressed size, the ratio, and the CPU time per
+response and throughput, so that COMPRESSION_*_LEVEL can be chosen. Runs
+in-process and does not need a database.
+
+Usage (from the app directory):
+
+    python -m benchmarks.compression
+    python -m benchmarks.compression --pages 1 20 100 1000 --repeat 20
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+
+import orjson
+
+from benchmarks.dataset import make_posts
+from compression import available_encodings, compress
+
+LEVELS: Dict[str, List[int]] = {
+    "gzip": [1, 4, 6, 9],
+    "br": [1, 4, 6, 9, 11],
+    "zstd": [1, 3, 9, 19],
+}
+
+def best_time(repeat: int, body: bytes, encoding: str, level: int) -> float:
+    """Return the fastest of several compressions of the body, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        compress(body, encoding, level)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    encodings = available_encodings(["gzip", "br", "zstd"])
+    print(f"{'posts':>6} {'KB':>8} {'encoding':<8} {'level':>5} {'KB out':>8} {'ratio':>6} {'ms':>8} {'MB/s':>8}")
+    for count in args.pages:
+        posts = list(make_posts(rng, count, [f"user{i}" for i in range(100)]))
+        body = orjson.dumps({"posts": posts, "next_cursor": "6717c0ffee0123456789abcd"})
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                size = len(compress(body, encoding, level))
+                # Slow levels on large bodies take seconds, so repeat them less
+                repeat = max(1, args.repeat // 10) if len(body) > 1_000_000 and level >= 9 else args.repeat
+                elapsed = best_time(repeat, body, encoding, level)
+                print(
+                    f"{count:>6} {len(body) / 1024:>8.1f} {encoding:<8} {level:>5} {size / 1024:>8.1f} "
+                    f"{len(body) / size:>6.1f} {elapsed * 1000:>8.2f} {len(body) / elapsed / 2**20:>8.0f}"
+                )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 20, 100, 1000], help="Posts per response")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
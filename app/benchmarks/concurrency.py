@@ -0,0 +1,120 @@
+"""
+Concurrency benchmark for the user and post routes.
+
+Drives a running instance of the API with N concurrent clients for a fixed
+duration and reports requests/sec and latency percentiles at each level.
+
+Usage (from the app directory, against a server you started yourself):
+
+    python -m benchmarks.concurrency --base-url http://localhost:8000 --output after.json
+    python -m benchmarks.concurrency --base-url http://localhost:8000 --compare before.json
+
+Run it once on the old build with ``--output before.json`` and once on the
+new build with ``--compare before.json`` to get a before/after table.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+import httpx
+
+DEFAULT_LEVELS = [1, 50, 500]
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Return the given percentile (0-100) of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+async def seed(client: httpx.AsyncClient, users: int) -> Dict[str, List[str]]:
+    """Create a handful of users and posts to read back during the run."""
+    user_ids, post_ids = [], []
+    run_tag = int(time.time() * 1000)
+    for i in range(users):
+        response = await client.post("/users", json={"fullName": "Bench User", "email": f"bench{run_tag}{i}@example.com"})
+        response.raise_for_status()
+        user_id = response.json()["user_id"]
+        user_ids.append(user_id)
+        response = await client.post(
+            "/posts",
+            json={"title": f"Bench Post {run_tag} {i}", "content": "Benchmark content " * 20, "user_id": user_id},
+        )
+        response.raise_for_status()
+        post_ids.append(response.json()["post_id"])
+    return {"users": user_ids, "posts": post_ids}
+
+async def worker(client: httpx.AsyncClient, ids: Dict[str, List[str]], deadline: float, latencies: List[float], errors: List[int]):
+    """Issue point reads back to back until the deadline passes."""
+    while time.perf_counter() < deadline:
+        if random.random() < 0.5:
+            path = f"/users/{random.choice(ids['users'])}"
+        else:
+            path = f"/posts/{random.choice(ids['posts'])}"
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError:
+            errors.append(0)
+        latencies.append(time.perf_counter() - start)
+
+async def run_level(base_url: str, ids: Dict[str, List[str]], concurrency: int, duration: float) -> Dict[str, float]:
+    """Run a single concurrency level and summarise it."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: List[float] = []
+    errors: List[int] = []
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, ids, deadline, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def print_table(results: List[Dict[str, float]], baseline: List[Dict[str, float]] = None):
+    """Print results, with deltas against a baseline run if one is given."""
+    previous = {row["concurrency"]: row for row in baseline or []}
+    print(f"{'clients':>8} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for row in results:
+        line = f"{row['concurrency']:>8} {row['rps']:>10.1f} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['errors']:>7}"
+        before = previous.get(row["concurrency"])
+        if before:
+            line += f"   (before: {before['rps']:.1f} req/s, p99 {before['p99_ms']:.2f} ms)"
+        print(line)
+
+async def main(args: argparse.Namespace):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=30) as client:
+        ids = await seed(client, args.seed)
+    results = []
+    for level in args.concurrency:
+        results.append(await run_level(args.base_url, ids, level, args.duration))
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_LEVELS)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--seed", type=int, default=20, help="Number of users/posts to create before the run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    asyncio.run(main(parser.parse_args()))
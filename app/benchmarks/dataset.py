@@ -0,0 +1,142 @@
+"""
+Deterministic dataset seeder for benchmarks.
+
+Writes N users and M posts straight into Mongo, shaped exactly like documents
+created through the API. Post content lengths follow a log-normal
+distribution around a median of about 1.2 KB, with a long tail up to 20 KB,
+which is closer to real posts than fixed-size filler. The same --seed always
+produces the same documents.
+
+Usage (from the app directory):
+
+    python -m benchmarks.dataset --mongo-host mongodb://127.0.0.1:27017 --users 10000 --posts 100000
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, Iterator, List
+
+from pymongo import MongoClient
+from pymongo.database import Database
+
+from dev_init import DATABASE_NAME
+from ids import encode
+
+# Fields holding IDs, in users and posts
+ID_FIELDS = ("user_id", "post_id")
+
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Linus", "Barbara", "Ken", "Margaret", "Dennis", "Frances", "Edsger", "Radia", "Donald"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Torvalds", "Liskov", "Thompson", "Hamilton", "Ritchie", "Allen", "Dijkstra", "Perlman", "Knuth"]
+WORDS = (
+    "the of and to in is that for it as with was on be by this are from at or an have not which but "
+    "database query index latency throughput cache request response server client worker pool cursor "
+    "document collection replica shard write read batch stream page token schema field value update "
+    "delete insert create performance benchmark measure percentile median tail load traffic deploy"
+).split()
+
+CONTENT_MEDIAN = 1200
+CONTENT_SIGMA = 0.8
+CONTENT_MIN = 50
+CONTENT_MAX = 20_000
+
+def _corpus(rng: random.Random, size: int = 1 << 16) -> str:
+    """Build a block of word-like text that post contents are sliced from."""
+    words: List[str] = []
+    length = 0
+    while length < size + CONTENT_MAX:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+def make_users(rng: random.Random, count: int) -> Iterator[Dict[str, Any]]:
+    """Yield user documents with unique emails."""
+    for i in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield {
+            "fullName": f"{first} {last}",
+            "email": f"{first.lower()}.{last.lower()}.{i}@example.com",
+            "user_id": _uuid(rng),
+            "version": 1,
+        }
+
+def make_posts(rng: random.Random, count: int, user_ids: List[str]) -> Iterator[Dict[str, Any]]:
+    """Yield post documents with unique titles, spread unevenly over the given users."""
+    corpus = _corpus(rng)
+    for i in range(count):
+        size = int(min(CONTENT_MAX, max(CONTENT_MIN, rng.lognormvariate(0, CONTENT_SIGMA) * CONTENT_MEDIAN)))
+        offset = rng.randrange(len(corpus) - size)
+        title_words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))
+        yield {
+            "title": f"{title_words.capitalize()} #{i}",
+            "content": corpus[offset:offset + size],
+            # Skewed authors: the first tenth of the users write about a third of the posts
+            "user_id": user_ids[int(len(user_ids) * rng.random() ** 2)] if user_ids else _uuid(rng),
+            "post_id": _uuid(rng),
+            "version": 1,
+        }
+
+def _insert_batches(collection, docs: Iterator[Dict[str, Any]], batch_size: int) -> List[str]:
+    """Insert documents in batches, with IDs in the stored form of ID_STRATEGY, and return their public IDs."""
+    id_field = "user_id" if collection.name == "users" else "post_id"
+    ids: List[str] = []
+    batch: List[Dict[str, Any]] = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            collection.insert_many([encode(d, ID_FIELDS) for d in batch], ordered=False)
+            ids.extend(d[id_field] for d in batch)
+            batch = []
+    if batch:
+        collection.insert_many([encode(d, ID_FIELDS) for d in batch], ordered=False)
+        ids.extend(d[id_field] for d in batch)
+    return ids
+
+def seed_database(db: Database, users: int, posts: int, seed: int = 42, batch_size: int = 5000, drop: bool = True) -> Dict[str, List[str]]:
+    """
+    Fill the users and posts collections with a deterministic dataset.
+
+    Args:
+        db (Database): The database to seed.
+        users (int): Number of users to create.
+        posts (int): Number of posts to create.
+        seed (int): Random seed; the same seed always produces the same documents.
+        batch_size (int): Documents per insert_many.
+        drop (bool): Whether to drop users, posts and counters first.
+
+    Returns:
+        Dict[str, List[str]]: The created user and post IDs.
+    """
+    rng = random.Random(seed)
+    if drop:
+        for name in ("users", "posts", "counters"):
+            db.drop_collection(name)
+    user_ids = _insert_batches(db["users"], make_users(rng, users), batch_size)
+    # Shuffle so that the prolific authors are not simply the first users created
+    authors = list(user_ids)
+    rng.shuffle(authors)
+    post_ids = _insert_batches(db["posts"], make_posts(rng, posts, authors), batch_size)
+    # The documents were inserted behind the stats counters' back, so the next server start recounts them
+    db.drop_collection("stats")
+    return {"users": user_ids, "posts": post_ids}
+
+def main(args: argparse.Namespace):
+    with MongoClient(args.mongo_host) as client:
+        started = time.perf_counter()
+        ids = seed_database(client[DATABASE_NAME], args.users, args.posts, args.seed, drop=not args.keep)
+        elapsed = time.perf_counter() - started
+    print(f"seeded {len(ids['users'])} users and {len(ids['posts'])} posts in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'))
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--posts", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Add to the existing collections instead of dropping them")
+    main(parser.parse_args())
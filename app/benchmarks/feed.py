@@ -0,0 +1,145 @@
+"""
+Post feed benchmark: GET /posts/stream subscribers against clients polling GET /posts.
+
+Starts the production server against a throwaway single node replica set (or
+--mongo-host, which must be a replica set), creates posts at a steady rate,
+and watches for them in two ways: dashboards subscribed to the SSE feed, and
+the same number of dashboards polling GET /posts?stream=true, each poll
+reading every post. For each it reports how long a new post took to reach
+the dashboards, and the reads per second Mongo served meanwhile, from
+serverStatus opcounters.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    python -m benchmarks.feed --local --subscribers 100 --rate 20
+    python -m benchmarks.feed --local --subscribers 1000 --poll-interval 2
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+import httpx
+import orjson
+from pymongo import MongoClient
+
+from benchmarks.concurrency import percentile
+from benchmarks.local import free_port, start_server, stop_server, throwaway_mongod, wait_ready
+from dev_init import DATABASE_NAME
+
+def mongo_reads(mongo_host: str) -> int:
+    """Return the number of queries and getMores the server has run so far."""
+    with MongoClient(mongo_host) as client:
+        counters = client.admin.command("serverStatus")["opcounters"]
+    return counters["query"] + counters["getmore"]
+
+async def create_posts(client: httpx.AsyncClient, user_id: str, rate: float, duration: float, created: Dict[str, float]):
+    """Create posts at a steady rate, recording when each create was sent, by title."""
+    interval = 1 / rate
+    deadline = time.perf_counter() + duration
+    n = 0
+    while time.perf_counter() < deadline:
+        title = f"Feed {time.time_ns()} {n}"
+        # Recorded before sending, since the event can arrive before the response
+        created[title] = time.perf_counter()
+        await client.post("/posts", json={"title": title, "content": "Benchmark content", "user_id": user_id})
+        n += 1
+        await asyncio.sleep(interval)
+
+async def subscriber(client: httpx.AsyncClient, created: Dict[str, float], delays: List[float], ready: asyncio.Event):
+    async with client.stream("GET", "/posts/stream") as response:
+        ready.set()
+        async for line in response.aiter_lines():
+            if line.startswith("data: "):
+                post = orjson.loads(line[6:]).get("post") or {}
+                if post.get("title") in created:
+                    delays.append(time.perf_counter() - created[post["title"]])
+
+async def poller(client: httpx.AsyncClient, created: Dict[str, float], delays: List[float], interval: float):
+    seen = set()
+    etag = None
+    while True:
+        # A dashboard without the feed rereads every post to spot the new ones
+        response = await client.get("/posts", params={"stream": "true"}, headers={"If-None-Match": etag} if etag else {})
+        now = time.perf_counter()
+        if response.status_code == 200:
+            etag = response.headers.get("etag")
+            for line in response.text.splitlines():
+                post = orjson.loads(line)
+                if post["title"] in created and post["title"] not in seen:
+                    seen.add(post["title"])
+                    delays.append(now - created[post["title"]])
+        await asyncio.sleep(interval)
+
+async def run_mode(args: argparse.Namespace, base_url: str, mongo_host: str, user_id: str, mode: str) -> Dict[str, float]:
+    created: Dict[str, float] = {}
+    delays: List[float] = []
+    limits = httpx.Limits(max_connections=args.subscribers + 10)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=None) as client:
+        if mode == "stream":
+            readies = [asyncio.Event() for _ in range(args.subscribers)]
+            tasks = [asyncio.create_task(subscriber(client, created, delays, ready)) for ready in readies]
+            await asyncio.gather(*(ready.wait() for ready in readies))
+        else:
+            tasks = [asyncio.create_task(poller(client, created, delays, args.poll_interval)) for _ in range(args.subscribers)]
+        reads_before = mongo_reads(mongo_host)
+        started = time.perf_counter()
+        await create_posts(client, user_id, args.rate, args.duration, created)
+        # Give the last posts time to arrive
+        await asyncio.sleep(max(1.0, args.poll_interval))
+        elapsed = time.perf_counter() - started
+        reads = mongo_reads(mongo_host) - reads_before
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    expected = len(created) * args.subscribers
+    return {
+        "delivered": len(delays) / expected if expected else 0.0,
+        "p50_ms": percentile(delays, 50) * 1000,
+        "p99_ms": percentile(delays, 99) * 1000,
+        "reads_per_s": reads / elapsed,
+    }
+
+async def benchmark(args: argparse.Namespace, mongo_host: str):
+    with MongoClient(mongo_host) as client:
+        for name in ("users", "posts", "counters"):
+            client[DATABASE_NAME].drop_collection(name)
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = start_server(args.workers, port, {"MONGO_HOST": mongo_host})
+    try:
+        await wait_ready(base_url, timeout=120)
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            response = await client.post("/users", json={"fullName": "Feed Bench", "email": f"feed{time.time_ns()}@example.com"})
+            user_id = response.json()["user_id"]
+        rows = [(mode, await run_mode(args, base_url, mongo_host, user_id, mode)) for mode in ("stream", "poll")]
+    finally:
+        stop_server(server)
+    print(f"{'mode':<8} {'delivered':>9} {'p50 ms':>9} {'p99 ms':>9} {'reads/s':>9}")
+    for mode, row in rows:
+        print(f"{mode:<8} {row['delivered']:>8.1%} {row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['reads_per_s']:>9.1f}")
+
+def main(args: argparse.Namespace):
+    if args.local:
+        mongod = throwaway_mongod(args.mongod, replica_set=True)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The target database is dropped first.")
+    with mongod as mongo_host:
+        asyncio.run(benchmark(args, mongo_host))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway single node replica set")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Replica set to drop and use instead of --local")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--subscribers", type=int, default=100, help="Dashboards watching for new posts")
+    parser.add_argument("--rate", type=float, default=20.0, help="Posts created per second")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds of post creation per mode")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between polls of GET /posts")
+    main(parser.parse_args())
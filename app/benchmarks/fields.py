@@ -0,0 +1,50 @@
+"""
+Sparse fieldset benchmark: GET /posts with and without fields=.
+
+List views that only show titles used to download every post's content. This
+times a page of posts with every field, with post_id and title only, and with
+post_id alone, and reports the response size of each. Against a running server
+seeded with benchmarks.dataset:
+
+    python -m benchmarks.dataset --users 10000 --posts 100000
+    python -m benchmarks.fields --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+
+SELECTIONS = (("all fields", None), ("post_id,title", "post_id,title"), ("post_id", "post_id"))
+
+async def time_page(client: httpx.AsyncClient, limit: int, fields: Optional[str], repeat: int):
+    """Return the median time to fetch a page and the size of its body."""
+    params = {"limit": limit, **({"fields": fields} if fields else {})}
+    timings, size = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get("/posts", params=params)
+        timings.append(time.perf_counter() - started)
+        response.raise_for_status()
+        size = len(response.content)
+    timings.sort()
+    return timings[len(timings) // 2], size
+
+async def main(args: argparse.Namespace):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        # Warm the connection and Mongo's cache so the first selection is not penalized
+        await time_page(client, args.limit, None, 3)
+        print(f"{'fields':<16} {'ms':>8} {'KB':>10} {'of full':>8}")
+        full_size = None
+        for name, fields in SELECTIONS:
+            elapsed, size = await time_page(client, args.limit, fields, args.repeat)
+            full_size = full_size or size
+            print(f"{name:<16} {elapsed * 1000:>8.2f} {size / 1024:>10.1f} {size / full_size:>8.0%}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
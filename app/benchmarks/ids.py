@@ -0,0 +1,80 @@
+"""
+ID benchmark: insert throughput and unique index size per ID form.
+
+Inserts the same number of documents, each with a fresh ID, into a collection
+with a unique index on the ID, once per form: uuid1 strings (the old IDs),
+UUIDv7 strings and UUIDv7 binary (the default). Prints the inserts per second
+and the size of the unique index, from collStats, for each form.
+
+Insert throughput only diverges once the index outgrows the WiredTiger cache,
+so for a meaningful comparison on a large machine, pass a small
+--cache-gb with --local and enough --docs to overflow it.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    python -m benchmarks.ids --local --docs 1000000
+    python -m benchmarks.ids --local --docs 5000000 --cache-gb 0.25
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Any, Callable, Dict
+
+from bson.binary import Binary, UuidRepresentation
+from pymongo import ASCENDING, MongoClient
+
+from benchmarks.local import throwaway_mongod
+from ids import uuid7
+
+# ID forms to compare, each a function returning a new stored ID
+FORMS: Dict[str, Callable[[], Any]] = {
+    "uuid1 string": lambda: str(uuid.uuid1()),
+    "uuid7 string": lambda: str(uuid7()),
+    "uuid7 binary": lambda: Binary.from_uuid(uuid7(), UuidRepresentation.STANDARD),
+}
+
+def run_form(client: MongoClient, name: str, new_id: Callable[[], Any], args: argparse.Namespace) -> Dict[str, float]:
+    """Insert --docs documents with IDs of one form and measure the rate and the index size."""
+    collection = client["bench_ids"][name.replace(" ", "_")]
+    collection.drop()
+    collection.create_index([("id", ASCENDING)], name="id_unique", unique=True)
+    padding = "x" * args.doc_bytes
+    started = time.perf_counter()
+    for start in range(0, args.docs, args.batch_size):
+        count = min(args.batch_size, args.docs - start)
+        collection.insert_many([{"id": new_id(), "padding": padding} for _ in range(count)], ordered=False)
+    elapsed = time.perf_counter() - started
+    stats = client["bench_ids"].command("collStats", collection.name)
+    return {
+        "rate": args.docs / elapsed,
+        "index_mb": stats["indexSizes"]["id_unique"] / 2**20,
+        "bytes_per_doc": stats["indexSizes"]["id_unique"] / args.docs,
+    }
+
+def main(args: argparse.Namespace):
+    if args.local:
+        mongod = throwaway_mongod(args.mongod, extra_args=["--wiredTigerCacheSizeGB", str(args.cache_gb)] if args.cache_gb else None)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The bench_ids database is dropped first.")
+    with mongod as mongo_host, MongoClient(mongo_host) as client:
+        rows = [(name, run_form(client, name, new_id, args)) for name, new_id in FORMS.items()]
+        client.drop_database("bench_ids")
+    print(f"{'form':<14} {'inserts/s':>11} {'index MB':>9} {'bytes/doc':>10}")
+    for name, row in rows:
+        print(f"{name:<14} {row['rate']:>11.0f} {row['index_mb']:>9.1f} {row['bytes_per_doc']:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--cache-gb", type=float, default=0, help="WiredTiger cache size of the --local mongod")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Database to use instead of --local")
+    parser.add_argument("--docs", type=int, default=1_000_000, help="Documents inserted per form")
+    parser.add_argument("--batch-size", type=int, default=100, help="Documents per insert_many")
+    parser.add_argument("--doc-bytes", type=int, default=200, help="Padding per document")
+    main(parser.parse_args())
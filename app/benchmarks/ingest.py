@@ -0,0 +1,65 @@
+"""
+Ingest benchmark: one request per item versus the bulk endpoints.
+
+Imports N users and N posts through POST /users and POST /posts, then the
+same volume through POST /users:bulk and POST /posts:bulk, against a running
+instance of the API, and prints items/sec for both.
+
+Usage (from the app directory, against a server you started yourself):
+
+    python -m benchmarks.ingest --base-url http://localhost:8000 --items 5000
+"""
+import argparse
+import asyncio
+import time
+from typing import List
+
+import httpx
+
+async def ingest_single(client: httpx.AsyncClient, run_tag: str, items: int, concurrency: int) -> float:
+    """Create users and posts one request at a time and return the elapsed seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(i: int):
+        async with semaphore:
+            user = await client.post("/users", json={"fullName": "Ingest User", "email": f"single{run_tag}x{i}@example.com"})
+            await client.post("/posts", json={"title": f"Single {run_tag} {i}", "content": "Ingested " * 50, "user_id": user.json()["user_id"]})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(create(i) for i in range(items)))
+    return time.perf_counter() - started
+
+async def ingest_bulk(client: httpx.AsyncClient, run_tag: str, items: int, batch_size: int) -> float:
+    """Create users and posts through the bulk endpoints and return the elapsed seconds."""
+    started = time.perf_counter()
+    for offset in range(0, items, batch_size):
+        batch = range(offset, min(offset + batch_size, items))
+        response = await client.post("/users:bulk", json=[
+            {"fullName": "Ingest User", "email": f"bulk{run_tag}x{i}@example.com"} for i in batch
+        ])
+        user_ids: List[str] = [result["id"] for result in response.json()["results"]]
+        await client.post("/posts:bulk", json=[
+            {"title": f"Bulk {run_tag} {i}", "content": "Ingested " * 50, "user_id": user_id}
+            for i, user_id in zip(batch, user_ids)
+        ])
+    return time.perf_counter() - started
+
+async def main(args: argparse.Namespace):
+    run_tag = str(int(time.time() * 1000))
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=120) as client:
+        single = await ingest_single(client, run_tag, args.items, args.concurrency)
+        bulk = await ingest_bulk(client, run_tag, args.items, args.batch_size)
+    total = args.items * 2
+    print(f"{'mode':<10} {'seconds':>9} {'items/s':>10}")
+    print(f"{'single':<10} {single:>9.2f} {total / single:>10.1f}")
+    print(f"{'bulk':<10} {bulk:>9.2f} {total / bulk:>10.1f}")
+    print(f"speedup: {single / bulk:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--items", type=int, default=5000, help="Users (and posts) to import per mode")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Parallel requests in single mode")
+    asyncio.run(main(parser.parse_args()))
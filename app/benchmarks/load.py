@@ -0,0 +1,359 @@
+"""
+Scripted load generator for every user and post route.
+
+Runs closed-loop clients against a running instance of the API for a fixed
+duration. Each client picks a read with probability --read-ratio and a write
+otherwise, then an endpoint by weight within that class. Writes only update
+and delete entities that the load itself created, so reads of the seeded
+dataset keep succeeding. Reports requests/sec and p50/p95/p99 per endpoint,
+and can compare them against a stored baseline.
+
+Usage (from the app directory, against a server you started yourself):
+
+    python -m benchmarks.load --base-url http://localhost:8000 --read-ratio 0.9 --output run.json
+    python -m benchmarks.load --base-url http://localhost:8000 --baseline benchmarks/baseline.json
+
+`python -m benchmarks.run` wraps this with a throwaway mongod, the seeder and
+a regression gate.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.concurrency import percentile
+
+BULK_SIZE = 20
+
+# Relative weights within reads and within writes
+READ_WEIGHTS = {
+    "GET /users": 1,
+    "GET /users/{user_id}": 4,
+    "GET /posts": 2,
+    "GET /posts/{post_id}": 4,
+}
+WRITE_WEIGHTS = {
+    "POST /users": 3,
+    "PUT /users/{user_id}": 2,
+    "DELETE /users/{user_id}": 1,
+    "POST /posts": 4,
+    "PUT /posts/{post_id}": 3,
+    "DELETE /posts/{post_id}": 1,
+    "POST /users:bulk": 0.2,
+    "PUT /users:bulk": 0.2,
+    "POST /users:bulkDelete": 0.2,
+    "POST /posts:bulk": 0.2,
+    "PUT /posts:bulk": 0.2,
+    "POST /posts:bulkDelete": 0.2,
+}
+
+class LoadState:
+    """IDs the load can read, and entities it created and may modify."""
+
+    def __init__(self, user_ids: List[str], post_ids: List[str], run_tag: str):
+        self.read_users = user_ids
+        self.read_posts = post_ids
+        self.run_tag = run_tag
+        self.counter = itertools.count()
+        self.users: Dict[str, Dict[str, str]] = {}
+        self.posts: Dict[str, Dict[str, str]] = {}
+
+    def new_user(self) -> Dict[str, str]:
+        n = next(self.counter)
+        return {"fullName": "Load User", "email": f"load{self.run_tag}x{n}@example.com"}
+
+    def new_post(self, user_id: str) -> Dict[str, str]:
+        n = next(self.counter)
+        return {"title": f"Load {self.run_tag} {n}", "content": "Generated under load. " * 50, "user_id": user_id}
+
+    def author(self, rng: random.Random) -> str:
+        # Seeded users are never deleted, so posts written under load stay valid
+        return rng.choice(self.read_users)
+
+    def take(self, entities: Dict[str, Any], rng: random.Random) -> Optional[Tuple[str, Any]]:
+        """Remove and return a random created entity, so no other client modifies it concurrently."""
+        if not entities:
+            return None
+        key = rng.choice(list(entities))
+        return key, entities.pop(key)
+
+Operation = Callable[[httpx.AsyncClient, LoadState, random.Random], Awaitable[Optional[httpx.Response]]]
+
+async def list_users(client, state, rng):
+    return await client.get("/users", params={"limit": 100})
+
+async def get_user(client, state, rng):
+    return await client.get(f"/users/{rng.choice(state.read_users)}")
+
+async def list_posts(client, state, rng):
+    return await client.get("/posts", params={"limit": 100})
+
+async def get_post(client, state, rng):
+    return await client.get(f"/posts/{rng.choice(state.read_posts)}")
+
+async def create_user(client, state, rng):
+    user = state.new_user()
+    response = await client.post("/users", json=user)
+    if response.status_code == 200:
+        state.users[response.json()["user_id"]] = user
+    return response
+
+async def update_user(client, state, rng):
+    taken = state.take(state.users, rng)
+    if taken is None:
+        return None
+    user_id, user = taken
+    user = {**user, "fullName": rng.choice(["Load User", "Busy User", "Renamed User"])}
+    response = await client.put(f"/users/{user_id}", json=user)
+    state.users[user_id] = user
+    return response
+
+async def delete_user(client, state, rng):
+    taken = state.take(state.users, rng)
+    if taken is None:
+        return None
+    return await client.delete(f"/users/{taken[0]}")
+
+async def create_post(client, state, rng):
+    post = state.new_post(state.author(rng))
+    response = await client.post("/posts", json=post)
+    if response.status_code == 200:
+        state.posts[response.json()["post_id"]] = post
+    return response
+
+async def update_post(client, state, rng):
+    taken = state.take(state.posts, rng)
+    if taken is None:
+        return None
+    post_id, post = taken
+    post = {**post, "content": "Updated under load. " * rng.randint(10, 100)}
+    response = await client.put(f"/posts/{post_id}", json=post)
+    state.posts[post_id] = post
+    return response
+
+async def delete_post(client, state, rng):
+    taken = state.take(state.posts, rng)
+    if taken is None:
+        return None
+    return await client.delete(f"/posts/{taken[0]}")
+
+async def bulk_create_users(client, state, rng):
+    users = [state.new_user() for _ in range(BULK_SIZE)]
+    response = await client.post("/users:bulk", json=users)
+    if response.status_code == 200:
+        for user, result in zip(users, response.json()["results"]):
+            if result["status"] == 201:
+                state.users[result["id"]] = user
+    return response
+
+async def bulk_update_users(client, state, rng):
+    taken = [t for t in (state.take(state.users, rng) for _ in range(BULK_SIZE)) if t]
+    if not taken:
+        return None
+    response = await client.put("/users:bulk", json=[{**user, "user_id": user_id} for user_id, user in taken])
+    state.users.update(taken)
+    return response
+
+async def bulk_delete_users(client, state, rng):
+    taken = [t for t in (state.take(state.users, rng) for _ in range(BULK_SIZE)) if t]
+    if not taken:
+        return None
+    return await client.post("/users:bulkDelete", json={"ids": [user_id for user_id, _ in taken]})
+
+async def bulk_create_posts(client, state, rng):
+    posts = [state.new_post(state.author(rng)) for _ in range(BULK_SIZE)]
+    response = await client.post("/posts:bulk", json=posts)
+    if response.status_code == 200:
+        for post, result in zip(posts, response.json()["results"]):
+            if result["status"] == 201:
+                state.posts[result["id"]] = post
+    return response
+
+async def bulk_update_posts(client, state, rng):
+    taken = [t for t in (state.take(state.posts, rng) for _ in range(BULK_SIZE)) if t]
+    if not taken:
+        return None
+    response = await client.put("/posts:bulk", json=[{**post, "post_id": post_id} for post_id, post in taken])
+    state.posts.update(taken)
+    return response
+
+async def bulk_delete_posts(client, state, rng):
+    taken = [t for t in (state.take(state.posts, rng) for _ in range(BULK_SIZE)) if t]
+    if not taken:
+        return None
+    return await client.post("/posts:bulkDelete", json={"ids": [post_id for post_id, _ in taken]})
+
+OPERATIONS: Dict[str, Operation] = {
+    "GET /users": list_users,
+    "GET /users/{user_id}": get_user,
+    "GET /posts": list_posts,
+    "GET /posts/{post_id}": get_post,
+    "POST /users": create_user,
+    "PUT /users/{user_id}": update_user,
+    "DELETE /users/{user_id}": delete_user,
+    "POST /posts": create_post,
+    "PUT /posts/{post_id}": update_post,
+    "DELETE /posts/{post_id}": delete_post,
+    "POST /users:bulk": bulk_create_users,
+    "PUT /users:bulk": bulk_update_users,
+    "POST /users:bulkDelete": bulk_delete_users,
+    "POST /posts:bulk": bulk_create_posts,
+    "PUT /posts:bulk": bulk_update_posts,
+    "POST /posts:bulkDelete": bulk_delete_posts,
+}
+
+async def discover_ids(client: httpx.AsyncClient, limit: int = 1000) -> Tuple[List[str], List[str]]:
+    """Read the first user and post IDs through the API, to use as read targets."""
+    users = (await client.get("/users", params={"limit": limit})).json()["users"]
+    posts = (await client.get("/posts", params={"limit": limit})).json()["posts"]
+    if not users or not posts:
+        raise RuntimeError("The database has no users or posts; seed it first with benchmarks.dataset")
+    return [user["user_id"] for user in users], [post["post_id"] for post in posts]
+
+async def worker(client: httpx.AsyncClient, state: LoadState, rng: random.Random, read_ratio: float, deadline: float,
+                 latencies: Dict[str, List[float]], errors: Dict[str, int]):
+    """Issue operations back to back until the deadline passes."""
+    reads, read_weights = list(READ_WEIGHTS), list(READ_WEIGHTS.values())
+    writes, write_weights = list(WRITE_WEIGHTS), list(WRITE_WEIGHTS.values())
+    while time.perf_counter() < deadline:
+        if rng.random() < read_ratio:
+            name = rng.choices(reads, read_weights)[0]
+        else:
+            name = rng.choices(writes, write_weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await OPERATIONS[name](client, state, rng)
+        except httpx.HTTPError:
+            errors[name] += 1
+            continue
+        if response is None:
+            continue
+        latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors[name] += 1
+
+async def run_load(base_url: str, concurrency: int, duration: float, read_ratio: float, seed: int = 42) -> Dict[str, Any]:
+    """
+    Drive the API with the configured mix and summarise every endpoint.
+
+    Returns:
+        Dict[str, Any]: The run configuration and, per endpoint, requests,
+            errors, requests/sec and latency percentiles in milliseconds.
+    """
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        user_ids, post_ids = await discover_ids(client)
+        state = LoadState(user_ids, post_ids, str(int(time.time() * 1000)))
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            worker(client, state, random.Random(seed + i), read_ratio, deadline, latencies, errors)
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - started
+    endpoints = {}
+    for name in OPERATIONS:
+        samples = latencies.get(name, [])
+        endpoints[name] = {
+            "requests": len(samples),
+            "errors": errors.get(name, 0),
+            "rps": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p95_ms": percentile(samples, 95) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+    return {
+        "config": {"concurrency": concurrency, "duration": duration, "read_ratio": read_ratio, "seed": seed},
+        "endpoints": endpoints,
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float, gated: List[str]) -> List[str]:
+    """
+    Return a message for every gated endpoint that regressed by more than the threshold.
+
+    An endpoint regresses if its p95 latency grew, or its throughput fell, by
+    more than `threshold` (a fraction) relative to the baseline. Endpoints
+    missing from the baseline are not gated.
+    """
+    regressions = []
+    for name in gated:
+        now, before = results["endpoints"].get(name), baseline["endpoints"].get(name)
+        if not now or not before or not before["requests"]:
+            continue
+        if now["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {now['p95_ms']:.2f} ms")
+        if now["rps"] < before["rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['rps']:.1f} -> {now['rps']:.1f} req/s")
+    return regressions
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    """Print one row per endpoint that saw traffic, with the baseline p95 if there is one."""
+    previous = baseline["endpoints"] if baseline else {}
+    print(f"{'endpoint':<26} {'reqs':>7} {'err':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in results["endpoints"].items():
+        if not row["requests"] and not row["errors"]:
+            continue
+        line = (f"{name:<26} {row['requests']:>7} {row['errors']:>5} {row['rps']:>8.1f} "
+                f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+        before = previous.get(name)
+        if before and before["requests"]:
+            line += f"   (baseline p95 {before['p95_ms']:.2f} ms, {before['rps']:.1f} req/s)"
+        print(line)
+
+def load_baseline(path: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Read a stored baseline, or return None if there is none."""
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def gate(results: Dict[str, Any], baseline: Optional[Dict[str, Any]], threshold: float, gated: List[str]) -> int:
+    """Print regressions against the baseline and return the process exit code."""
+    if baseline is None:
+        print("no baseline to compare against")
+        return 0
+    regressions = compare(results, baseline, threshold, gated)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+def add_load_arguments(parser: argparse.ArgumentParser):
+    """Arguments shared by this script and benchmarks.run."""
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of measured load")
+    parser.add_argument("--read-ratio", type=float, default=0.9, help="Fraction of operations that are reads")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed of the operation mix")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="Stored results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed regression as a fraction (0.15 = 15%%)")
+    parser.add_argument("--gate", nargs="+", default=["GET /posts"], help="Endpoints that fail the run when they regress")
+
+def write_results(results: Dict[str, Any], path: Optional[str]):
+    if path:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+async def main(args: argparse.Namespace) -> int:
+    results = await run_load(args.base_url, args.concurrency, args.duration, args.read_ratio, args.seed)
+    baseline = load_baseline(args.baseline)
+    print_report(results, baseline)
+    write_results(results, args.output)
+    return gate(results, baseline, args.threshold, args.gate)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    add_load_arguments(parser)
+    sys.exit(asyncio.run(main(parser.parse_args())))
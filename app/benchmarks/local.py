@@ -0,0 +1,181 @@
+"""
+Local processes for benchmarks: throwaway mongods and the API server.
+
+`throwaway_mongod` starts a mongod on a free port with a temporary data
+directory and deletes it afterwards, so benchmark runs never touch a real
+database and always start from the same empty state.
+`throwaway_replica_set` does the same for a replica set with secondaries.
+`start_server` runs the API under gunicorn with the production config.
+"""
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+def free_port() -> int:
+    """Return a TCP port that is free on localhost right now."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_for_ping(process: subprocess.Popen, url: str, deadline: float) -> None:
+    """Wait until a starting mongod answers a ping."""
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"mongod exited with code {process.returncode}")
+        try:
+            with MongoClient(url, serverSelectionTimeoutMS=500) as client:
+                client.admin.command("ping")
+            return
+        except PyMongoError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"mongod at {url} did not start in time")
+
+@contextmanager
+def throwaway_mongod(binary: str = "mongod", timeout: float = 30.0, replica_set: bool = False, extra_args: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Run a mongod with a temporary data directory for the duration of the block.
+
+    Args:
+        binary (str): Path of the mongod executable.
+        timeout (float): Seconds to wait for it to accept connections.
+        replica_set (bool): Run it as a single node replica set, which change streams need.
+        extra_args (Optional[List[str]]): More mongod options, such as the cache size.
+
+    Yields:
+        str: The connection URL of the mongod.
+
+    Raises:
+        RuntimeError: If mongod exits or does not answer a ping in time.
+    """
+    dbpath = tempfile.mkdtemp(prefix="bench-mongod-")
+    port = free_port()
+    url = f"mongodb://127.0.0.1:{port}"
+    command = [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"]
+    if replica_set:
+        command += ["--replSet", "rs0"]
+        url += "/?directConnection=true"
+    command += extra_args or []
+    process = subprocess.Popen(
+        command,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + timeout
+        _wait_for_ping(process, url, deadline)
+        if replica_set:
+            with MongoClient(url) as client:
+                client.admin.command("replSetInitiate", {"_id": "rs0", "members": [{"_id": 0, "host": f"127.0.0.1:{port}"}]})
+                while not client.admin.command("hello").get("isWritablePrimary"):
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"mongod did not become primary within {timeout}s")
+                    time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(dbpath, ignore_errors=True)
+
+@contextmanager
+def throwaway_replica_set(binary: str = "mongod", members: int = 3, timeout: float = 60.0) -> Iterator[str]:
+    """
+    Run a replica set of mongods with temporary data directories for the duration of the block.
+
+    The first member is given a higher priority, so that it is elected
+    primary and the others are secondaries, which secondary reads need.
+
+    Args:
+        binary (str): Path of the mongod executable.
+        members (int): Number of mongods in the set.
+        timeout (float): Seconds to wait for the set to have a primary and all its secondaries.
+
+    Yields:
+        str: The connection URL of the replica set.
+
+    Raises:
+        RuntimeError: If a mongod exits or the set does not come up in time.
+    """
+    ports = [free_port() for _ in range(members)]
+    dbpaths = [tempfile.mkdtemp(prefix="bench-mongod-") for _ in ports]
+    processes = [
+        subprocess.Popen(
+            [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet", "--replSet", "rs0"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        for port, dbpath in zip(ports, dbpaths)
+    ]
+    url = "mongodb://" + ",".join(f"127.0.0.1:{port}" for port in ports) + "/?replicaSet=rs0"
+    try:
+        deadline = time.monotonic() + timeout
+        for process, port in zip(processes, ports):
+            _wait_for_ping(process, f"mongodb://127.0.0.1:{port}/?directConnection=true", deadline)
+        config = {
+            "_id": "rs0",
+            "members": [{"_id": i, "host": f"127.0.0.1:{port}", "priority": 2 if i == 0 else 1} for i, port in enumerate(ports)],
+        }
+        with MongoClient(f"mongodb://127.0.0.1:{ports[0]}/?directConnection=true") as client:
+            client.admin.command("replSetInitiate", config)
+            while True:
+                states = [member["stateStr"] for member in client.admin.command("replSetGetStatus").get("members", [])]
+                if states.count("PRIMARY") == 1 and states.count("SECONDARY") == members - 1:
+                    break
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"replica set did not come up within {timeout}s: {states}")
+                time.sleep(0.2)
+        yield url
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for dbpath in dbpaths:
+            shutil.rmtree(dbpath, ignore_errors=True)
+
+def start_server(workers: int, port: int, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    """Launch gunicorn with the production config, the given worker count and extra environment."""
+    env = {**os.environ, **(env or {}), "WEB_CONCURRENCY": str(workers), "PORT": str(port)}
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "--config", "gunicorn.conf.py"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+async def wait_ready(base_url: str, timeout: float = 30.0):
+    """Poll the server until it answers or the timeout passes."""
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get("/users", params={"limit": 1})
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+def stop_server(server: subprocess.Popen):
+    """Stop gunicorn gracefully, as docker stop would."""
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        server.kill()
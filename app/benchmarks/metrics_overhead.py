@@ -0,0 +1,98 @@
+"""
+Overhead of the metrics middleware and Mongo listeners.
+
+Calls a minimal FastAPI app with a parametrized route straight through ASGI,
+with and without MetricsMiddleware, and times a started/succeeded pair of
+command events through CommandMetrics. Reports the added cost per request and
+per Mongo command. Runs in-process and does not need a database.
+
+Usage (from the app directory):
+
+    python -m benchmarks.metrics_overhead --requests 20000 --rounds 5
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+from fastapi import FastAPI
+from pymongo import monitoring
+
+from metrics import CommandMetrics, MetricsMiddleware
+from responses import FastJSONResponse
+
+def make_app(instrumented: bool) -> FastAPI:
+    """Build an app with one route shaped like GET /posts/{post_id}."""
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str) -> FastJSONResponse:
+        return FastJSONResponse(content={"item_id": item_id, "title": "Item", "content": "x" * 200})
+
+    if instrumented:
+        app.add_middleware(MetricsMiddleware)
+    return app
+
+async def time_requests(app: FastAPI, requests: int) -> float:
+    """Return the mean seconds per request for direct ASGI calls."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    def scope(i: int):
+        return {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": f"/items/{i}", "raw_path": f"/items/{i}".encode(),
+            "query_string": b"", "root_path": "", "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+        }
+
+    # Warm up route matching and the metric children
+    for i in range(100):
+        await app(scope(i), receive, send)
+    started = time.perf_counter()
+    for i in range(requests):
+        await app(scope(i), receive, send)
+    return (time.perf_counter() - started) / requests
+
+def time_listener(commands: int) -> float:
+    """Return the mean seconds spent in the command listener per command."""
+    listener = CommandMetrics()
+    address = ("localhost", 27017)
+    command = {"find": "posts", "filter": {"post_id": "x"}}
+    started = time.perf_counter()
+    for i in range(commands):
+        listener.started(monitoring.CommandStartedEvent(command, "takehome", i, address, i))
+        listener.succeeded(monitoring.CommandSucceededEvent(timedelta(microseconds=500), {"ok": 1}, "find", i, address, i))
+    return (time.perf_counter() - started) / commands
+
+def time_events(commands: int) -> float:
+    """Return the mean seconds spent building the two events, which the driver pays anyway."""
+    address = ("localhost", 27017)
+    command = {"find": "posts", "filter": {"post_id": "x"}}
+    started = time.perf_counter()
+    for i in range(commands):
+        monitoring.CommandStartedEvent(command, "takehome", i, address, i)
+        monitoring.CommandSucceededEvent(timedelta(microseconds=500), {"ok": 1}, "find", i, address, i)
+    return (time.perf_counter() - started) / commands
+
+async def main(args: argparse.Namespace):
+    plain_app, instrumented_app = make_app(False), make_app(True)
+    # Alternate the two apps and keep the best round of each to filter out noise
+    plain = instrumented = listener = float("inf")
+    for _ in range(args.rounds):
+        plain = min(plain, await time_requests(plain_app, args.requests))
+        instrumented = min(instrumented, await time_requests(instrumented_app, args.requests))
+        listener = min(listener, time_listener(args.requests) - time_events(args.requests))
+    print(f"{'':<22} {'us/op':>8}")
+    print(f"{'request, plain':<22} {plain * 1e6:>8.1f}")
+    print(f"{'request, instrumented':<22} {instrumented * 1e6:>8.1f}")
+    print(f"{'middleware overhead':<22} {(instrumented - plain) * 1e6:>8.1f}  ({(instrumented / plain - 1) * 100:.1f}%)")
+    print(f"{'listener per command':<22} {listener * 1e6:>8.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000, help="Requests (and commands) per round")
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,126 @@
+"""
+Read routing benchmark: list scans on the primary against list scans on secondaries.
+
+Seeds a dataset into a throwaway three member replica set (or
+--mongo-host, which must be a replica set with secondaries), then starts the
+production server three times: with every read on the primary, with reads on
+secondaryPreferred, and with reads on secondaryPreferred and clients that
+send X-Operation-Time back. Some clients page through GET /posts, while
+writers create a post and read it back straight away with GET
+/posts/{post_id}. Prints, per setting, the p50 and p99 latency of the list
+pages, the creates and the read-backs, and how many read-backs did not find
+the post just created.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    python -m benchmarks.routing --local --list-clients 64 --writers 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Dict, List
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.concurrency import percentile
+from benchmarks.dataset import seed_database
+from benchmarks.local import free_port, start_server, stop_server, throwaway_replica_set, wait_ready
+from dev_init import DATABASE_NAME
+
+# Settings compared: the server's environment, and whether clients send the operation time back
+SETTINGS = [
+    ("primary", {"READ_PREFERENCE_LIST": "primary", "READ_PREFERENCE_READ": "primary"}, False),
+    ("secondary", {"READ_PREFERENCE_LIST": "secondaryPreferred", "READ_PREFERENCE_READ": "secondaryPreferred"}, False),
+    ("secondary+token", {"READ_PREFERENCE_LIST": "secondaryPreferred", "READ_PREFERENCE_READ": "secondaryPreferred"}, True),
+]
+
+async def load(base_url: str, user_ids: List[str], send_token: bool, args: argparse.Namespace) -> Dict[str, float]:
+    """Run the list clients and the writers until the duration passes and summarize their latencies."""
+    rng = random.Random(args.seed)
+    latencies: Dict[str, List[float]] = {"list": [], "create": [], "read_back": []}
+    stale = 0
+
+    async def list_client(client: httpx.AsyncClient, deadline: float):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/posts", params={"limit": 100})
+            response.raise_for_status()
+            latencies["list"].append(time.perf_counter() - started)
+
+    async def writer(client: httpx.AsyncClient, deadline: float):
+        nonlocal stale
+        while time.perf_counter() < deadline:
+            post = {"title": f"Routed {uuid.uuid4()}", "content": "Read back at once", "user_id": rng.choice(user_ids)}
+            started = time.perf_counter()
+            response = await client.post("/posts", json=post)
+            response.raise_for_status()
+            latencies["create"].append(time.perf_counter() - started)
+            token = response.headers.get("x-operation-time")
+            headers = {"X-Operation-Time": token} if send_token and token else {}
+            started = time.perf_counter()
+            response = await client.get(f"/posts/{response.json()['post_id']}", headers=headers)
+            latencies["read_back"].append(time.perf_counter() - started)
+            if response.status_code == 404:
+                stale += 1
+
+    concurrency = args.list_clients + args.writers
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(
+            *(list_client(client, deadline) for _ in range(args.list_clients)),
+            *(writer(client, deadline) for _ in range(args.writers)),
+        )
+    summary = {f"{name}_{p}": percentile(samples, p) * 1000 for name, samples in latencies.items() for p in (50, 99)}
+    summary["stale"] = stale
+    summary["read_backs"] = len(latencies["read_back"])
+    return summary
+
+async def benchmark(args: argparse.Namespace, mongo_host: str):
+    with MongoClient(mongo_host) as client:
+        user_ids = seed_database(client[DATABASE_NAME], args.users, args.posts, seed=args.seed)["users"]
+    print(f"{'setting':<16} {'list p50':>9} {'list p99':>9} {'create p50':>11} {'create p99':>11} {'read p50':>9} {'read p99':>9} {'stale':>11}")
+    for name, env, send_token in SETTINGS:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(args.workers, port, {"MONGO_HOST": mongo_host, "ADMISSION_CONTROL": "0", **env})
+        try:
+            await wait_ready(base_url, timeout=120)
+            row = await load(base_url, user_ids, send_token, args)
+        finally:
+            stop_server(server)
+        stale = f"{row['stale']}/{row['read_backs']}"
+        print(
+            f"{name:<16} {row['list_50']:>9.1f} {row['list_99']:>9.1f} {row['create_50']:>11.1f} {row['create_99']:>11.1f}"
+            f" {row['read_back_50']:>9.1f} {row['read_back_99']:>9.1f} {stale:>11}"
+        )
+
+def main(args: argparse.Namespace):
+    if args.local:
+        mongod = throwaway_replica_set(args.mongod, members=3)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The target database is dropped and seeded first.")
+    with mongod as mongo_host:
+        asyncio.run(benchmark(args, mongo_host))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway three member replica set")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Replica set to drop and use instead of --local")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--list-clients", type=int, default=64, help="Clients paging through GET /posts")
+    parser.add_argument("--writers", type=int, default=16, help="Clients creating posts and reading them back")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds measured per setting")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    main(parser.parse_args())
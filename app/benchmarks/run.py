@@ -0,0 +1,89 @@
+"""
+Reproducible benchmark run with a regression gate.
+
+Starts a throwaway mongod (or uses --mongo-host), seeds it with the
+deterministic dataset, starts the API under gunicorn against it, warms it up,
+runs the load generator and compares the result with the stored baseline.
+Exits with status 1 if a gated endpoint (GET /posts by default) regressed by
+more than --threshold, so it can fail a CI job.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    # Record the baseline on the reference machine
+    python -m benchmarks.run --local --save-baseline
+
+    # Check a change against it
+    python -m benchmarks.run --local
+
+Baselines are only comparable on the same machine with the same settings, so
+record one per machine, and re-record it when a change is meant to move the
+numbers.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from contextlib import nullcontext
+from pathlib import Path
+
+from pymongo import MongoClient
+
+from benchmarks.dataset import seed_database
+from benchmarks.load import add_load_arguments, gate, load_baseline, print_report, run_load, write_results
+from benchmarks.local import free_port, start_server, stop_server, throwaway_mongod, wait_ready
+from dev_init import DATABASE_NAME
+
+DEFAULT_BASELINE = str(Path(__file__).parent / "baseline.json")
+
+async def benchmark(args: argparse.Namespace, mongo_host: str) -> int:
+    with MongoClient(mongo_host) as client:
+        ids = seed_database(client[DATABASE_NAME], args.users, args.posts, args.dataset_seed)
+    print(f"seeded {len(ids['users'])} users and {len(ids['posts'])} posts")
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    # Metrics stay on, as in production; caching is off unless asked for so runs start cold
+    server = start_server(args.workers, port, {"MONGO_HOST": mongo_host, "CACHE_BACKEND": args.cache})
+    try:
+        await wait_ready(base_url, timeout=120)
+        await run_load(base_url, args.concurrency, args.warmup, args.read_ratio, args.seed)
+        results = await run_load(base_url, args.concurrency, args.duration, args.read_ratio, args.seed)
+    finally:
+        stop_server(server)
+    results["config"].update(users=args.users, posts=args.posts, workers=args.workers, cache=args.cache)
+
+    if args.save_baseline:
+        write_results(results, args.baseline)
+        print_report(results)
+        print(f"baseline written to {args.baseline}")
+        return 0
+    baseline = load_baseline(args.baseline)
+    print_report(results, baseline)
+    write_results(results, args.output)
+    return gate(results, baseline, args.threshold, args.gate)
+
+def main(args: argparse.Namespace) -> int:
+    if args.local:
+        mongod = throwaway_mongod(args.mongod)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The target database is dropped and reseeded.")
+    with mongod as mongo_host:
+        return asyncio.run(benchmark(args, mongo_host))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Database to drop, seed and use instead of --local")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--posts", type=int, default=50000)
+    parser.add_argument("--dataset-seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cache", default="none", help="CACHE_BACKEND of the server; memory needs --workers 1")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of unmeasured load before the run")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline instead of comparing")
+    add_load_arguments(parser)
+    parser.set_defaults(baseline=DEFAULT_BASELINE)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,106 @@
+"""
+Search benchmark: GET /posts/search versus fetching every post and filtering.
+
+Before the search endpoint, clients downloaded the whole posts collection and
+filtered it themselves. This compares the two for a common word (matches
+most posts) and a rare term (matches one post).
+
+Against a running server seeded with benchmarks.dataset, it times both
+approaches end to end and reports the bytes transferred:
+
+    python -m benchmarks.dataset --users 10000 --posts 100000
+    python -m benchmarks.search --base-url http://localhost:8000
+
+In-process, with no database, it compares the in-memory search backend with
+a linear scan over the same synthetic posts:
+
+    python -m benchmarks.search --in-process --posts 100000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.dataset import make_posts
+from search import InMemorySearch, tokenize
+
+COMMON_TERM = "database"
+
+def matches(post: Dict[str, Any], term: str) -> bool:
+    """The client-side filter: does the word appear in the title or content."""
+    return term in tokenize(post["title"]) or term in tokenize(post["content"])
+
+async def fetch_all_and_filter(client: httpx.AsyncClient, term: str) -> Tuple[int, int]:
+    """Download every post as NDJSON and filter locally. Returns (matches, bytes)."""
+    found = size = 0
+    async with client.stream("GET", "/posts", params={"stream": True}) as response:
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            size += len(line) + 1
+            if matches(json.loads(line), term):
+                found += 1
+    return found, size
+
+async def search_endpoint(client: httpx.AsyncClient, term: str) -> Tuple[int, int]:
+    """Ask the server for the first page of matches. Returns (results, bytes)."""
+    response = await client.get("/posts/search", params={"q": term, "limit": 20})
+    response.raise_for_status()
+    return len(response.json()["posts"]), len(response.content)
+
+async def best_of(repeat: int, run: Callable, *args) -> Tuple[float, Any]:
+    """Return the fastest of several runs and its result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = await run(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+async def against_server(args: argparse.Namespace):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600) as client:
+        # The seeder titles every post "... #<n>", so a post number is a term that matches once
+        rare_term = str(random.Random(args.seed).randrange(args.posts))
+        print(f"{'term':<12} {'approach':<16} {'ms':>10} {'results':>9} {'MB':>9}")
+        for term in (COMMON_TERM, rare_term):
+            for name, run in (("fetch+filter", fetch_all_and_filter), ("search", search_endpoint)):
+                elapsed, (found, size) = await best_of(args.repeat, run, client, term)
+                print(f"{term:<12} {name:<16} {elapsed * 1000:>10.1f} {found:>9} {size / 2**20:>9.2f}")
+
+async def in_process(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    user_ids = [f"user{i}" for i in range(max(1, args.posts // 10))]
+    posts: List[Dict[str, Any]] = list(make_posts(rng, args.posts, user_ids))
+
+    index = InMemorySearch()
+    started = time.perf_counter()
+    for post in posts:
+        index.index(post)
+    print(f"indexed {len(posts)} posts in {time.perf_counter() - started:.1f}s")
+
+    async def scan(term: str) -> List[Dict[str, Any]]:
+        return [post for post in posts if matches(post, term)]
+
+    async def indexed(term: str) -> List[Dict[str, Any]]:
+        return await index.search(term, None, 20)
+
+    rare_term = str(rng.randrange(args.posts))
+    print(f"{'term':<12} {'approach':<16} {'ms':>10} {'results':>9}")
+    for term in (COMMON_TERM, rare_term):
+        for name, run in (("linear scan", scan), ("inverted index", indexed)):
+            elapsed, found = await best_of(args.repeat, run, term)
+            print(f"{term:<12} {name:<16} {elapsed * 1000:>10.1f} {len(found):>9}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--in-process", action="store_true", help="Benchmark the in-memory backend without a server")
+    parser.add_argument("--posts", type=int, default=100_000, help="Posts in the dataset (seeded count when using a server)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(in_process(args) if args.in_process else against_server(args))
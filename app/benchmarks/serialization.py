@@ -0,0 +1,74 @@
+"""
+Serialization micro-benchmark for the list endpoints.
+
+Compares the old GET /posts response path (json_util.dumps, json.loads,
+PostList(...).model_dump(), JSONResponse) with FastJSONResponse on synthetic
+post documents. Reports CPU time per response and peak memory allocated while
+building it. Runs in-process and does not need a database.
+
+Usage (from the app directory):
+
+    python -m benchmarks.serialization
+    python -m benchmarks.serialization --sizes 1000 10000 100000 --repeat 5
+"""
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable, Dict, List
+
+from bson import json_util
+from fastapi.responses import JSONResponse
+
+from models.post_models import PostList
+from responses import FastJSONResponse
+
+def make_posts(count: int, content_size: int) -> List[Dict[str, Any]]:
+    """Build post documents shaped like the GET /posts projection."""
+    body = ("Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * (content_size // 57 + 1))[:content_size]
+    user_ids = [str(uuid.uuid1()) for _ in range(max(1, count // 10))]
+    return [
+        {"post_id": str(uuid.uuid1()), "title": f"Post number {i}", "content": body, "user_id": user_ids[i % len(user_ids)]}
+        for i in range(count)
+    ]
+
+def legacy_path(posts: List[Dict[str, Any]]) -> bytes:
+    """The response path GET /posts used before FastJSONResponse."""
+    json_compatible_posts = json.loads(json_util.dumps(posts))
+    return JSONResponse(content=PostList(posts=json_compatible_posts).model_dump()).body
+
+def fast_path(posts: List[Dict[str, Any]]) -> bytes:
+    """The current response path."""
+    return FastJSONResponse(content={"posts": posts, "next_cursor": None}).body
+
+def measure(render: Callable[[List[Dict[str, Any]]], bytes], posts: List[Dict[str, Any]], repeat: int) -> Dict[str, float]:
+    """Return the best CPU time and the peak traced memory of one render."""
+    cpu_times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.process_time()
+        body = render(posts)
+        cpu_times.append(time.process_time() - start)
+    gc.collect()
+    tracemalloc.start()
+    render(posts)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu_ms": min(cpu_times) * 1000, "peak_mb": peak / 2**20, "bytes": len(body)}
+
+def main(args: argparse.Namespace):
+    print(f"{'docs':>8} {'path':<8} {'cpu ms':>10} {'peak MB':>9} {'body KB':>9}")
+    for size in args.sizes:
+        posts = make_posts(size, args.content_size)
+        for name, render in (("legacy", legacy_path), ("fast", fast_path)):
+            row = measure(render, posts, args.repeat)
+            print(f"{size:>8} {name:<8} {row['cpu_ms']:>10.1f} {row['peak_mb']:>9.1f} {row['bytes'] / 1024:>9.0f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--content-size", type=int, default=1000, help="Characters of content per post")
+    parser.add_argument("--repeat", type=int, default=3)
+    main(parser.parse_args())
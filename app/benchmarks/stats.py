@@ -0,0 +1,84 @@
+"""
+Stats benchmark: GET /stats against counting on the client.
+
+Before the stats endpoints, a dashboard counted users and posts by reading
+every one of them. This times that, using the NDJSON streams of GET /users
+and GET /posts, against GET /stats, and a user's post count from paging
+GET /users/{user_id}/posts against GET /users/{user_id}/stats. It also
+times POST /admin/stats:reconcile, the full recount, which needs the
+server's ADMIN_TOKEN. Against a running server seeded with benchmarks.dataset:
+
+    python -m benchmarks.dataset --users 10000 --posts 100000
+    python -m benchmarks.stats --base-url http://localhost:8000
+"""
+import argparse
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable
+
+import httpx
+
+async def median_time(repeat: int, call: Callable[[], Awaitable[int]]):
+    """Return the median time of several calls and the count the last one returned."""
+    timings, count = [], 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = await call()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2], count
+
+async def count_lines(client: httpx.AsyncClient, path: str) -> int:
+    count = 0
+    async with client.stream("GET", path, params={"stream": "true"}) as response:
+        async for line in response.aiter_lines():
+            count += bool(line)
+    return count
+
+async def count_user_posts(client: httpx.AsyncClient, user_id: str) -> int:
+    count, cursor = 0, None
+    while True:
+        params = {"limit": 1000, "fields": "post_id", **({"cursor": cursor} if cursor else {})}
+        page = (await client.get(f"/users/{user_id}/posts", params=params)).json()
+        count += len(page["posts"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return count
+
+async def count_both(client: httpx.AsyncClient) -> int:
+    return await count_lines(client, "/users") + await count_lines(client, "/posts")
+
+async def read_totals(client: httpx.AsyncClient) -> int:
+    totals = (await client.get("/stats")).json()
+    return totals["users"] + totals["posts"]
+
+async def read_user_posts(client: httpx.AsyncClient, user_id: str) -> int:
+    return (await client.get(f"/users/{user_id}/stats")).json()["posts"]
+
+async def main(args: argparse.Namespace):
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=600) as client:
+        started = time.perf_counter()
+        response = await client.post("/admin/stats:reconcile", headers={"Authorization": f"Bearer {args.admin_token}"})
+        response.raise_for_status()
+        print(f"reconcile: {(time.perf_counter() - started) * 1000:.0f} ms, totals {response.json()['after']}")
+
+        # The author of the first post, who has an average number of posts
+        user_id = (await client.get("/posts", params={"limit": 1})).json()["posts"][0]["user_id"]
+        rows = [
+            ("count users + posts", lambda: count_both(client)),
+            ("GET /stats", lambda: read_totals(client)),
+            ("page user's posts", lambda: count_user_posts(client, user_id)),
+            ("GET /users/{id}/stats", lambda: read_user_posts(client, user_id)),
+        ]
+        print(f"{'method':<24} {'ms':>10} {'count':>10}")
+        for name, call in rows:
+            elapsed, count = await median_time(args.repeat, call)
+            print(f"{name:<24} {elapsed * 1000:>10.2f} {count:>10}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--admin-token", default=os.getenv('ADMIN_TOKEN'), help="The server's ADMIN_TOKEN")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,109 @@
+"""
+Per-user post listing benchmark: GET /users/{user_id}/posts as the posts collection grows.
+
+One author keeps a fixed number of posts while filler posts by other authors
+are added between rounds. Because each page is a range scan of the
+(user_id, _id) index, the latency of the author's first and last pages and
+the number of documents Mongo examines should stay flat as the total grows.
+
+Usage (from the app directory, with mongod on the PATH):
+
+    python -m benchmarks.user_posts --local --totals 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from contextlib import nullcontext
+from typing import Optional
+
+import httpx
+from pymongo import MongoClient
+
+from benchmarks.dataset import _insert_batches, make_posts, make_users
+from benchmarks.local import free_port, start_server, stop_server, throwaway_mongod, wait_ready
+from dev_init import DATABASE_NAME
+from indexes import INDEXES
+
+async def time_page(client: httpx.AsyncClient, user_id: str, limit: int, cursor: Optional[str], repeat: int):
+    """Return the fastest of several fetches of one page, and that page's next_cursor."""
+    best, next_cursor = float("inf"), None
+    params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = await client.get(f"/users/{user_id}/posts", params=params)
+        best = min(best, time.perf_counter() - started)
+        response.raise_for_status()
+        next_cursor = response.json()["next_cursor"]
+    return best, next_cursor
+
+async def measure(base_url: str, user_id: str, limit: int, repeat: int):
+    """Time the author's first page, then walk to the last page and time that."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        first, cursor = await time_page(client, user_id, limit, None, repeat)
+        last_cursor = None
+        while cursor:
+            last_cursor = cursor
+            _, cursor = await time_page(client, user_id, limit, cursor, 1)
+        last, _ = await time_page(client, user_id, limit, last_cursor, repeat)
+    return first, last
+
+def docs_examined(db, user_id: str, limit: int) -> int:
+    """Return how many documents Mongo examines for the first page."""
+    plan = db.posts.find({"user_id": user_id}).sort("_id", 1).limit(limit).explain()
+    return plan["executionStats"]["totalDocsExamined"]
+
+async def benchmark(args: argparse.Namespace, mongo_host: str):
+    rng = random.Random(args.seed)
+    with MongoClient(mongo_host) as client:
+        db = client[DATABASE_NAME]
+        for name in ("users", "posts", "counters"):
+            db.drop_collection(name)
+        for collection, models in INDEXES.items():
+            db[collection].create_indexes(models)
+        author, *others = _insert_batches(db.users, make_users(rng, 1 + args.users), 5000)
+        _insert_batches(db.posts, make_posts(rng, args.author_posts, [author]), 5000)
+
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(1, port, {"MONGO_HOST": mongo_host, "CACHE_BACKEND": "none"})
+        try:
+            await wait_ready(base_url, timeout=120)
+            print(f"{'total posts':>12} {'first page ms':>14} {'last page ms':>13} {'docs examined':>14}")
+            total = args.author_posts
+            for target in sorted(args.totals):
+                if target > total:
+                    # make_posts numbers titles from zero on each call, so tag them to keep titles unique
+                    filler = make_posts(rng, target - total, others)
+                    _insert_batches(db.posts, ({**post, "title": f"{post['title']} r{target}"} for post in filler), 5000)
+                    total = target
+                first, last = await measure(base_url, author, args.limit, args.repeat)
+                examined = docs_examined(db, author, args.limit)
+                print(f"{total:>12} {first * 1000:>14.2f} {last * 1000:>13.2f} {examined:>14}")
+        finally:
+            stop_server(server)
+
+def main(args: argparse.Namespace):
+    if args.local:
+        mongod = throwaway_mongod(args.mongod)
+    elif args.mongo_host:
+        mongod = nullcontext(args.mongo_host)
+    else:
+        sys.exit("Pass --local or --mongo-host (or set MONGO_HOST). The target database is dropped and reseeded.")
+    with mongod as mongo_host:
+        asyncio.run(benchmark(args, mongo_host))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--local", action="store_true", help="Run against a throwaway mongod")
+    parser.add_argument("--mongod", default="mongod", help="mongod executable used with --local")
+    parser.add_argument("--mongo-host", default=os.getenv('MONGO_HOST'), help="Database to drop, seed and use instead of --local")
+    parser.add_argument("--totals", type=int, nargs="+", default=[10_000, 100_000, 1_000_000], help="Total post counts to measure at")
+    parser.add_argument("--users", type=int, default=10_000, help="Other authors writing the filler posts")
+    parser.add_argument("--author-posts", type=int, default=500, help="Posts by the measured author")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=20)
+    main(parser.parse_args())
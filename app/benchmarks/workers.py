@@ -0,0 +1,56 @@
+"""
+Worker scaling benchmark for the production server.
+
+Starts gunicorn with the production config once per worker count, drives it
+at a fixed concurrency with the point-read load from the concurrency
+benchmark, and prints requests/sec and latency percentiles per worker count.
+Throughput should grow roughly linearly until the box runs out of cores or
+Mongo becomes the bottleneck.
+
+Usage (from the app directory, with MONGO_HOST pointing at a database you
+can write benchmark data to):
+
+    python -m benchmarks.workers --workers 1 2 4 8 --concurrency 200
+
+Run the load generator on a different machine from the server, or at least
+leave it a core, when measuring the EC2 box itself.
+"""
+import argparse
+import asyncio
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.concurrency import run_level, seed
+from benchmarks.local import start_server, stop_server, wait_ready
+
+async def main(args: argparse.Namespace):
+    base_url = f"http://127.0.0.1:{args.port}"
+    results: List[Dict[str, float]] = []
+    for workers in args.workers:
+        server = start_server(workers, args.port)
+        try:
+            await wait_ready(base_url)
+            async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                ids = await seed(client, args.seed)
+            # Let every worker open its Mongo pool before measuring
+            await run_level(base_url, ids, args.concurrency, 1.0)
+            row = await run_level(base_url, ids, args.concurrency, args.duration)
+        finally:
+            stop_server(server)
+        results.append({"workers": workers, **row})
+
+    baseline = results[0]["rps"] if results else 0
+    print(f"{'workers':>8} {'req/s':>10} {'scaling':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for row in results:
+        scaling = row["rps"] / baseline if baseline else 0
+        print(f"{row['workers']:>8} {row['rps']:>10.1f} {scaling:>7.2f}x {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} {row['errors']:>7}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=200, help="Concurrent clients at every worker count")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds measured per worker count")
+    parser.add_argument("--seed", type=int, default=20, help="Number of users/posts to create before each run")
+    parser.add_argument("--port", type=int, default=8800)
+    asyncio.run(main(parser.parse_args()))
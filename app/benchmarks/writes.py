@@ -0,0 +1,105 @@
+"""
+Write throughput benchmark for the user and post routes.
+
+Each client repeatedly creates a user and a post, updates both, then deletes
+both, against a running instance of the API. Reports writes/sec and latency
+percentiles per route.
+
+Usage (from the app directory, against a server you started yourself):
+
+    python -m benchmarks.writes --base-url http://localhost:8000 --output before.json
+    python -m benchmarks.writes --base-url http://localhost:8000 --compare before.json
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.concurrency import percentile
+
+_counter = itertools.count()
+
+async def timed(client: httpx.AsyncClient, latencies: Dict[str, List[float]], name: str, method: str, path: str, **kwargs) -> httpx.Response:
+    """Send one request and record its latency under the given route name."""
+    start = time.perf_counter()
+    response = await client.request(method, path, **kwargs)
+    latencies[name].append(time.perf_counter() - start)
+    response.raise_for_status()
+    return response
+
+async def worker(client: httpx.AsyncClient, run_tag: int, deadline: float, latencies: Dict[str, List[float]], errors: List[str]):
+    """Run create/update/delete cycles until the deadline passes."""
+    while time.perf_counter() < deadline:
+        try:
+            await cycle(client, run_tag, latencies)
+        except httpx.HTTPError as e:
+            errors.append(str(e))
+
+async def cycle(client: httpx.AsyncClient, run_tag: int, latencies: Dict[str, List[float]]):
+    """Create, update and delete one user and one post."""
+    n = next(_counter)
+    user = await timed(client, latencies, "POST /users", "POST", "/users",
+                       json={"fullName": "Write Bench", "email": f"write{run_tag}x{n}@example.com"})
+    user_id = user.json()["user_id"]
+    post = await timed(client, latencies, "POST /posts", "POST", "/posts",
+                       json={"title": f"Write Bench {run_tag} {n}", "content": "Benchmark content", "user_id": user_id})
+    post_id = post.json()["post_id"]
+    await timed(client, latencies, "PUT /users/{user_id}", "PUT", f"/users/{user_id}",
+                json={"fullName": "Write Bench Updated", "email": f"write{run_tag}x{n}u@example.com"})
+    await timed(client, latencies, "PUT /posts/{post_id}", "PUT", f"/posts/{post_id}",
+                json={"title": f"Write Bench {run_tag} {n} updated", "content": "Updated content", "user_id": user_id})
+    await timed(client, latencies, "DELETE /posts/{post_id}", "DELETE", f"/posts/{post_id}")
+    await timed(client, latencies, "DELETE /users/{user_id}", "DELETE", f"/users/{user_id}")
+
+async def main(args: argparse.Namespace):
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: List[str] = []
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    run_tag = int(time.time() * 1000)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(client, run_tag, deadline, latencies, errors) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = {
+        name: {
+            "requests": len(samples),
+            "rps": len(samples) / elapsed,
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+        }
+        for name, samples in latencies.items()
+    }
+    total = sum(row["requests"] for row in results.values())
+    results["total"] = {"requests": total, "rps": total / elapsed, "errors": len(errors)}
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print(f"{'route':<26} {'writes/s':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, row in results.items():
+        line = f"{name:<26} {row['rps']:>9.1f} {row.get('p50_ms', 0):>9.2f} {row.get('p99_ms', 0):>9.2f}"
+        if name in baseline:
+            line += f"   (before: {baseline[name]['rps']:.1f}/s)"
+        print(line)
+    if errors:
+        print(f"{len(errors)} failed cycles, first error: {errors[0]}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare against")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,46 @@
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+from models.bulk_models import MAX_BULK_ITEMS, BulkItemResult, BulkResult
+
+# Mongo error code for a unique index violation
+DUPLICATE_KEY = 11000
+
+Model = TypeVar("Model", bound=BaseModel)
+
+def validate_items(model: Type[Model], items: List[Dict[str, Any]]) -> Tuple[List[Tuple[int, Model]], Dict[int, BulkItemResult]]:
+    """
+    Validate each item of a bulk request on its own.
+
+    A bad item is reported in its own result instead of failing the whole
+    batch, including the HTTPExceptions raised by the model validators.
+
+    Returns:
+        The valid items with their request index, and a result for every
+        rejected item keyed by index.
+    """
+    valid = []
+    rejected = {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, model.model_validate(item)))
+        except HTTPException as e:
+            rejected[index] = BulkItemResult(index=index, status=e.status_code, detail=e.detail)
+        except ValidationError as e:
+            message = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            rejected[index] = BulkItemResult(index=index, status=422, detail=message)
+    return valid, rejected
+
+def summarize(results: Dict[int, BulkItemResult]) -> BulkResult:
+    """Collect per-item results into a response, in request order."""
+    ordered = [results[index] for index in sorted(results)]
+    succeeded = sum(1 for result in ordered if result.status < 400)
+    return BulkResult(succeeded=succeeded, failed=len(ordered) - succeeded, results=ordered)
+
+def write_failure(index: int, code: int, duplicate_detail: str, id: Optional[str] = None) -> BulkItemResult:
+    """Turn the Mongo error code of a failed write into an item result."""
+    if code == DUPLICATE_KEY:
+        return BulkItemResult(index=index, status=400, id=id, detail=duplicate_detail)
+    return BulkItemResult(index=index, status=500, id=id, detail=f"Write failed with error code {code}")
@@ -0,0 +1,201 @@
+"""
+Read-through cache for single-entity lookups.
+
+The memory backend is a bounded in-process LRU with a TTL. It is per
+worker, so an invalidation would only reach the worker that made the write,
+and other workers would serve the old value, and its ETag, until the TTL ran
+out. So it is only used by a single worker. With several workers, as
+WEB_CONCURRENCY tells, the default is no cache, and a cache needs the Redis
+backend, which every worker shares and sees the same invalidations in.
+
+Configuration is read from the environment:
+
+    CACHE_BACKEND       memory, redis or none (memory for one worker, none for several)
+    CACHE_MAX_ENTRIES   maximum entries held by the memory backend (10000)
+    CACHE_TTL_SECONDS   time to live of an entry (30)
+    CACHE_REDIS_URL     connection URL of the redis backend
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import orjson
+
+class LRUCache:
+    """
+    Bounded in-process LRU cache whose entries expire after a TTL.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        """Return (found, value) for a key, dropping it if it has expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    async def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entry when full."""
+        self._entries[key] = (self.clock() + self.ttl_seconds, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str) -> None:
+        """Remove a key if present."""
+        self._entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    async def close(self) -> None:
+        self._entries.clear()
+
+class RedisCache:
+    """
+    Cache backend speaking the Redis protocol, shared by every worker.
+
+    Requires the optional `redis` package. Values are stored as JSON with an
+    expiry, and eviction is left to the server's maxmemory policy.
+    """
+
+    def __init__(self, url: str, ttl_seconds: float = 30.0, prefix: str = "takehome:"):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ImportError("CACHE_BACKEND=redis requires the 'redis' package") from e
+        self.client = redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self.evictions = 0
+
+    async def get(self, key: str) -> Tuple[bool, Any]:
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, orjson.loads(raw)
+
+    async def set(self, key: str, value: Any) -> None:
+        await self.client.set(self.prefix + key, orjson.dumps(value), px=int(self.ttl_seconds * 1000))
+
+    async def delete(self, key: str) -> None:
+        await self.client.delete(self.prefix + key)
+
+    def size(self) -> Optional[int]:
+        return None
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+class ReadThroughCache:
+    """
+    Read-through front for a cache backend, with stampede protection.
+
+    Concurrent misses on the same key share a single load. A load that overlaps
+    an invalidation of its key is returned to its callers but not stored,
+    because it may have read the document before the write.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Optional[Dict[str, Any]]]]) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached document for a key, loading it on a miss.
+
+        Missing documents (None) are not cached.
+        """
+        found, value = await self.backend.get(key)
+        if found:
+            self.hits += 1
+            return dict(value)
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+            value = await asyncio.shield(inflight)
+            return dict(value) if value is not None else None
+
+        self.misses += 1
+        generation = self._generations.get(key, 0)
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await loader()
+            if value is not None and self._generations.get(key, 0) == generation:
+                await self.backend.set(key, value)
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else may be waiting; retrieve the exception so it is not reported as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            self._generations.pop(key, None)
+        return dict(value) if value is not None else None
+
+    async def invalidate(self, key: str) -> None:
+        """Drop a key after its document changed."""
+        self.invalidations += 1
+        # Tell an in-flight load of this key that its result may be stale
+        if key in self._inflight:
+            self._generations[key] = self._generations.get(key, 0) + 1
+        await self.backend.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters for sizing the cache."""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.backend.evictions,
+            "invalidations": self.invalidations,
+            "size": self.backend.size(),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+def cache_from_env() -> Optional[ReadThroughCache]:
+    """
+    Build the cache configured by the CACHE_* environment variables, or None if disabled.
+
+    Raises:
+        ValueError: If the backend is unknown, or is memory while several workers run.
+    """
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    backend = os.getenv('CACHE_BACKEND', 'memory' if workers == 1 else 'none').lower()
+    ttl_seconds = float(os.getenv('CACHE_TTL_SECONDS', '30'))
+    if backend == 'none':
+        return None
+    if backend == 'redis':
+        return ReadThroughCache(RedisCache(os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0'), ttl_seconds))
+    if backend == 'memory':
+        if workers > 1:
+            raise ValueError(f"CACHE_BACKEND=memory would serve stale reads with {workers} workers; use redis or none")
+        return ReadThroughCache(LRUCache(int(os.getenv('CACHE_MAX_ENTRIES', '10000')), ttl_seconds))
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
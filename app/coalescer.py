@@ -0,0 +1,113 @@
+"""
+Group commit for user and post creation.
+
+With coalescing on, POST /users and POST /posts do not insert their document
+right away. Each worker queues concurrent creates per collection and writes
+them together as one unordered insert_many, once WRITE_BATCH_SIZE documents
+are waiting or WRITE_BATCH_DELAY_MS after the first one arrived, whichever
+comes first. Every caller still waits for its own document to be written and
+gets its own result, including a duplicate key error for its document alone.
+
+Under load this turns hundreds of round trips into a few, at the cost of up
+to WRITE_BATCH_DELAY_MS of added latency per create. When traffic is light
+a batch holds a single document, and the delay is all cost, so coalescing is
+off by default.
+
+Configuration is read from the environment:
+
+    WRITE_COALESCING       set to 1 to batch creates (0)
+    WRITE_BATCH_SIZE       documents that trigger an immediate flush (256)
+    WRITE_BATCH_DELAY_MS   longest a create waits for others to join it (5)
+"""
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from pymongo.errors import DuplicateKeyError, WriteError
+
+from bulk import DUPLICATE_KEY
+from repositories.base import Repository
+
+WRITE_COALESCING = os.getenv('WRITE_COALESCING', '0') == '1'
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '256'))
+WRITE_BATCH_DELAY_MS = float(os.getenv('WRITE_BATCH_DELAY_MS', '5'))
+
+class WriteCoalescer:
+    """
+    Batches the inserts of one worker into a collection.
+
+    It has the same `insert` as a repository, so a route can use either one.
+    Batches are written by background tasks, so a new batch can fill while the
+    previous one is still being written.
+    """
+
+    def __init__(self, repository: Repository, max_batch: int = WRITE_BATCH_SIZE, max_delay_ms: float = WRITE_BATCH_DELAY_MS):
+        self.repository = repository
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Task] = set()
+        self._closed = False
+
+    async def insert(self, data: Dict[str, Any]) -> int:
+        """
+        Insert a new document as part of the next batch.
+
+        Returns:
+            The version of the new document.
+
+        Raises:
+            DuplicateKeyError: If a uniquely indexed field is already taken.
+        """
+        if self._closed:
+            return await self.repository.insert(data)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((data, future))
+        if len(self._pending) >= self.max_batch:
+            self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self.flush)
+        # The document is written even if the caller goes away, so only the wait is cancelled
+        return await asyncio.shield(future)
+
+    def flush(self) -> None:
+        """Start writing the waiting documents now."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._write(batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        """Insert a batch and resolve each caller's future with its own outcome."""
+        try:
+            failures = await self.repository.insert_many([data for data, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for position, (_, future) in enumerate(batch):
+            code = failures.get(position)
+            if code is None:
+                future.set_result(1)
+            elif code == DUPLICATE_KEY:
+                future.set_exception(DuplicateKeyError("E11000 duplicate key error", code))
+            else:
+                future.set_exception(WriteError(f"Insert failed with code {code}", code))
+
+    async def close(self) -> None:
+        """Write the waiting documents and wait for every batch in flight. Later inserts are not batched."""
+        self._closed = True
+        self.flush()
+        await asyncio.gather(*self._writes, return_exceptions=True)
+
+def coalescers_from_env(*repositories: Repository) -> Dict[str, WriteCoalescer]:
+    """Build a coalescer per repository's collection if WRITE_COALESCING is on, else none."""
+    if not WRITE_COALESCING:
+        return {}
+    return {repository.collection_name: WriteCoalescer(repository) for repository in repositories}
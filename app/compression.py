@@ -0,0 +1,236 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+`CompressionMiddleware` compresses JSON and NDJSON responses with the best
+encoding the client accepts: zstd, then br, then gzip. zstd needs the
+optional `zstandard` package and br the optional `brotli` package; encodings
+whose package is missing are skipped. Whole responses smaller than the
+minimum size are sent as they are, since compressing them saves too little
+to pay for the CPU. Streamed responses are compressed incrementally, as each
+chunk is sent, without buffering the whole body.
+
+Compressing changes the bytes of the response but not the document, so a
+strong ETag gets the content coding added, as "v3" becomes "v3-gzip". Each
+encoding has its own strong ETag, and If-None-Match and If-Match accept
+any of them (see `conditional`).
+
+Configuration is read from the environment:
+
+    COMPRESSION_ENCODINGS   encodings to offer, in order of preference (zstd,br,gzip); empty turns compression off
+    COMPRESSION_MIN_SIZE    smallest whole response to compress, in bytes (1024)
+    COMPRESSION_GZIP_LEVEL  gzip level, 1-9 (4)
+    COMPRESSION_BR_LEVEL    brotli quality, 0-11 (4)
+    COMPRESSION_ZSTD_LEVEL  zstd level, 1-22 (3)
+"""
+import asyncio
+import os
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from conditional import encoded_etag
+
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+LEVELS = {
+    "gzip": int(os.getenv('COMPRESSION_GZIP_LEVEL', '4')),
+    "br": int(os.getenv('COMPRESSION_BR_LEVEL', '4')),
+    "zstd": int(os.getenv('COMPRESSION_ZSTD_LEVEL', '3')),
+}
+
+# Only text formats shrink enough to be worth it. Event streams are left
+# alone, because every event has to reach the client as soon as it is sent.
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/plain", "text/html", "text/csv")
+
+# Whole bodies at least this large are compressed in a thread, so that one
+# large response does not stall every other request on the event loop
+THREAD_SIZE = 256 * 1024
+
+class GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+class BrotliStream:
+    def __init__(self, level: int):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+class ZstdStream:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+STREAMS = {"gzip": GzipStream, "br": BrotliStream, "zstd": ZstdStream}
+
+def available_encodings(preferred: Sequence[str]) -> List[str]:
+    """Return the preferred encodings whose compression library is installed, in order."""
+    installed = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [encoding for encoding in preferred if installed.get(encoding)]
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    """Compress a whole body with the given encoding."""
+    stream = STREAMS[encoding](level)
+    return stream.compress(data) + stream.finish()
+
+def negotiate(accept_encoding: str, offered: Sequence[str]) -> Optional[str]:
+    """
+    Pick the encoding for a response from an Accept-Encoding header.
+
+    Args:
+        accept_encoding (str): The header, such as "gzip, br;q=0.9".
+        offered (Sequence[str]): The encodings the server offers, most preferred first.
+
+    Returns:
+        The offered encoding with the highest q-value, preferring earlier ones on
+        ties, or None if the client accepts none of them.
+    """
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with the negotiated encoding.
+
+    The response start is held back until the first body chunk arrives, since
+    that is when it is known whether the body is whole or streamed and how
+    large it is.
+    """
+
+    def __init__(self, app, encodings: Sequence[str], min_size: int = COMPRESSION_MIN_SIZE, levels: Dict[str, int] = LEVELS):
+        self.app = app
+        self.encodings = list(encodings)
+        self.min_size = min_size
+        self.levels = levels
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = next((value for name, value in scope["headers"] if name == b"accept-encoding"), None)
+        encoding = negotiate(accept_encoding.decode("latin-1"), self.encodings) if accept_encoding else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await CompressingResponder(self.app, encoding, self.levels[encoding], self.min_size)(scope, receive, send)
+
+class CompressingResponder:
+    """Compresses one response, as a whole or chunk by chunk."""
+
+    def __init__(self, app, encoding: str, level: int, min_size: int):
+        self.app = app
+        self.encoding = encoding
+        self.level = level
+        self.min_size = min_size
+        self.start: Optional[dict] = None
+        self.stream = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive, send):
+        self.send = send
+        await self.app(scope, receive, self.send_wrapper)
+
+    def _compressible(self, headers: List) -> bool:
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+        return content_type.decode("latin-1").split(";")[0].strip() in COMPRESSIBLE_TYPES
+
+    def _compressed_headers(self, length: Optional[int]) -> List:
+        headers = []
+        for name, value in self.start["headers"]:
+            if name == b"content-length":
+                continue
+            if name == b"etag" and value.startswith(b'"'):
+                value = encoded_etag(value.decode("latin-1"), self.encoding).encode("latin-1")
+            headers.append((name, value))
+        headers.append((b"content-encoding", self.encoding.encode()))
+        headers.append((b"vary", b"Accept-Encoding"))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return headers
+
+    async def send_wrapper(self, message):
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.stream is None:
+            whole = not more_body
+            if not self._compressible(self.start["headers"]) or (whole and len(body) < self.min_size):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            if whole:
+                if len(body) >= THREAD_SIZE:
+                    compressed = await asyncio.to_thread(compress, body, self.encoding, self.level)
+                else:
+                    compressed = compress(body, self.encoding, self.level)
+                await self.send({**self.start, "headers": self._compressed_headers(len(compressed))})
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            self.stream = STREAMS[self.encoding](self.level)
+            await self.send({**self.start, "headers": self._compressed_headers(None)})
+
+        # Compressors buffer small inputs, so most chunks of a stream of small
+        # lines produce no output and nothing is sent for them
+        chunk = self.stream.compress(body)
+        if not more_body:
+            chunk += self.stream.finish()
+        if chunk or not more_body:
+            await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+def compression_from_env() -> List[str]:
+    """Return the encodings configured by COMPRESSION_ENCODINGS that can be used, most preferred first."""
+    preferred = [name.strip().lower() for name in os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(",") if name.strip()]
+    return available_encodings(preferred)
@@ -0,0 +1,98 @@
+"""
+ETag and conditional request helpers.
+
+Documents carry a `version` field that every write through the repositories
+increments, and each collection has a change counter in the `counters`
+collection. A document's ETag is its version, and a list's ETag is the
+collection counter plus the query that produced the list. Either one can be
+checked without serializing the payload.
+
+Cache-Control for read endpoints is set by HTTP_MAX_AGE_SECONDS. The default
+of 0 sends "no-cache", which lets browsers and proxies store responses but
+makes them revalidate with If-None-Match every time.
+"""
+import hashlib
+import os
+import re
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException, status
+from fastapi.responses import Response
+
+_max_age = int(os.getenv('HTTP_MAX_AGE_SECONDS', '0'))
+CACHE_CONTROL = f"public, max-age={_max_age}, must-revalidate" if _max_age > 0 else "no-cache"
+
+# Content codings the compression middleware adds to an ETag, so that each encoding of a response has its own strong ETag
+CODINGS = ("gzip", "br", "zstd")
+
+_CODING_SUFFIX = re.compile(r'-(?:%s)"$' % "|".join(CODINGS))
+
+_DOCUMENT_ETAG = re.compile(r'^"v(\d+)(?:-[0-9a-f]+)?(?:-(?:%s))?"$' % "|".join(CODINGS))
+
+def _digest(*parts: Any) -> str:
+    return hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+
+def document_etag(version: int, *variant: Any) -> str:
+    """Strong ETag of a single document at the given version."""
+    if variant:
+        return f'"v{version}-{_digest(*variant)}"'
+    return f'"v{version}"'
+
+def collection_etag(change_count: int, *query: Any) -> str:
+    """Strong ETag of a list, from the collection change counter and the query parameters."""
+    return f'"c{change_count}-{_digest(*query)}"'
+
+def encoded_etag(etag: str, coding: str) -> str:
+    """Strong ETag of a response sent with a content coding, from the ETag of its identity encoding."""
+    return f'{etag[:-1]}-{coding}"'
+
+def _etags(header: str):
+    for tag in header.split(","):
+        yield tag.strip()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against the current ETag, by weak comparison.
+
+    The encodings of a response hold the same content, so the ETag of any of
+    them matches.
+    """
+    if not if_none_match:
+        return False
+    return any(tag == "*" or _CODING_SUFFIX.sub('"', tag.removeprefix("W/")) == etag for tag in _etags(if_none_match))
+
+def if_match_version(if_match: Optional[str]) -> Optional[int]:
+    """
+    Return the document version an If-Match header requires.
+
+    Every ETag a document read sends, in any content coding, names the
+    version of the document. If-Match uses strong comparison, so only a weak
+    ETag, which this API never sends for a document, fails it.
+
+    Returns:
+        None when there is no precondition (no header or "*").
+
+    Raises:
+        HTTPException: If the header holds no strong ETag this API could have issued.
+    """
+    if not if_match or if_match.strip() == "*":
+        return None
+    for tag in _etags(if_match):
+        match = _DOCUMENT_ETAG.match(tag)
+        if match:
+            return int(match.group(1))
+    raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Precondition failed")
+
+def version_filter(version: int) -> Dict[str, Any]:
+    """Mongo filter matching documents at the given version. Documents written before versioning count as 0."""
+    if version == 0:
+        return {"version": {"$exists": False}}
+    return {"version": version}
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Headers that let clients and proxies revalidate a read response."""
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+def not_modified(etag: str) -> Response:
+    """Empty 304 response for a matching If-None-Match."""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
@@ -0,0 +1,109 @@
+import hmac
+import os
+import time
+
+from fastapi import Depends, Header, HTTPException, Request
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional, Union
+
+import profiling
+from cache import ReadThroughCache
+from coalescer import WriteCoalescer
+from feed import PostFeed
+from fields import fieldset
+from jobs import JobRunner
+from loaders import UserLoader
+
+from models.post_models import PostResponse
+from models.user_models import UserResponse
+from repositories.users import UserRepository
+from repositories.posts import PostRepository
+from repositories.stats import StatsRepository
+
+# Bearer token required by the admin endpoints that write or read whole collections; unset disables them
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+# Parse the fields= parameter of user and post reads; the author is embedded with expand=user instead
+get_user_fields = fieldset(UserResponse)
+get_post_fields = fieldset(PostResponse, exclude=("user",))
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    """
+    Only let requests carrying the admin token through.
+
+    Raises:
+        HTTPException: 404 if no ADMIN_TOKEN is set, 401 if the token is missing or wrong.
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+def require_profile_signature(x_profile: Optional[str] = Header(None)) -> None:
+    """
+    Only let requests carrying a valid signed X-Profile header through, such as one printed by `python profiling.py`.
+
+    Raises:
+        HTTPException: 404 if profiling is off, 401 if the header is missing, wrongly signed or expired.
+    """
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.verify(x_profile or "", profiling.PROFILING_SECRET, time.time()):
+        raise HTTPException(status_code=401, detail="Invalid X-Profile signature")
+
+def get_db(request: Request) -> AsyncIOMotorDatabase:
+    """Return the database handle opened by the app lifespan."""
+    return request.app.state.db
+
+def get_cache(request: Request) -> Optional[ReadThroughCache]:
+    """Return the entity cache opened by the app lifespan, if caching is enabled."""
+    return request.app.state.cache
+
+def get_search(request: Request):
+    """Return the post search backend opened by the app lifespan."""
+    return request.app.state.search
+
+def get_job_runner(request: Request) -> JobRunner:
+    """Return this worker's background job runner, started by the app lifespan."""
+    return request.app.state.jobs
+
+def get_feed(request: Request) -> PostFeed:
+    """Return this worker's post change feed, created by the app lifespan."""
+    return request.app.state.feed
+
+def get_user_repository(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    cache: Optional[ReadThroughCache] = Depends(get_cache),
+) -> UserRepository:
+    """Return a user repository bound to the shared client and cache."""
+    return UserRepository(db, cache)
+
+def get_post_repository(
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    cache: Optional[ReadThroughCache] = Depends(get_cache),
+    search=Depends(get_search),
+) -> PostRepository:
+    """Return a post repository bound to the shared client, cache and search backend."""
+    return PostRepository(db, cache, search)
+
+def get_stats_repository(db: AsyncIOMotorDatabase = Depends(get_db)) -> StatsRepository:
+    """Return the stats counters bound to the shared client."""
+    return StatsRepository(db)
+
+def get_user_writer(
+    request: Request,
+    users: UserRepository = Depends(get_user_repository),
+) -> Union[WriteCoalescer, UserRepository]:
+    """Return what user creates insert through: the worker's coalescer if batching is on, else the repository."""
+    return request.app.state.coalescers.get(UserRepository.collection_name, users)
+
+def get_post_writer(
+    request: Request,
+    posts: PostRepository = Depends(get_post_repository),
+) -> Union[WriteCoalescer, PostRepository]:
+    """Return what post creates insert through: the worker's coalescer if batching is on, else the repository."""
+    return request.app.state.coalescers.get(PostRepository.collection_name, posts)
+
+def get_user_loader(users: UserRepository = Depends(get_user_repository)) -> UserLoader:
+    """Return a user loader whose memo lives for the current request."""
+    return UserLoader(users)
@@ -1,17 +1,42 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from ids import MONGO_CODEC_OPTIONS
+from metrics import mongo_listeners
+from profiling import profiling_listeners
+from routing import routing_listeners
 
 # Load environment variables
 load_dotenv()
 
+# Name of the application database
+DATABASE_NAME = 'takehome'
+
 # Environment setup
 def env_setup():
     os.environ["MKL_NUM_THREADS"] = "8"
     os.environ["NUMEXPR_NUM_THREADS"] = "8"
     os.environ["OMP_NUM_THREADS"] = "8"
 
-# Create a MongoDB Client
-def mongo_client():
-    client = MongoClient(os.getenv('MONGO_HOST'))
-    return client['takehome']
\ No newline at end of file
+# Connection pool and wire settings for the MongoDB Client
+def mongo_client_options() -> dict:
+    options = {
+        "maxPoolSize": int(os.getenv('MONGO_MAX_POOL_SIZE', '100')),
+        "minPoolSize": int(os.getenv('MONGO_MIN_POOL_SIZE', '0')),
+        "serverSelectionTimeoutMS": int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '30000')),
+        # Binary UUID IDs are read back as the strings the API shows
+        **MONGO_CODEC_OPTIONS,
+    }
+    if os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS'):
+        options["waitQueueTimeoutMS"] = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS'))
+    # Comma separated, e.g. "zstd,snappy,zlib"; zstd needs `zstandard`, snappy needs `python-snappy`
+    if os.getenv('MONGO_COMPRESSORS'):
+        options["compressors"] = os.getenv('MONGO_COMPRESSORS')
+    return options
+
+# Create an async MongoDB Client, reporting command and pool timings to /metrics and to request profiles,
+# and operation times to read routing
+def mongo_client() -> AsyncIOMotorClient:
+    listeners = mongo_listeners() + profiling_listeners() + routing_listeners()
+    return AsyncIOMotorClient(os.getenv('MONGO_HOST'), event_listeners=listeners, **mongo_client_options())
@@ -0,0 +1,324 @@
+"""
+Push feed of post changes, served as Server-Sent Events by GET /posts/stream.
+
+Each worker opens one change stream on the posts collection, when its first
+client subscribes, and fans every change out to all of its subscribers in
+process. Mongo serves one change stream per worker however many dashboards
+are connected, instead of one collection read per poll. Creates, updates
+and deletes are sent as `create`, `update` and `delete` events, and the id of
+each event is the resume token of its change.
+
+A client that reconnects with Last-Event-ID misses nothing. If its worker
+still holds that event in the replay buffer, the events after it are
+replayed from memory. Otherwise, for example when the client lands on
+another worker, a change stream of its own resumes from the token until it
+catches up with the shared one. A token too old to resume from gets a
+`reset` event, after which the client should reload the posts. A subscriber
+that falls FEED_QUEUE_SIZE events behind is disconnected, and catches up the
+same way when it reconnects.
+
+Change streams need a replica set; a single node one will do. On a
+standalone mongod, GET /posts/stream answers 503. Delete events carry the
+post_id only if the posts collection records pre-images, which
+`indexes.ensure_indexes` turns on at startup where the server supports them
+(MongoDB 6.0 and later). The feed itself only reads.
+
+Configuration is read from the environment:
+
+    FEED_BUFFER_SIZE         recent events each worker keeps for reconnecting clients (1000)
+    FEED_QUEUE_SIZE          events a subscriber may fall behind before it is disconnected (1000)
+    FEED_KEEPALIVE_SECONDS   idle time after which a comment keeps the connection open (15)
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from itertools import islice
+from typing import Any, AsyncIterator, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+import orjson
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.errors import PyMongoError
+
+FEED_BUFFER_SIZE = int(os.getenv('FEED_BUFFER_SIZE', '1000'))
+FEED_QUEUE_SIZE = int(os.getenv('FEED_QUEUE_SIZE', '1000'))
+FEED_KEEPALIVE_SECONDS = float(os.getenv('FEED_KEEPALIVE_SECONDS', '15'))
+
+# Fields of a post sent with its events
+POST_FIELDS = ("post_id", "title", "content", "user_id")
+
+EVENT_TYPES = {"insert": "create", "update": "update", "replace": "update", "delete": "delete"}
+
+# Only post changes are watched, trimmed to the fields sent to clients before they leave Mongo.
+# Every write through the API increments the version, so an update that leaves it alone has only
+# changed how a post is stored, as migrate_ids.py does, and clients have nothing to see.
+PIPELINE = [
+    {"$match": {
+        "operationType": {"$in": list(EVENT_TYPES)},
+        "$or": [{"operationType": {"$ne": "update"}}, {"updateDescription.updatedFields.version": {"$exists": True}}],
+    }},
+    {"$project": {
+        "operationType": 1,
+        **{f"fullDocument.{field}": 1 for field in POST_FIELDS},
+        "fullDocumentBeforeChange.post_id": 1,
+    }},
+]
+
+logger = logging.getLogger(__name__)
+
+class FeedEvent(NamedTuple):
+    id: str
+    type: str
+    data: Dict[str, Any]
+
+def to_event(change: Dict[str, Any]) -> FeedEvent:
+    """Turn a change stream document into the event sent to clients."""
+    post = change.get("fullDocument")
+    before = change.get("fullDocumentBeforeChange") or {}
+    # An updated post deleted before its lookup has no full document
+    post_id = (post or before).get("post_id")
+    data = {"post_id": post_id}
+    if change["operationType"] != "delete":
+        data["post"] = post
+    return FeedEvent(change["_id"]["_data"], EVENT_TYPES[change["operationType"]], data)
+
+def format_event(event: FeedEvent) -> bytes:
+    """Encode an event in the text/event-stream format."""
+    id_line = f"id: {event.id}\n" if event.id else ""
+    return f"{id_line}event: {event.type}\n".encode() + b"data: " + orjson.dumps(event.data) + b"\n\n"
+
+class Subscription:
+    """
+    One client's view of the feed.
+
+    Events reach it in three ways: replayed from the worker's buffer, read
+    from a change stream of its own while catching up after a reconnect, and
+    live from its queue. `last_seq` and `_seen` keep an event that arrives by
+    two of them from being sent twice.
+    """
+
+    def __init__(self, feed: "PostFeed", queue_size: int):
+        self.feed = feed
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.backlog: Deque[FeedEvent] = deque()
+        self.resume_token: Optional[str] = None
+        self.last_seq = 0
+        self.closed = False
+        self._stream = None
+        self._seen: Dict[str, None] = {}
+        self._seen_limit = queue_size
+
+    async def next(self, timeout: float) -> Optional[FeedEvent]:
+        """
+        Wait for the next event.
+
+        Returns:
+            The event, or None if there was none within `timeout` seconds or
+            the subscription was closed, which `closed` tells apart.
+        """
+        if self.backlog:
+            return self.backlog.popleft()
+        if self.resume_token is not None:
+            event = await self._catch_up()
+            if event is not None:
+                return event
+            if self.backlog:
+                return self.backlog.popleft()
+        while not self.closed:
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                return None
+            if item is None:
+                self.closed = True
+                return None
+            seq, event = item
+            if seq <= self.last_seq or event.id in self._seen:
+                continue
+            self.last_seq = seq
+            return event
+        return None
+
+    async def _catch_up(self) -> Optional[FeedEvent]:
+        """Return the next event missed since `resume_token`, or None once the shared stream has caught up."""
+        try:
+            if self._stream is None:
+                self._stream = self.feed.watch(resume_after={"_data": self.resume_token})
+            change = await self._stream.try_next()
+        except PyMongoError:
+            self._end_catch_up()
+            return FeedEvent("", "reset", {})
+        if change is None:
+            self._end_catch_up()
+            return None
+        event = to_event(change)
+        seq = self.feed.seq_of(event.id)
+        if seq is not None:
+            # The shared stream has this event, so it and the rest are replayed
+            # from the buffer up to the point the queue starts at
+            self.backlog.extend(self.feed.events_between(seq - 1, self.last_seq))
+            self.last_seq = max(self.last_seq, seq - 1)
+            self._end_catch_up()
+            return None
+        self._seen[event.id] = None
+        if len(self._seen) > self._seen_limit:
+            del self._seen[next(iter(self._seen))]
+        return event
+
+    def _end_catch_up(self) -> None:
+        self.resume_token = None
+        if self._stream is not None:
+            self.feed.close_later(self._stream)
+            self._stream = None
+
+    def drop(self) -> None:
+        """Disconnect the subscriber, discarding the events it has not read yet."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    def close(self) -> None:
+        """Stop receiving events. Safe to call from a cancelled task, since it does not wait."""
+        self.closed = True
+        self.feed.unsubscribe(self)
+        self._end_catch_up()
+
+class PostFeed:
+    """
+    The post change stream of one worker and its subscribers.
+
+    Every published event gets the next sequence number. The replay buffer
+    holds the latest events in order, and `_index` maps their IDs to their
+    sequence numbers.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection, buffer_size: int = FEED_BUFFER_SIZE, queue_size: int = FEED_QUEUE_SIZE):
+        self.collection = collection
+        self.queue_size = queue_size
+        self._subscriptions: Set[Subscription] = set()
+        self._buffer: Deque[Tuple[int, FeedEvent]] = deque(maxlen=buffer_size)
+        self._index: Dict[str, int] = {}
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._closing: Set[asyncio.Task] = set()
+
+    def watch(self, resume_after: Optional[Dict[str, str]] = None):
+        """Open a change stream of post changes, from now or after a resume token."""
+        return self.collection.watch(
+            PIPELINE,
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=resume_after,
+        )
+
+    async def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """
+        Add a subscriber, starting the shared change stream if it is not running.
+
+        Args:
+            last_event_id (Optional[str]): The last event the client received, to resume after.
+
+        Returns:
+            Subscription: The new subscription.
+
+        Raises:
+            OperationFailure: If the server does not support change streams.
+        """
+        if self._task is None:
+            await self._start()
+        # Nothing below awaits, so no event is published while the subscriber is set up
+        subscription = Subscription(self, self.queue_size)
+        subscription.last_seq = self._seq
+        if last_event_id:
+            seq = self._index.get(last_event_id)
+            if seq is not None:
+                subscription.backlog.extend(self.events_between(seq, self._seq))
+            else:
+                subscription.resume_token = last_event_id
+        self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._subscriptions.discard(subscription)
+
+    def seq_of(self, event_id: str) -> Optional[int]:
+        """Return the sequence number of a buffered event, or None if it is not buffered."""
+        return self._index.get(event_id)
+
+    def events_between(self, after: int, upto: int) -> List[FeedEvent]:
+        """Return the buffered events with sequence numbers in (after, upto]."""
+        if not self._buffer or upto <= after:
+            return []
+        first = self._buffer[0][0]
+        return [event for _, event in islice(self._buffer, max(0, after + 1 - first), max(0, upto + 1 - first))]
+
+    def publish(self, event: FeedEvent) -> None:
+        """Buffer an event and hand it to every subscriber, disconnecting those that are too far behind."""
+        self._seq += 1
+        if len(self._buffer) == self._buffer.maxlen:
+            _, oldest = self._buffer[0]
+            self._index.pop(oldest.id, None)
+        self._buffer.append((self._seq, event))
+        self._index[event.id] = self._seq
+        for subscription in list(self._subscriptions):
+            try:
+                subscription.queue.put_nowait((self._seq, event))
+            except asyncio.QueueFull:
+                self.unsubscribe(subscription)
+                subscription.drop()
+
+    async def _start(self) -> None:
+        async with self._lock:
+            if self._task is not None:
+                return
+            stream = self.watch()
+            try:
+                # The change stream is only opened by its first read
+                change = await stream.try_next()
+            except PyMongoError:
+                await stream.close()
+                raise
+            if change is not None:
+                self.publish(to_event(change))
+            self._task = asyncio.create_task(self._run(stream))
+
+    async def _run(self, stream) -> None:
+        try:
+            async with stream:
+                async for change in stream:
+                    self.publish(to_event(change))
+        except PyMongoError:
+            # Subscribers reconnect with their last event ID and catch up, and the next one restarts the stream
+            logger.exception("Post change stream failed")
+        finally:
+            self._task = None
+            for subscription in list(self._subscriptions):
+                self.unsubscribe(subscription)
+                subscription.drop()
+
+    def close_later(self, stream) -> None:
+        """Close a change stream in the background, for callers that cannot wait."""
+        task = asyncio.get_running_loop().create_task(stream.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def close(self) -> None:
+        """Stop the shared change stream and disconnect every subscriber."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await asyncio.gather(*self._closing, return_exceptions=True)
+
+async def event_stream(subscription: Subscription, keepalive_seconds: float = FEED_KEEPALIVE_SECONDS) -> AsyncIterator[bytes]:
+    """Encode a subscription as a text/event-stream body, with a comment whenever it is idle."""
+    try:
+        # Sent at once, so the client knows it is subscribed before the first event
+        yield b": subscribed\n\n"
+        while True:
+            event = await subscription.next(keepalive_seconds)
+            if subscription.closed:
+                return
+            yield b": keepalive\n\n" if event is None else format_event(event)
+    finally:
+        subscription.close()
@@ -0,0 +1,70 @@
+"""
+Sparse fieldsets for read endpoints.
+
+`fields=post_id,title` limits every returned document to the listed fields.
+The names are checked against the endpoint's response model and turned into
+the Mongo projection, so omitted fields are neither read from the documents
+nor sent over the wire, decoded and encoded again. Without `fields` the full
+documents are returned, as before.
+"""
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Type
+
+from fastapi import HTTPException, Query
+from pydantic import BaseModel
+
+Fields = Optional[Tuple[str, ...]]
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel], exclude: Iterable[str] = ()) -> Fields:
+    """
+    Parse a comma-separated fields parameter.
+
+    Args:
+        fields (Optional[str]): The raw parameter, such as "post_id,title".
+        model (Type[BaseModel]): The response model whose fields may be selected.
+        exclude (Iterable[str]): Model fields that cannot be selected.
+
+    Returns:
+        The selected field names, sorted and without duplicates, or None to return every field.
+
+    Raises:
+        HTTPException: If no field or an unknown field is named.
+    """
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",")} - {""}
+    allowed = [name for name in model.model_fields if name not in set(exclude)]
+    unknown = sorted(names - set(allowed))
+    if not names or unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid fields: {', '.join(unknown) or 'none given'}. Allowed fields are {', '.join(allowed)}",
+        )
+    return tuple(sorted(names))
+
+def fieldset(model: Type[BaseModel], exclude: Iterable[str] = ()) -> Callable[[Optional[str]], Fields]:
+    """Build a dependency that reads the fields query parameter for a response model."""
+    exclude = tuple(exclude)
+    allowed = ", ".join(name for name in model.model_fields if name not in exclude)
+
+    def dependency(fields: Optional[str] = Query(None, description=f"Comma-separated fields to return, out of {allowed}")) -> Fields:
+        return parse_fields(fields, model, exclude)
+
+    return dependency
+
+def require(fields: Fields, *names: str) -> Fields:
+    """Add fields the server needs to a selection, such as user_id for expand=user."""
+    if fields is None:
+        return None
+    return tuple(sorted({*fields, *names}))
+
+def projection_for(fields: Fields, default: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the Mongo projection of the selected fields, or the default projection if none were selected."""
+    if fields is None:
+        return default
+    return {"_id": 0, **{name: 1 for name in fields}}
+
+def select(doc: Dict[str, Any], fields: Fields) -> Dict[str, Any]:
+    """Keep only the selected fields of a document that was loaded in full."""
+    if fields is None:
+        return doc
+    return {name: doc[name] for name in fields if name in doc}
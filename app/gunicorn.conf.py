@@ -0,0 +1,51 @@
+"""
+Gunicorn settings for running the API in production.
+
+    gunicorn main:app --config gunicorn.conf.py
+
+Every setting can be overridden from the environment:
+
+    PORT                      port to listen on (80)
+    WEB_CONCURRENCY           worker processes (one per CPU)
+    KEEPALIVE_SECONDS         idle keep-alive timeout of client connections (5)
+    BACKLOG                   pending connections queued by the kernel (2048)
+    GRACEFUL_TIMEOUT_SECONDS  time a worker gets to drain on shutdown (30)
+    WORKER_TIMEOUT_SECONDS    time before a silent worker is restarted (60)
+    ACCESS_LOG                set to 1 to log every request to stdout
+    PROMETHEUS_MULTIPROC_DIR  directory where workers share their metrics
+
+Each worker opens its own Mongo pool, so the server holds up to
+WEB_CONCURRENCY * MONGO_MAX_POOL_SIZE connections.
+"""
+import glob
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '80')}"
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = "workers.ProductionWorker"
+
+keepalive = int(os.getenv('KEEPALIVE_SECONDS', '5'))
+backlog = int(os.getenv('BACKLOG', '2048'))
+graceful_timeout = int(os.getenv('GRACEFUL_TIMEOUT_SECONDS', '30'))
+timeout = int(os.getenv('WORKER_TIMEOUT_SECONDS', '60'))
+
+# Access logs cost a write per request, so they are off unless asked for
+accesslog = "-" if os.getenv('ACCESS_LOG') == '1' else None
+errorlog = "-"
+
+def on_starting(server):
+    # Tell the workers how many of them there are, --workers included, so that the cache is not per worker
+    os.environ['WEB_CONCURRENCY'] = str(server.cfg.workers)
+    # Drop metrics files left over from a previous run
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+def child_exit(server, worker):
+    # Stop reporting the in-flight gauge of a worker that exited
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,116 @@
+"""
+Public IDs of users and posts, and how they are stored.
+
+New IDs are minted by the strategy in ID_STRATEGY:
+
+    uuid7   UUIDv7, stored as 16 bytes of BSON binary (default)
+    uuid1   UUIDv1, stored as its 36-character string, as before
+
+A UUIDv7 starts with the millisecond it was minted, so later IDs sort after
+earlier ones and every insert lands at the right edge of the unique index,
+which keeps the index compact and its hot pages in cache. uuid1 strings start
+with the low bits of their timestamp, so they land all over the index. The
+binary form is also less than half the size of the string.
+
+The API always shows IDs as strings. The Mongo client decodes binary UUIDs
+back to their string form (`MONGO_CODEC_OPTIONS`), and the repositories
+encode the IDs they query and write with `to_db`.
+
+While some documents still hold IDs in the other form, ID_LEGACY_LOOKUP
+matches every ID in both forms, with a two-value $in. `python migrate_ids.py`
+rewrites stored IDs into the form of the current strategy; once it reports
+nothing left, set ID_LEGACY_LOOKUP=0.
+
+Configuration is read from the environment:
+
+    ID_STRATEGY        uuid7 or uuid1 (uuid7)
+    ID_LEGACY_LOOKUP   set to 0 once every stored ID has the strategy's form (1)
+"""
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from bson.binary import Binary, UuidRepresentation
+from bson.codec_options import TypeDecoder, TypeRegistry
+
+ID_STRATEGY = os.getenv('ID_STRATEGY', 'uuid7')
+ID_LEGACY_LOOKUP = os.getenv('ID_LEGACY_LOOKUP', '1') == '1'
+
+if ID_STRATEGY not in ('uuid7', 'uuid1'):
+    raise ValueError(f"Unknown ID_STRATEGY: {ID_STRATEGY}")
+
+class UUIDString(TypeDecoder):
+    """Decodes binary UUIDs to the string form the API uses."""
+
+    bson_type = uuid.UUID
+
+    def transform_bson(self, value: uuid.UUID) -> str:
+        return str(value)
+
+# Options for the Mongo client, so that every document read has string IDs
+MONGO_CODEC_OPTIONS = {"uuidRepresentation": "standard", "type_registry": TypeRegistry([UUIDString()])}
+
+_last_ms = 0
+_counter = 0
+
+def uuid7() -> uuid.UUID:
+    """
+    Return a new UUIDv7.
+
+    The 12 bits after the timestamp count the IDs minted in the same
+    millisecond, starting from a random value, so IDs from one process
+    always increase.
+    """
+    global _last_ms, _counter
+    ms = time.time_ns() // 1_000_000
+    if ms > _last_ms:
+        _last_ms, _counter = ms, int.from_bytes(os.urandom(2), "big") & 0x7FF
+    else:
+        # Same millisecond, or the clock went back: count on from the last ID
+        _counter += 1
+        if _counter > 0xFFF:
+            _last_ms, _counter = _last_ms + 1, 0
+    rand_b = int.from_bytes(os.urandom(8), "big") & 0x3FFF_FFFF_FFFF_FFFF
+    return uuid.UUID(int=(_last_ms << 80) | (0x7 << 76) | (_counter << 64) | (0b10 << 62) | rand_b)
+
+def new_id() -> str:
+    """Mint a new ID with the configured strategy, in its API form."""
+    return str(uuid7() if ID_STRATEGY == 'uuid7' else uuid.uuid1())
+
+def _as_uuid(id: str) -> Optional[uuid.UUID]:
+    """Parse an ID in the canonical string form of a UUID, or return None."""
+    try:
+        value = uuid.UUID(id)
+    except (ValueError, TypeError, AttributeError):
+        return None
+    # Other spellings (upper case, braces, no dashes) were never stored, so they match nothing
+    return value if str(value) == id else None
+
+def to_db(id: str, strategy: Optional[str] = None) -> Any:
+    """Return the form an ID is stored in. IDs that are not UUIDs are stored as they are."""
+    value = _as_uuid(id) if (strategy or ID_STRATEGY) == 'uuid7' else None
+    return Binary.from_uuid(value, UuidRepresentation.STANDARD) if value is not None else id
+
+def _forms(id: str) -> List[Any]:
+    value = _as_uuid(id) if ID_LEGACY_LOOKUP else None
+    if value is None:
+        return [to_db(id)]
+    return [Binary.from_uuid(value, UuidRepresentation.STANDARD), id]
+
+def match(id: str) -> Any:
+    """Return a query value matching an ID in the stored form, and in the legacy form with ID_LEGACY_LOOKUP."""
+    forms = _forms(id)
+    return forms[0] if len(forms) == 1 else {"$in": forms}
+
+def match_many(ids: Iterable[str]) -> Dict[str, List[Any]]:
+    """Return a query value matching any of the IDs, like `match`."""
+    return {"$in": [form for id in ids for form in _forms(id)]}
+
+def encode(doc: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """Return a copy of a document to write, with its ID fields in the stored form."""
+    return {field: to_db(value) if field in fields and isinstance(value, str) else value for field, value in doc.items()}
+
+def encode_filter(query: Dict[str, Any], fields: Sequence[str]) -> Dict[str, Any]:
+    """Return a copy of a filter whose equality conditions on ID fields match both forms, like `match`."""
+    return {field: match(value) if field in fields and isinstance(value, str) else value for field, value in query.items()}
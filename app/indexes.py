@@ -0,0 +1,184 @@
+"""
+Index bootstrap and query-plan verification.
+
+The app creates the indexes below at startup, and sets the collection
+options next to them. Run this module directly to create them by hand or to
+check that every query shape the routers issue is served by an index,
+without an in-memory sort:
+
+    python indexes.py --create
+    python indexes.py --verify
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Any, Dict, List, Tuple
+
+from datetime import datetime
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+
+from ids import match, match_many
+from jobs import JOB_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Indexes declared per collection
+INDEXES = {
+    "users": [
+        IndexModel([("user_id", ASCENDING)], name="user_id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "posts": [
+        IndexModel([("post_id", ASCENDING)], name="post_id_unique", unique=True),
+        IndexModel([("title", ASCENDING)], name="title_unique", unique=True),
+        # Serves "posts by user" pages: equality on user_id, then a range and sort on _id
+        IndexModel([("user_id", ASCENDING), ("_id", ASCENDING)], name="user_id__id"),
+        # Title matches rank above content matches, like the in-memory search backend
+        IndexModel([("title", TEXT), ("content", TEXT)], name="title_content_text", weights={"title": 5, "content": 1}),
+    ],
+    "jobs": [
+        # Serves the search for pending and stale jobs at startup
+        IndexModel([("status", ASCENDING), ("updated_at", ASCENDING)], name="status_updated_at"),
+        # Removes finished jobs once they have been kept for JOB_RETENTION_SECONDS
+        IndexModel([("finished_at", ASCENDING)], name="finished_at_ttl", expireAfterSeconds=JOB_RETENTION_SECONDS),
+    ],
+}
+
+# Options set on each collection with collMod; a server that refuses one runs without it
+COLLECTION_OPTIONS = {
+    # Deletes record the deleted post, so that feed delete events carry its post_id (MongoDB 6.0 and later)
+    "posts": {"changeStreamPreAndPostImages": {"enabled": True}},
+}
+
+# Indexes that earlier versions created and that a declared index now makes redundant
+OBSOLETE_INDEXES = {
+    "posts": ["user_id"],
+}
+
+# Sample IDs for the query shapes, queried in the forms the repositories send
+SAMPLE_ID, OTHER_ID = "00000000-0000-7000-8000-000000000000", "00000000-0000-7000-8000-000000000001"
+
+# Every (collection, filter, sort) the routers send to Mongo, with sample values
+QUERY_SHAPES: List[Tuple[str, Dict[str, Any], List[Tuple[str, int]]]] = [
+    ("users", {"user_id": match(SAMPLE_ID)}, []),
+    ("users", {"user_id": match_many([SAMPLE_ID, OTHER_ID])}, []),
+    ("users", {}, [("_id", ASCENDING)]),
+    ("users", {"_id": {"$gt": ObjectId()}}, [("_id", ASCENDING)]),
+    ("posts", {"post_id": match(SAMPLE_ID)}, []),
+    ("posts", {"post_id": match_many([SAMPLE_ID, OTHER_ID])}, []),
+    ("posts", {"user_id": match(SAMPLE_ID)}, []),
+    ("posts", {"user_id": match(SAMPLE_ID)}, [("_id", ASCENDING)]),
+    ("posts", {"user_id": match(SAMPLE_ID), "_id": {"$gt": ObjectId()}}, [("_id", ASCENDING)]),
+    ("posts", {"user_id": match_many([SAMPLE_ID, OTHER_ID])}, [("_id", ASCENDING)]),
+    ("posts", {}, [("_id", ASCENDING)]),
+    ("posts", {"_id": {"$gt": ObjectId()}}, [("_id", ASCENDING)]),
+    ("posts", {"_id": {"$in": [ObjectId(), ObjectId()]}}, []),
+    ("posts", {"$text": {"$search": "sample"}}, []),
+    ("posts", {"$text": {"$search": "sample"}, "user_id": match(SAMPLE_ID)}, []),
+    ("stats", {"_id": f"users:{SAMPLE_ID}"}, []),
+    ("stats", {"_id": {"$regex": "^users:"}, "stale": True}, []),
+    ("jobs", {"$or": [{"status": "pending"}, {"status": "running", "updated_at": {"$lt": datetime(2000, 1, 1)}}]}, []),
+]
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> None:
+    """
+    Create all declared indexes, drop obsolete ones and set the collection options.
+
+    Indexes that already exist are left as they are, and setting an option
+    again changes nothing, so every worker can run this as it starts.
+    """
+    for collection, models in INDEXES.items():
+        await db[collection].create_indexes(models)
+    for collection, names in OBSOLETE_INDEXES.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+    for collection, options in COLLECTION_OPTIONS.items():
+        try:
+            await db.command("collMod", collection, **options)
+        except OperationFailure as e:
+            logger.info("Options %s not set on %s: %s", options, collection, e)
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Collect every stage name in an explain plan tree."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+async def _find_plans_with(db: AsyncIOMotorDatabase, stage: str) -> List[str]:
+    """Explain every query shape and describe the ones whose winning plan contains the given stage."""
+    offenders = []
+    for collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        if stage in _plan_stages(explain["queryPlanner"]["winningPlan"]):
+            offenders.append(f"{collection}.find({query}, sort={sort})")
+    return offenders
+
+async def find_collscans(db: AsyncIOMotorDatabase) -> List[str]:
+    """
+    Explain every query shape and report the ones that scan the whole collection.
+
+    Returns:
+        A description of each query shape whose winning plan is a COLLSCAN.
+    """
+    return await _find_plans_with(db, "COLLSCAN")
+
+async def find_blocking_sorts(db: AsyncIOMotorDatabase) -> List[str]:
+    """
+    Explain every query shape and report the ones sorted in memory.
+
+    A SORT stage has to read every match before returning the first one, so
+    its cost grows with the number of matches instead of the page size.
+
+    Returns:
+        A description of each query shape whose winning plan has a SORT stage.
+    """
+    return await _find_plans_with(db, "SORT")
+
+async def main(args: argparse.Namespace) -> int:
+    from dev_init import mongo_client, DATABASE_NAME
+
+    client = mongo_client()
+    db = client[DATABASE_NAME]
+    try:
+        if args.create:
+            await ensure_indexes(db)
+            print("Indexes are up to date")
+        if args.verify:
+            collscans = await find_collscans(db)
+            for offender in collscans:
+                print(f"COLLSCAN: {offender}")
+            sorts = await find_blocking_sorts(db)
+            for offender in sorts:
+                print(f"SORT: {offender}")
+            if collscans or sorts:
+                return 1
+            print(f"All {len(QUERY_SHAPES)} query shapes use an index for filtering and sorting")
+        return 0
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--create", action="store_true", help="Create the declared indexes")
+    parser.add_argument("--verify", action="store_true", help="Fail if any query shape is a COLLSCAN")
+    args = parser.parse_args()
+    if not (args.create or args.verify):
+        parser.error("pass --create and/or --verify")
+    sys.exit(asyncio.run(main(args)))
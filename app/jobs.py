@@ -0,0 +1,191 @@
+"""
+Background jobs that delete the posts of deleted users.
+
+Deleting a user deletes their posts too. A user with few posts has them
+removed inline: they are found on the (user_id, _id) index and deleted by
+_id with one delete_many. For a user with more posts than that, the DELETE
+request only starts a job and returns, and the job deletes the rest in
+chunks, pausing between chunks so that other writes to the posts collection
+are not starved.
+
+Job state lives in the `jobs` collection, so GET /jobs/{job_id} answers from
+any worker. A job runs as a task in the worker that started it. A worker that
+shuts down hands its unfinished jobs back as pending, and a job whose worker
+died without doing so is taken over once its heartbeat is stale. Either way,
+the next worker to start picks it up. Deleting a chunk is idempotent, so
+resuming a job is safe.
+
+Configuration is read from the environment:
+
+    CASCADE_INLINE_POSTS      posts deleted inside the DELETE request (1000)
+    JOB_CHUNK_SIZE            posts deleted per chunk by a job (1000)
+    JOB_CHUNK_PAUSE_SECONDS   pause between chunks (0.05)
+    JOB_STALE_SECONDS         heartbeat age after which a running job is taken over (60)
+    JOB_RETENTION_SECONDS     how long finished jobs are kept (604800)
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from ids import new_id
+from repositories.posts import PostRepository
+
+CASCADE_INLINE_POSTS = int(os.getenv('CASCADE_INLINE_POSTS', '1000'))
+JOB_CHUNK_SIZE = int(os.getenv('JOB_CHUNK_SIZE', '1000'))
+JOB_CHUNK_PAUSE_SECONDS = float(os.getenv('JOB_CHUNK_PAUSE_SECONDS', '0.05'))
+JOB_STALE_SECONDS = float(os.getenv('JOB_STALE_SECONDS', '60'))
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', str(7 * 24 * 3600)))
+
+# Fields returned to API clients
+JOB_PROJECTION = {
+    "_id": 0, "job_id": 1, "type": 1, "status": 1, "user_ids": 1, "deleted_posts": 1,
+    "error": 1, "created_at": 1, "updated_at": 1, "finished_at": 1,
+}
+
+CASCADE_DELETE_POSTS = "cascade_delete_posts"
+
+logger = logging.getLogger(__name__)
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+class JobRunner:
+    """
+    Starts, runs and resumes cascade delete jobs for one worker.
+
+    The running tasks are kept in `_tasks`, both so that they are not garbage
+    collected while they run and so that `close` can stop them.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        posts: PostRepository,
+        inline_limit: int = CASCADE_INLINE_POSTS,
+        chunk_size: int = JOB_CHUNK_SIZE,
+        pause_seconds: float = JOB_CHUNK_PAUSE_SECONDS,
+        stale_seconds: float = JOB_STALE_SECONDS,
+    ):
+        self.jobs = db['jobs']
+        self.posts = posts
+        self.inline_limit = inline_limit
+        self.chunk_size = chunk_size
+        self.pause_seconds = pause_seconds
+        self.stale_seconds = stale_seconds
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    async def delete_posts_of(self, user_ids: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Delete the posts of users that were just deleted.
+
+        Up to `inline_limit` posts are deleted right away. If the users have
+        more, a job is started for the rest.
+
+        Returns:
+            The new job, or None if every post was deleted inline.
+        """
+        if not user_ids:
+            return None
+        deleted, more = await self.posts.delete_by_users(user_ids, self.inline_limit)
+        if not more:
+            return None
+        return await self._start(user_ids, deleted)
+
+    async def _start(self, user_ids: List[str], deleted: int) -> Dict[str, Any]:
+        now = _now()
+        job_id = new_id()
+        job = {
+            "_id": job_id,
+            "job_id": job_id,
+            "type": CASCADE_DELETE_POSTS,
+            "status": "running",
+            "user_ids": user_ids,
+            "deleted_posts": deleted,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+        }
+        await self.jobs.insert_one(job)
+        self._spawn(job_id, user_ids)
+        return {field: value for field, value in job.items() if field != "_id"}
+
+    def _spawn(self, job_id: str, user_ids: List[str]) -> None:
+        task = asyncio.create_task(self._run(job_id, user_ids))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    async def _run(self, job_id: str, user_ids: List[str]) -> None:
+        """Delete the users' posts a chunk at a time, recording progress and a heartbeat after each chunk."""
+        try:
+            more = True
+            while more:
+                deleted, more = await self.posts.delete_by_users(user_ids, self.chunk_size)
+                await self.jobs.update_one(
+                    {"_id": job_id},
+                    {"$inc": {"deleted_posts": deleted}, "$set": {"updated_at": _now()}},
+                )
+                if more:
+                    await asyncio.sleep(self.pause_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            await self._finish(job_id, "failed", str(e))
+        else:
+            await self._finish(job_id, "succeeded")
+
+    async def _finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        now = _now()
+        await self.jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "error": error, "updated_at": now, "finished_at": now}},
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the job with the given ID, or None."""
+        return await self.jobs.find_one({"_id": job_id}, JOB_PROJECTION)
+
+    async def resume(self) -> int:
+        """
+        Take over pending jobs and running jobs with a stale heartbeat.
+
+        Each job is claimed with one atomic update, so when several workers
+        start together every job is resumed by exactly one of them.
+
+        Returns:
+            The number of jobs resumed.
+        """
+        resumed = 0
+        while True:
+            now = _now()
+            job = await self.jobs.find_one_and_update(
+                {"$or": [
+                    {"status": "pending"},
+                    {"status": "running", "updated_at": {"$lt": now - timedelta(seconds=self.stale_seconds)}},
+                ]},
+                {"$set": {"status": "running", "updated_at": now}},
+                projection={"user_ids": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                return resumed
+            self._spawn(job["_id"], job["user_ids"])
+            resumed += 1
+
+    async def close(self) -> None:
+        """Stop this worker's jobs and mark them pending so that the next worker to start resumes them."""
+        job_ids, tasks = list(self._tasks), list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if job_ids:
+            await self.jobs.update_many(
+                {"_id": {"$in": job_ids}, "status": "running"},
+                {"$set": {"status": "pending", "updated_at": _now()}},
+            )
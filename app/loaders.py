@@ -0,0 +1,77 @@
+"""
+Request-scoped loaders for embedding related documents.
+
+A loader batches the IDs a response needs into one `$in` query and memoizes
+the results for the rest of the request, so expanding a page of N posts
+costs one extra query instead of N.
+"""
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+from pagination import STREAM_BATCH_SIZE
+from repositories.users import UserRepository
+
+# Entries kept by a loader; streams can reference every user, so the memo is
+# dropped when it grows past this instead of holding the whole collection
+MAX_MEMO_ENTRIES = 10000
+
+class UserLoader:
+    """
+    Batches and memoizes user lookups within one request.
+
+    Missing users are memoized as None, so an unknown author is looked up once.
+    """
+
+    def __init__(self, users: UserRepository):
+        self.users = users
+        self._memo: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    async def load_many(self, ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Return the users with the given IDs (None for missing ones), querying only for IDs not seen yet."""
+        ids = list(dict.fromkeys(ids))
+        missing = [id for id in ids if id not in self._memo]
+        if missing:
+            if len(self._memo) + len(missing) > MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            found = await self.users.find_many(missing)
+            for id in missing:
+                self._memo[id] = found.get(id)
+        return {id: self._memo.get(id) for id in ids}
+
+    async def load(self, id: str) -> Optional[Dict[str, Any]]:
+        """Return one user, reading through the entity cache on a memo miss."""
+        if id not in self._memo:
+            self._memo[id] = await self.users.find_by_id(id)
+        return self._memo[id]
+
+    async def embed_one(self, post: Dict[str, Any]) -> Optional[int]:
+        """Set `user` on a single post and return the author's version, or None if the author is missing."""
+        user = await self.load(post["user_id"])
+        post["user"] = _public(user)
+        return user.get("version", 0) if user is not None else None
+
+    async def embed(self, posts: List[Dict[str, Any]]) -> None:
+        """Set `user` on every post to its author, without the author's version."""
+        users = await self.load_many(post["user_id"] for post in posts)
+        for post in posts:
+            post["user"] = _public(users[post["user_id"]])
+
+    async def embed_stream(self, posts: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """Embed authors into a stream of posts, one batched lookup per STREAM_BATCH_SIZE posts."""
+        batch: List[Dict[str, Any]] = []
+        async for post in posts:
+            batch.append(post)
+            if len(batch) == STREAM_BATCH_SIZE:
+                await self.embed(batch)
+                for item in batch:
+                    yield item
+                batch = []
+        if batch:
+            await self.embed(batch)
+            for item in batch:
+                yield item
+
+def _public(user: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Drop the internal version field from a user document."""
+    if user is None:
+        return None
+    return {key: value for key, value in user.items() if key != "version"}
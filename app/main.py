@@ -1,13 +1,78 @@
 # Import fastapi modules
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+# Import database client
+from dev_init import mongo_client, DATABASE_NAME
+from indexes import ensure_indexes
+from cache import cache_from_env
+from search import search_from_env
+from jobs import JobRunner
+from coalescer import coalescers_from_env
+from feed import PostFeed
+from repositories.posts import PostRepository
+from repositories.users import UserRepository
+from repositories.stats import StatsRepository
+from metrics import METRICS_ENABLED, MetricsMiddleware
+from compression import CompressionMiddleware, compression_from_env
+from admission import ADMISSION_CONTROL, AdmissionMiddleware
+from profiling import PROFILING_ENABLED, ProfilingMiddleware
+from routing import READ_ROUTING, ReadRoutingMiddleware
+
 # Import routes
 from routes.users import router as users_router
 from routes.posts import router as posts_router
+from routes.admin import router as admin_router
+from routes.jobs import router as jobs_router
+from routes.stats import router as stats_router
+from routes.metrics import router as metrics_router
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open one pooled client per worker and share it with every router
+    client = mongo_client()
+    app.state.mongo_client = client
+    app.state.db = client[DATABASE_NAME]
+    await ensure_indexes(app.state.db)
+    # Count existing users and posts once, before the writes start keeping the counters up to date;
+    # of the workers starting together, only the one that takes the reconcile lock counts
+    stats = StatsRepository(app.state.db)
+    if not await stats.reconciled():
+        await stats.reconcile()
+    app.state.cache = cache_from_env()
+    app.state.search = search_from_env(app.state.db['posts'])
+    await app.state.search.rebuild()
+    app.state.jobs = JobRunner(app.state.db, PostRepository(app.state.db, app.state.cache, app.state.search))
+    await app.state.jobs.resume()
+    app.state.coalescers = coalescers_from_env(
+        UserRepository(app.state.db, app.state.cache),
+        PostRepository(app.state.db, app.state.cache, app.state.search),
+    )
+    # The change stream behind GET /posts/stream is only opened once a client subscribes
+    app.state.feed = PostFeed(app.state.db['posts'])
+    yield
+    # End open event streams, so their clients reconnect to another worker
+    await app.state.feed.close()
+    # Write creates still waiting for their batch before anything they use is closed
+    for coalescer in app.state.coalescers.values():
+        await coalescer.close()
+    # Hand unfinished jobs back before the cache and client they use are closed
+    await app.state.jobs.close()
+    if app.state.cache is not None:
+        await app.state.cache.close()
+    client.close()
 
 # Init fastapi app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Add read routing first, so that it only wraps requests that were admitted
+if READ_ROUTING:
+    app.add_middleware(ReadRoutingMiddleware)
+
+# Add admission control next, so that it is inside CORS and its rejections still get CORS headers
+if ADMISSION_CONTROL:
+    app.add_middleware(AdmissionMiddleware)
 
 # Add cors middleware
 app.add_middleware(
@@ -16,8 +81,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browser clients need to read the operation time to send it back
+    expose_headers=["X-Operation-Time"],
 )
 
+# Add compression middleware inside the metrics middleware, so that response sizes are recorded as sent
+COMPRESSION_ENCODINGS = compression_from_env()
+if COMPRESSION_ENCODINGS:
+    app.add_middleware(CompressionMiddleware, encodings=COMPRESSION_ENCODINGS)
+
+# Add profiling middleware inside the metrics middleware, so that profiles cover admission waits and compression
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Add metrics middleware last so that it is outermost and times the whole stack
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 #  Add routes
 app.include_router(users_router, tags=["users"])
 app.include_router(posts_router, tags=["posts"])
+app.include_router(jobs_router, tags=["jobs"])
+app.include_router(stats_router, tags=["stats"])
+app.include_router(admin_router, tags=["admin"])
+app.include_router(metrics_router, tags=["metrics"])
@@ -0,0 +1,194 @@
+"""
+Prometheus instrumentation for HTTP requests and Mongo commands.
+
+`MetricsMiddleware` records request counts, in-flight requests, latency and
+response size, labeled by the route template (`/posts/{post_id}`) rather
+than the raw path so that the number of series stays bounded.
+`CommandMetrics` and `PoolMetrics` are pymongo event listeners that record
+per-collection command durations and the time spent waiting for a pooled
+connection. Everything is served as text on GET /metrics.
+
+Configuration is read from the environment:
+
+    METRICS_ENABLED           set to 0 to turn the middleware and listeners off (1)
+    PROMETHEUS_MULTIPROC_DIR  shared directory for aggregating gunicorn workers
+
+Without PROMETHEUS_MULTIPROC_DIR each worker only reports its own counters,
+so a scrape through a load balancer sees whichever worker answered.
+"""
+import os
+import time
+from typing import Any, Dict, Tuple
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+
+# Labels used for requests that did not match any route or used an unknown
+# method, so scanners probing random paths cannot create new series
+UNMATCHED_ROUTE = "unmatched"
+OTHER_METHOD = "other"
+KNOWN_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled.", ["method", "route", "status"],
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled.", multiprocess_mode="livesum",
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time from receiving a request to sending the last byte of its response.",
+    ["method", "route"], buckets=LATENCY_BUCKETS,
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Size of response bodies.", ["method", "route"], buckets=SIZE_BUCKETS,
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "Round trip time of Mongo commands, as measured by the driver.",
+    ["collection", "command", "outcome"], buckets=MONGO_BUCKETS,
+)
+MONGO_POOL_WAIT = Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting to check a connection out of the pool.",
+    ["outcome"], buckets=MONGO_BUCKETS,
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests rejected by admission control, by request class and reason.",
+    ["request_class", "reason"],
+)
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds", "Time admitted requests waited for a slot.", ["request_class"], buckets=MONGO_BUCKETS,
+)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request metrics per route template.
+
+    The route is read from `scope["route"]`, which FastAPI sets once a request
+    is matched, so it is only known after the request has been handled.
+    Labeled children are looked up once per method, route and status and then
+    reused, which keeps the per-request cost to a few observations.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._children: Dict[Tuple[str, str, int], Tuple[Any, Any, Any]] = {}
+
+    def _metrics_for(self, method: str, template: str, status: int) -> Tuple[Any, Any, Any]:
+        key = (method, template, status)
+        children = self._children.get(key)
+        if children is None:
+            children = (
+                HTTP_REQUESTS.labels(method, template, str(status)),
+                HTTP_LATENCY.labels(method, template),
+                HTTP_RESPONSE_SIZE.labels(method, template),
+            )
+            self._children[key] = children
+        return children
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            template = route.path if route is not None else UNMATCHED_ROUTE
+            method = scope["method"] if scope["method"] in KNOWN_METHODS else OTHER_METHOD
+            requests, latency, response_size = self._metrics_for(method, template, status)
+            requests.inc()
+            latency.observe(elapsed)
+            response_size.observe(size)
+
+def _command_collection(command_name: str, command: Dict[str, Any]) -> str:
+    """Return the collection a command targets, or "" for database and admin commands."""
+    target = command.get("collection") if command_name == "getMore" else command.get(command_name)
+    return target if isinstance(target, str) else ""
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records the duration of every Mongo command per collection and command name.
+
+    Only the succeeded and failed events carry a duration, and only the started
+    event carries the command, so the collection is remembered in between,
+    keyed by connection and request ID.
+    """
+
+    def __init__(self):
+        self._collections: Dict[Tuple[Any, int], str] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        self._collections[(event.connection_id, event.request_id)] = _command_collection(event.command_name, event.command)
+
+    def _record(self, event, outcome: str) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_DURATION.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1_000_000)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._record(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._record(event, "failure")
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Records how long operations wait for a pooled connection.
+
+    A growing wait means requests are queueing for MONGO_MAX_POOL_SIZE
+    connections rather than for the database itself.
+    """
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        if event.duration is not None:
+            MONGO_POOL_WAIT.labels("success").observe(event.duration)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        if event.duration is not None:
+            MONGO_POOL_WAIT.labels("failure").observe(event.duration)
+
+    # The remaining pool events are not recorded
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+    def connection_checked_in(self, event): pass
+
+def mongo_listeners() -> list:
+    """Return the pymongo event listeners to register on the client, if metrics are enabled."""
+    if not METRICS_ENABLED:
+        return []
+    return [CommandMetrics(), PoolMetrics()]
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Return the current metrics in the Prometheus text format, and its content type."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
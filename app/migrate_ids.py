@@ -0,0 +1,127 @@
+"""
+Rewrite stored user and post IDs into the form of ID_STRATEGY.
+
+With ID_STRATEGY=uuid7, every user_id and post_id string that is a UUID is
+rewritten as BSON binary; with uuid1, binary IDs are written back as strings.
+IDs that are not UUIDs are left as they are. The public IDs do not change, so
+clients, caches, ETags and the stats counters are not affected.
+
+The migration runs online, next to the app, which must keep
+ID_LEGACY_LOOKUP=1 until it finishes so that it finds both forms. Documents
+are read in _id order, a batch at a time, and each is rewritten by an update
+that only applies if its IDs are still the ones read, so a write racing the
+migration is never undone; a document skipped that way is picked up by the
+next pass. Passes repeat until one rewrites nothing. The rewrites leave
+`version` alone, so they are not sent to GET /posts/stream subscribers.
+
+    python migrate_ids.py --dry-run            # count what would be rewritten
+    python migrate_ids.py                      # rewrite
+    python migrate_ids.py --batch-size 500 --pause-ms 50
+
+Run `python indexes.py --verify` afterwards, then set ID_LEGACY_LOOKUP=0.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from typing import Any, Dict, Optional, Sequence
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo import UpdateOne
+
+from ids import ID_STRATEGY, to_db
+
+# Fields holding IDs, per collection
+ID_FIELDS = {
+    "users": ("user_id",),
+    "posts": ("post_id", "user_id"),
+}
+
+def stored_form(value: Any, strategy: str) -> Any:
+    """Return the form a stored ID should have under the strategy, as read by a client that decodes binary to UUID."""
+    if strategy == 'uuid7':
+        return to_db(value, strategy) if isinstance(value, str) else value
+    return str(value) if isinstance(value, uuid.UUID) else value
+
+async def migrate_collection(
+    collection: AsyncIOMotorCollection,
+    fields: Sequence[str],
+    strategy: str = ID_STRATEGY,
+    batch_size: int = 1000,
+    pause: float = 0.0,
+    dry_run: bool = False,
+) -> Dict[str, int]:
+    """
+    Rewrite the ID fields of every document in a collection into the strategy's form.
+
+    The collection must decode binary subtype 4 as `uuid.UUID`
+    (uuidRepresentation=standard), without the app's string decoder, so that
+    both stored forms can be told apart.
+
+    Args:
+        collection (AsyncIOMotorCollection): The collection to migrate.
+        fields (Sequence[str]): The fields holding IDs.
+        strategy (str): The ID strategy whose form to write.
+        batch_size (int): Documents read and rewritten per round trip.
+        pause (float): Seconds to sleep between batches, to leave room for the app.
+        dry_run (bool): Count what would be rewritten without writing.
+
+    Returns:
+        Dict[str, int]: The documents rewritten, the documents skipped because
+        a concurrent write got there first, and those holding IDs that are not
+        UUIDs, of the last pass.
+    """
+    # The other form: strings when migrating to binary, binary when migrating to strings
+    legacy_type = "string" if strategy == 'uuid7' else "binData"
+    query = {"$or": [{field: {"$type": legacy_type}} for field in fields]}
+    projection = {field: 1 for field in fields}
+    while True:
+        counts = {"migrated": 0, "raced": 0, "not_uuid": 0}
+        last_id: Optional[Any] = None
+        while True:
+            batch_query = {**query, "_id": {"$gt": last_id}} if last_id is not None else query
+            docs = await collection.find(batch_query, projection).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+            if not docs:
+                break
+            last_id = docs[-1]["_id"]
+            operations = []
+            for doc in docs:
+                changes = {field: stored_form(doc[field], strategy) for field in fields if field in doc}
+                changes = {field: value for field, value in changes.items() if type(value) is not type(doc[field])}
+                if not changes:
+                    counts["not_uuid"] += 1
+                    continue
+                # Only rewrite the document if its IDs are still the ones just read
+                operations.append(UpdateOne({"_id": doc["_id"], **{field: doc[field] for field in changes}}, {"$set": changes}))
+            if operations and not dry_run:
+                result = await collection.bulk_write(operations, ordered=False)
+                counts["migrated"] += result.modified_count
+                counts["raced"] += len(operations) - result.matched_count
+            else:
+                counts["migrated"] += len(operations)
+            if pause:
+                await asyncio.sleep(pause)
+        if dry_run or not counts["raced"]:
+            return counts
+
+async def main(args: argparse.Namespace) -> int:
+    from dev_init import DATABASE_NAME
+
+    client = AsyncIOMotorClient(os.getenv('MONGO_HOST'), uuidRepresentation="standard")
+    db = client[DATABASE_NAME]
+    try:
+        for name, fields in ID_FIELDS.items():
+            counts = await migrate_collection(db[name], fields, ID_STRATEGY, args.batch_size, args.pause_ms / 1000, args.dry_run)
+            verb = "would rewrite" if args.dry_run else "rewrote"
+            print(f"{name}: {verb} {counts['migrated']} documents to {ID_STRATEGY} IDs, {counts['not_uuid']} hold IDs that are not UUIDs")
+        return 0
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="Count the documents to rewrite without writing")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Documents rewritten per round trip")
+    parser.add_argument("--pause-ms", type=float, default=0.0, help="Pause between batches")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,29 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+
+# Largest batch a bulk endpoint accepts
+MAX_BULK_ITEMS = 1000
+
+class BulkItemResult(BaseModel):
+    """
+    Outcome of one item in a bulk request.
+    """
+    index: int = Field(..., description="Position of the item in the request")
+    status: int = Field(..., description="HTTP status the item would have received on its own")
+    id: Optional[str] = Field(None, description="The user_id or post_id the item refers to")
+    detail: Optional[str] = Field(None, description="Why the item failed")
+
+class BulkResult(BaseModel):
+    """
+    Model for the per-item results of a bulk request.
+    """
+    succeeded: int = Field(..., description="Number of items that were applied")
+    failed: int = Field(..., description="Number of items that were rejected")
+    results: list[BulkItemResult] = Field(..., description="One result per item, in request order")
+    job_id: Optional[str] = Field(None, description="The job deleting the rest of the deleted users' posts, if they had too many to delete inline")
+
+class BulkDelete(BaseModel):
+    """
+    Model for a bulk delete request.
+    """
+    ids: list[str] = Field(..., description="The IDs to delete", min_length=1, max_length=MAX_BULK_ITEMS)
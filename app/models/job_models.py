@@ -0,0 +1,17 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+class JobStatus(BaseModel):
+    """
+    Job status model for API outputs.
+    """
+    job_id: str = Field(..., description="The unique identifier of the job")
+    type: Literal["cascade_delete_posts"] = Field(..., description="What the job does")
+    status: Literal["pending", "running", "succeeded", "failed"] = Field(..., description="Where the job is in its lifecycle")
+    user_ids: List[str] = Field(..., description="The deleted users whose posts the job deletes")
+    deleted_posts: int = Field(..., description="Number of posts deleted so far, including those deleted inline")
+    error: Optional[str] = Field(None, description="Why the job failed")
+    created_at: datetime = Field(..., description="When the job was started")
+    updated_at: datetime = Field(..., description="When the job last made progress")
+    finished_at: Optional[datetime] = Field(None, description="When the job succeeded or failed")
@@ -1,7 +1,10 @@
 from pydantic import BaseModel, Field, field_validator
+from typing import Optional
 from fastapi import HTTPException
 import re
 
+from models.user_models import UserResponse
+
 class Post(BaseModel):
     """
     Post model for creating and updating posts.
@@ -10,6 +13,12 @@ class Post(BaseModel):
     content: str = Field(..., description="The content of the post", min_length=1, example="This is the content of my first blog post.")
     user_id: str = Field(..., description="The user id of the post author", example="123e4567-e89b-12d3-a456-426614174000")
 
+class PostUpdateItem(Post):
+    """
+    Post update model for bulk requests.
+    """
+    post_id: str = Field(..., description="The unique identifier of the post to update")
+
 class PostResponse(BaseModel):
     """
     Post response model for API outputs.
@@ -18,9 +27,33 @@ class PostResponse(BaseModel):
     title: str = Field(..., description="The title of the post")
     content: str = Field(..., description="The content of the post")
     user_id: str = Field(..., description="The user id of the post author")
+    user: Optional[UserResponse] = Field(None, description="The post author, present with expand=user; null if the author no longer exists")
+
+class PartialPostResponse(BaseModel):
+    """
+    Post response model for reads, which carry every field unless the request selected some with fields=.
+    """
+    post_id: Optional[str] = Field(None, description="The unique identifier of the post")
+    title: Optional[str] = Field(None, description="The title of the post")
+    content: Optional[str] = Field(None, description="The content of the post")
+    user_id: Optional[str] = Field(None, description="The user id of the post author; always present with expand=user")
+    user: Optional[UserResponse] = Field(None, description="The post author, present with expand=user; null if the author no longer exists")
 
 class PostList(BaseModel):
     """
     Model for a list of posts.
     """
-    posts: list[PostResponse] = Field(..., description="List of posts")
\ No newline at end of file
+    posts: list[PartialPostResponse] = Field(..., description="List of posts, with the fields selected by fields=")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, or null on the last page")
+class PostSearchHit(PartialPostResponse):
+    """
+    Post search result model.
+    """
+    score: float = Field(..., description="Relevance of the post to the query; higher is better")
+
+class PostSearchResults(BaseModel):
+    """
+    Model for a page of search results.
+    """
+    posts: list[PostSearchHit] = Field(..., description="Matching posts, best match first")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, or null on the last page")
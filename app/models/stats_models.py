@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+
+class Stats(BaseModel):
+    """
+    Totals model for API outputs.
+    """
+    users: int = Field(..., description="Number of users")
+    posts: int = Field(..., description="Number of posts")
+
+class UserStats(BaseModel):
+    """
+    Per-user stats model for API outputs.
+    """
+    user_id: str = Field(..., description="The unique identifier of the user")
+    posts: int = Field(..., description="Number of posts by the user")
+
+class StatsReconciliation(BaseModel):
+    """
+    Model for the outcome of recounting the stats.
+    """
+    before: Stats = Field(..., description="The totals as they were counted incrementally")
+    after: Stats = Field(..., description="The totals recounted from the collections")
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
+from typing import Optional
 from fastapi import HTTPException
 import re
 
@@ -35,6 +36,14 @@ class UserRegister(BaseModel):
             raise HTTPException(status_code=400, detail="Invalid full name format. Only letters and spaces are allowed.")
         return v
 
+class UserUpdateItem(UserRegister):
+    """
+    User update model for bulk requests.
+
+    This model carries the ID of the user to update alongside the new information.
+    """
+    user_id: str = Field(..., description="The unique identifier of the user to update")
+
 class UserResponse(BaseModel):
     """
     User response model.
@@ -45,10 +54,22 @@ class UserResponse(BaseModel):
     fullName: str = Field(..., description="The full name of the user")
     email: str = Field(..., description="The email address of the user")
 
+class PartialUserResponse(BaseModel):
+    """
+    Partial user response model.
+
+    This model is used for read responses, which carry every field unless the
+    request selected some with fields=.
+    """
+    user_id: Optional[str] = Field(None, description="The unique identifier of the user")
+    fullName: Optional[str] = Field(None, description="The full name of the user")
+    email: Optional[str] = Field(None, description="The email address of the user")
+
 class UserList(BaseModel):
     """
     User list model.
 
     This model is used for returning a list of users in API responses.
     """
-    users: list[UserResponse] = Field(..., description="List of users")
\ No newline at end of file
+    users: list[PartialUserResponse] = Field(..., description="List of users, with the fields selected by fields=")
+    next_cursor: Optional[str] = Field(None, description="Cursor for the next page, or null on the last page")
\ No newline at end of file
@@ -0,0 +1,102 @@
+import base64
+import binascii
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+
+# Page size limits for list endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Documents fetched per round trip when streaming a full export
+STREAM_BATCH_SIZE = 500
+
+# Deepest position a relevance-ranked page may start at; ranked results
+# cannot use a keyset, so every page re-ranks and skips the earlier ones
+MAX_OFFSET = 10000
+
+def encode_cursor(last_id: ObjectId) -> str:
+    """Encode the last seen _id as an opaque cursor string."""
+    return base64.urlsafe_b64encode(last_id.binary).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> ObjectId:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Raises:
+        HTTPException: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return ObjectId(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, InvalidId, TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def encode_offset(offset: int) -> str:
+    """Encode a result offset as an opaque cursor string."""
+    return base64.urlsafe_b64encode(f"o{offset}".encode()).decode().rstrip("=")
+
+def decode_offset(cursor: str) -> int:
+    """
+    Decode a cursor produced by encode_offset.
+
+    Raises:
+        HTTPException: If the cursor is malformed or past MAX_OFFSET.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded).decode()
+        if not raw.startswith("o"):
+            raise ValueError(raw)
+        offset = int(raw[1:])
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not 0 <= offset <= MAX_OFFSET:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return offset
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    limit: int,
+    after: Optional[ObjectId] = None,
+    session: Optional[AsyncIOMotorClientSession] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page of documents in _id order.
+
+    The _id index makes each page a bounded range scan no matter how deep the
+    client has paged. One extra document is requested to tell whether another
+    page exists.
+
+    Returns:
+        The page of documents without their _id, and the cursor for the next
+        page or None if this is the last one.
+    """
+    if after is not None:
+        query = {**query, "_id": {"$gt": after}}
+    projection = {**projection, "_id": 1}
+    docs = await collection.find(query, projection, session=session).sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+    next_cursor = encode_cursor(docs[limit - 1]["_id"]) if len(docs) > limit else None
+    page = docs[:limit]
+    for doc in page:
+        del doc["_id"]
+    return page, next_cursor
+
+async def stream_documents(
+    collection: AsyncIOMotorCollection,
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    after: Optional[ObjectId] = None,
+    session: Optional[AsyncIOMotorClientSession] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield every matching document in _id order, one server batch at a time."""
+    if after is not None:
+        query = {**query, "_id": {"$gt": after}}
+    cursor = collection.find(query, projection, session=session).sort("_id", 1).batch_size(STREAM_BATCH_SIZE)
+    async for doc in cursor:
+        yield doc
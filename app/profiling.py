@@ -0,0 +1,437 @@
+"""
+Opt-in sampling profiler for individual requests.
+
+`ProfilingMiddleware` profiles a random PROFILING_SAMPLE_RATE share of
+requests, and any request with a valid signed `X-Profile` header. While a
+profiled request runs, a background thread samples the stack of the event
+loop every PROFILING_INTERVAL_MS. Only samples whose stack passes through the
+request's own coroutines are kept, so the other requests sharing the loop do
+not show up in its profile. Tasks the request starts, such as the one that
+streams a response body, count as its own.
+
+Each sample is put in a phase by the innermost code it recognises:
+validation (FastAPI dependency solving, pydantic and the models), serialization
+(the response encoders), compression, the Mongo driver, or the app itself.
+These are the time the request kept the event loop busy. The Mongo round
+trips are timed by a command listener, and the rest of the wall clock time
+was spent waiting for something else, such as the loop or an admission slot.
+
+Every profile is written to PROFILING_DIR as a speedscope file
+(https://www.speedscope.app), a pstats file whose call counts are sample
+counts, and a JSON summary of the phases. GET /admin/profiles lists them. The
+response to a profiled request carries their ID in X-Profile-Id.
+
+With no sample rate and no secret the middleware and listener are not
+installed, so profiling costs nothing while it is off.
+
+Configuration is read from the environment:
+
+    PROFILING_SAMPLE_RATE   share of requests to profile, 0-1 (0)
+    PROFILING_SECRET        key that X-Profile headers are signed with; unset ignores the header
+    PROFILING_DIR           directory profiles are written to (/tmp/profiles)
+    PROFILING_INTERVAL_MS   time between stack samples (1)
+    PROFILING_MAX_PROFILES  profiles kept; the oldest are deleted first (100)
+
+A header valid for five minutes is printed by `python profiling.py 300`.
+"""
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from types import CodeType, FrameType
+
+from pymongo import monitoring
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_SECRET = os.getenv('PROFILING_SECRET', '')
+PROFILING_DIR = os.getenv('PROFILING_DIR', '/tmp/profiles')
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '1'))
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', '100'))
+PROFILING_ENABLED = PROFILING_SAMPLE_RATE > 0 or bool(PROFILING_SECRET)
+
+PROFILE_HEADER = b"x-profile"
+
+# Long-lived streams would keep the sampler running, and profiles of the profile endpoints are noise
+UNPROFILED_PATHS = re.compile(r"^/(metrics|posts/stream|admin/profiles.*)$")
+
+# Files served by GET /admin/profiles/{name}
+PROFILE_FILE = re.compile(r"^[\w-]+\.(speedscope\.json|pstats)$")
+
+# The profile of the request being handled, seen by its tasks and by the Mongo listener
+CURRENT_PROFILE: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("current_profile", default=None)
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+FASTAPI_VALIDATION = os.path.join("fastapi", "dependencies", "utils.py")
+PHASES = ("validation", "serialization", "compression", "driver", "app")
+
+def sign(secret: str, expires: int) -> str:
+    """Return an X-Profile header value that is valid until `expires`, in Unix seconds."""
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{signature}"
+
+def verify(token: str, secret: str, now: float) -> bool:
+    """Check that an X-Profile header value was signed with the secret and has not expired."""
+    expires, _, _ = token.partition(".")
+    if not secret or not expires.isdigit() or int(expires) < now:
+        return False
+    return hmac.compare_digest(sign(secret, int(expires)), token)
+
+def phase_of(code: CodeType) -> Optional[str]:
+    """Return the phase that code belongs to, or None if it does not mark one."""
+    filename = code.co_filename
+    if filename.endswith(FASTAPI_VALIDATION) or f"{os.sep}pydantic" in filename or filename.startswith(os.path.join(APP_DIR, "models")):
+        return "validation"
+    if filename == os.path.join(APP_DIR, "responses.py") or code.co_name in ("serialize_response", "jsonable_encoder"):
+        return "serialization"
+    if filename == os.path.join(APP_DIR, "compression.py"):
+        return "compression"
+    if f"{os.sep}motor{os.sep}" in filename or f"{os.sep}pymongo{os.sep}" in filename or f"{os.sep}bson{os.sep}" in filename:
+        return "driver"
+    return None
+
+class RequestProfile:
+    """Samples and Mongo round trips collected for one request."""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.now(timezone.utc)
+        self.thread_id = threading.get_ident()
+        # Stacks from the request's root frame to the innermost frame, with the seconds each stands for
+        self.samples: List[Tuple[Tuple[CodeType, ...], float]] = []
+        # Appended to from driver threads, which list.append makes safe
+        self.mongo: List[float] = []
+
+    def phases(self, wall: float) -> Dict[str, float]:
+        """Split the wall clock time of the request into phases, in seconds."""
+        phases = dict.fromkeys(PHASES, 0.0)
+        for stack, weight in self.samples:
+            phases[self.sample_phase(stack)] += weight
+        phases["mongo"] = sum(self.mongo, 0.0)
+        phases["other"] = max(0.0, wall - sum(phases.values()))
+        return phases
+
+    @staticmethod
+    def sample_phase(stack: Tuple[CodeType, ...]) -> str:
+        # The innermost recognised code decides, so a validator called during routing counts as validation
+        for code in reversed(stack):
+            phase = phase_of(code)
+            if phase is not None:
+                return phase
+        return "app"
+
+class Sampler:
+    """
+    Background thread sampling the stacks of the threads running profiled requests.
+
+    Each profiled request registers its root frames: the frame of the
+    middleware handling it, and the first frame of every task it starts. A
+    sample belongs to the request whose root frame it passes through. The
+    thread only runs while some request is being profiled.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._roots: Dict[FrameType, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, frame: FrameType, profile: RequestProfile) -> None:
+        with self._lock:
+            self._roots[frame] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+                self._thread.start()
+
+    def remove(self, profile: RequestProfile) -> None:
+        with self._lock:
+            for frame in [frame for frame, owner in self._roots.items() if owner is profile]:
+                del self._roots[frame]
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                if not self._roots:
+                    self._thread = None
+                    return
+                thread_ids = {profile.thread_id for profile in self._roots.values()}
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            # A sample stands for the time since the previous one, which is longer than the
+            # interval when this thread had to wait for the GIL
+            weight, last = now - last, now
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self._sample(frame, weight)
+
+    def _sample(self, frame: FrameType, weight: float) -> None:
+        stack = []
+        while frame is not None:
+            stack.append(frame.f_code)
+            profile = self._roots.get(frame)
+            if profile is not None:
+                profile.samples.append((tuple(reversed(stack)), weight))
+                return
+            frame = frame.f_back
+
+class ProfileListener(monitoring.CommandListener):
+    """
+    Times the Mongo commands of profiled requests.
+
+    Motor runs each command in a thread with a copy of the caller's context,
+    so the request's profile is found in CURRENT_PROFILE.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        profile = CURRENT_PROFILE.get()
+        if profile is not None:
+            profile.mongo.append(event.duration_micros / 1_000_000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self.succeeded(event)
+
+def profiling_listeners() -> list:
+    """Return the pymongo event listeners to register on the client, if profiling is enabled."""
+    return [ProfileListener()] if PROFILING_ENABLED else []
+
+def _frame_name(code: CodeType) -> str:
+    return getattr(code, "co_qualname", code.co_name)
+
+def speedscope(profile: RequestProfile, phases: Dict[str, float]) -> Dict[str, Any]:
+    """
+    Build a speedscope file of sampled stacks, in milliseconds.
+
+    Every stack starts with a frame naming its phase. Mongo round trips and
+    other waiting are added as stacks of their own, so the flame graph adds
+    up to the wall clock time of the request.
+    """
+    frames: List[Dict[str, Any]] = []
+    indexes: Dict[Any, int] = {}
+
+    def index(key: Any, frame: Dict[str, Any]) -> int:
+        if key not in indexes:
+            indexes[key] = len(frames)
+            frames.append(frame)
+        return indexes[key]
+
+    samples, weights = [], []
+    for stack, weight in profile.samples:
+        phase = profile.sample_phase(stack)
+        samples.append([index(phase, {"name": f"[{phase}]"})] + [
+            index(code, {"name": _frame_name(code), "file": code.co_filename, "line": code.co_firstlineno}) for code in stack
+        ])
+        weights.append(weight * 1000)
+    for phase in ("mongo", "other"):
+        if phases[phase]:
+            samples.append([index(phase, {"name": f"[{phase}]"})])
+            weights.append(phases[phase] * 1000)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{profile.method} {profile.path}",
+        "exporter": "lightbox-takehome profiling",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": f"{profile.method} {profile.path}",
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+def pstats_data(profile: RequestProfile, phases: Dict[str, float]) -> Dict[Tuple[str, int, str], Tuple[int, int, float, float, Dict]]:
+    """
+    Build the stats dictionary that `pstats.Stats` loads, from the samples.
+
+    Time is attributed as cProfile would: to the innermost function as its
+    own time, and to every function on the stack as cumulative time. Call
+    counts are the number of samples a function appears in. Mongo round
+    trips and other waiting appear as the functions `[mongo]` and `[other]`,
+    as in the speedscope file.
+    """
+    stats: Dict[Tuple[str, int, str], List[Any]] = {}
+    for phase in ("mongo", "other"):
+        if phases[phase]:
+            stats[("~", 0, f"[{phase}]")] = [1, 1, phases[phase], phases[phase], {}]
+    for stack, weight in profile.samples:
+        keys = [(code.co_filename, code.co_firstlineno, code.co_name) for code in stack]
+        seen = set()
+        for depth, key in enumerate(keys):
+            entry = stats.setdefault(key, [0, 0, 0.0, 0.0, {}])
+            leaf = depth == len(keys) - 1
+            if leaf:
+                entry[2] += weight
+            # A recursive function is counted once per sample
+            if key not in seen:
+                seen.add(key)
+                entry[0] += 1
+                entry[1] += 1
+                entry[3] += weight
+            if depth:
+                caller = entry[4].get(keys[depth - 1], (0, 0, 0.0, 0.0))
+                entry[4][keys[depth - 1]] = (caller[0] + 1, caller[1] + 1, caller[2] + (weight if leaf else 0.0), caller[3] + weight)
+    return {key: (cc, nc, tt, ct, callers) for key, (cc, nc, tt, ct, callers) in stats.items()}
+
+def write_profile(profile: RequestProfile, summary: Dict[str, Any], phases: Dict[str, float], directory: str, max_profiles: int) -> None:
+    """Write the speedscope, pstats and summary files of a profile, then delete the oldest beyond the limit."""
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, profile.profile_id)
+    with open(f"{base}.speedscope.json", "w") as f:
+        json.dump(speedscope(profile, phases), f)
+    with open(f"{base}.pstats", "wb") as f:
+        marshal.dump(pstats_data(profile, phases), f)
+    # The summary is written last, so a profile that is listed has all its files
+    with open(f"{base}.json", "w") as f:
+        json.dump(summary, f)
+    for name in sorted(name for name in os.listdir(directory) if name.endswith(".json") and not name.endswith(".speedscope.json"))[:-max_profiles]:
+        profile_id = name[:-len(".json")]
+        for suffix in (".json", ".speedscope.json", ".pstats"):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+def list_profiles(directory: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Return the summaries of the profiles in the directory, newest first."""
+    directory = directory or PROFILING_DIR
+    if not os.path.isdir(directory):
+        return []
+    summaries = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if name.endswith(".json") and not name.endswith(".speedscope.json"):
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    summaries.append(json.load(f))
+            except (OSError, ValueError):
+                # Deleted or still being written by another worker
+                continue
+    return summaries
+
+def profile_file(name: str, directory: Optional[str] = None) -> Optional[str]:
+    """Return the path of a speedscope or pstats file, or None if the name is not one that exists."""
+    path = os.path.join(directory or PROFILING_DIR, name)
+    return path if PROFILE_FILE.match(name) and os.path.isfile(path) else None
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling sampled requests and requests with a signed X-Profile header.
+
+    A request that is not profiled costs one random number and a header scan.
+    """
+
+    def __init__(
+        self,
+        app,
+        sample_rate: float = PROFILING_SAMPLE_RATE,
+        secret: str = PROFILING_SECRET,
+        directory: str = PROFILING_DIR,
+        interval: float = PROFILING_INTERVAL_MS / 1000,
+        max_profiles: int = PROFILING_MAX_PROFILES,
+    ):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.directory = directory
+        self.max_profiles = max_profiles
+        self.sampler = Sampler(interval)
+
+    def _trigger(self, scope) -> Optional[str]:
+        if UNPROFILED_PATHS.match(scope["path"]):
+            return None
+        if self.secret:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return "header" if verify(value.decode("latin-1"), self.secret, time.time()) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    def _track_tasks(self) -> None:
+        """Make the tasks a profiled request starts into roots of its profile, once per loop."""
+        loop = asyncio.get_running_loop()
+        previous = loop.get_task_factory()
+        if getattr(previous, "sampler", None) is self.sampler:
+            return
+
+        def task_factory(loop, coro, **kwargs):
+            task = previous(loop, coro, **kwargs) if previous is not None else asyncio.Task(coro, loop=loop, **kwargs)
+            profile = CURRENT_PROFILE.get()
+            frame = getattr(coro, "cr_frame", None)
+            if profile is not None and frame is not None:
+                self.sampler.add(frame, profile)
+            return task
+
+        task_factory.sampler = self.sampler
+        loop.set_task_factory(task_factory)
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+
+        self._track_tasks()
+        profile = RequestProfile(scope["method"], scope["path"], trigger)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile.profile_id.encode())]}
+            await send(message)
+
+        token = CURRENT_PROFILE.set(profile)
+        self.sampler.add(sys._getframe(), profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            wall = time.perf_counter() - started
+            self.sampler.remove(profile)
+            CURRENT_PROFILE.reset(token)
+            route = scope.get("route")
+            phases = profile.phases(wall)
+            summary = {
+                "profile_id": profile.profile_id,
+                "method": profile.method,
+                "path": profile.path,
+                "route": route.path if route is not None else None,
+                "status": status,
+                "trigger": trigger,
+                "started_at": profile.started_at.isoformat(),
+                "wall_ms": wall * 1000,
+                "phases_ms": {phase: seconds * 1000 for phase, seconds in phases.items()},
+                "samples": len(profile.samples),
+                "mongo_commands": len(profile.mongo),
+                "files": {"speedscope": f"{profile.profile_id}.speedscope.json", "pstats": f"{profile.profile_id}.pstats"},
+            }
+            # The response has been sent, so only this task waits for the files
+            await asyncio.to_thread(write_profile, profile, summary, phases, self.directory, self.max_profiles)
+
+if __name__ == "__main__":
+    if not PROFILING_SECRET:
+        sys.exit("Set PROFILING_SECRET to the server's secret.")
+    ttl = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    print(f"X-Profile: {sign(PROFILING_SECRET, int(time.time()) + ttl)}")
@@ -0,0 +1,258 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+
+from cache import ReadThroughCache
+from conditional import version_filter
+from fields import Fields, projection_for
+from ids import encode, encode_filter, match, match_many
+from pagination import fetch_page, stream_documents
+from repositories.bulk import insert_unordered, update_unordered
+from repositories.stats import StatsRepository
+from routing import routed
+
+class Repository:
+    """
+    Async data access shared by the user and post repositories.
+
+    Every method awaits the motor client, so a slow query only suspends the
+    calling request instead of blocking the event loop. Documents are
+    addressed by their public ID field. Every write increments the document's
+    `version` and the collection's change counter, which the routers use for
+    ETags. Creates and deletes also update the stats counters. The change
+    counter and the stats counters live in different collections, so they are
+    written concurrently once the document itself is written, and a write
+    costs two round trips rather than three.
+
+    Callers pass and get back IDs as strings. The fields in `id_fields` are
+    converted to their stored form on the way in, by the helpers in `ids`.
+    """
+
+    collection_name: str
+    id_field: str
+    # Fields holding IDs, the document's own and its references
+    id_fields: Tuple[str, ...] = ()
+    projection: Dict[str, Any]
+    # Fields the stats counters need from a deleted document
+    counted_fields: Tuple[str, ...] = ()
+
+    def __init__(self, db: AsyncIOMotorDatabase, cache: Optional[ReadThroughCache] = None):
+        self.collection = db[self.collection_name]
+        self.counters = db['counters']
+        self.stats = StatsRepository(db)
+        self.cache = cache
+        self.document_projection = {**self.projection, "version": 1}
+        self.counted_projection = {"_id": 1, self.id_field: 1, **{field: 1 for field in self.counted_fields}}
+
+    def _cache_key(self, id: str) -> str:
+        return f"{self.collection_name}:{id}"
+
+    async def find_by_id(self, id: str) -> Optional[Dict[str, Any]]:
+        """Return the document with the given ID and its version, or None, reading through the cache if there is one."""
+        if self.cache is None:
+            async with routed(self.collection) as (collection, session):
+                return await self._load(id, collection, session)
+        # The cache is filled from the primary, as a lagging secondary's copy would be kept after it caught up
+        return await self.cache.get_or_load(self._cache_key(id), lambda: self._load(id))
+
+    async def _load(self, id: str, collection: Optional[AsyncIOMotorCollection] = None, session: Optional[AsyncIOMotorClientSession] = None) -> Optional[Dict[str, Any]]:
+        collection = self.collection if collection is None else collection
+        return await collection.find_one({self.id_field: match(id)}, self.document_projection, session=session)
+
+    async def _invalidate(self, *ids: str) -> None:
+        """Drop cached copies of documents that were just written."""
+        if self.cache is not None:
+            for id in ids:
+                await self.cache.invalidate(self._cache_key(id))
+
+    async def _record_change(self) -> None:
+        """Increment the collection change counter."""
+        await self.counters.update_one({"_id": self.collection_name}, {"$inc": {"seq": 1}}, upsert=True)
+
+    async def _count(self, docs: List[Dict[str, Any]], sign: int) -> None:
+        """Update the stats counters for documents created (sign 1) or deleted (sign -1)."""
+
+    async def _count_update(self, before: Dict[str, Any], after: Dict[str, Any]) -> None:
+        """Update the stats counters for a document that changed."""
+
+    async def _count_unknown(self, docs: List[Dict[str, Any]], deleted: int) -> None:
+        """
+        Update the stats counters when only `deleted` of the documents read were deleted, and which ones is not known.
+
+        Another request deleted the rest first, and counted them itself.
+        """
+
+    async def _record_write(self, docs: List[Dict[str, Any]], sign: int) -> None:
+        """Increment the change counter and update the stats counters for documents created or deleted, concurrently, after the write itself."""
+        await asyncio.gather(self._record_change(), self._count(docs, sign))
+
+    async def change_counter(self, *also: str) -> int:
+        """
+        Return the number of writes made to the collection through the repositories.
+
+        Counters only ever grow, so the sum over this collection and the `also`
+        collections changes whenever any of them is written, which is all an
+        ETag needs. It is read in a single query.
+        """
+        async with routed(self.counters) as (counters, session):
+            if not also:
+                counter = await counters.find_one({"_id": self.collection_name}, session=session)
+                return counter["seq"] if counter else 0
+            cursor = counters.find({"_id": {"$in": [self.collection_name, *also]}}, session=session)
+            return sum([counter["seq"] async for counter in cursor])
+
+    async def find_many(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the documents with the given IDs and their versions, keyed by ID, in a single query."""
+        async with routed(self.collection) as (collection, session):
+            cursor = collection.find({self.id_field: match_many(ids)}, self.document_projection, session=session)
+            return {doc[self.id_field]: doc async for doc in cursor}
+
+    async def exists(self, id: str) -> bool:
+        """Check whether a document with the given ID exists."""
+        async with routed(self.collection) as (collection, session):
+            return await collection.find_one({self.id_field: match(id)}, {"_id": 1}, session=session) is not None
+
+    async def existing_ids(self, ids: Iterable[str]) -> Set[str]:
+        """Return which of the given IDs exist, in a single query."""
+        async with routed(self.collection) as (collection, session):
+            cursor = collection.find({self.id_field: match_many(ids)}, {"_id": 0, self.id_field: 1}, session=session)
+            return {doc[self.id_field] async for doc in cursor}
+
+    async def list_page(
+        self,
+        limit: int,
+        after: Optional[ObjectId] = None,
+        query: Optional[Dict[str, Any]] = None,
+        fields: Fields = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return one page of documents, optionally filtered and with only the selected fields, and the cursor for the next page."""
+        async with routed(self.collection) as (collection, session):
+            return await fetch_page(collection, encode_filter(query or {}, self.id_fields), projection_for(fields, self.projection), limit, after, session)
+
+    async def stream_all(
+        self,
+        after: Optional[ObjectId] = None,
+        query: Optional[Dict[str, Any]] = None,
+        fields: Fields = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield every document, optionally filtered and with only the selected fields, without loading the collection into memory."""
+        async with routed(self.collection) as (collection, session):
+            async for doc in stream_documents(collection, encode_filter(query or {}, self.id_fields), projection_for(fields, self.projection), after, session):
+                yield doc
+
+    async def insert(self, data: Dict[str, Any]) -> int:
+        """
+        Insert a new document.
+
+        Returns:
+            The version of the new document.
+
+        Raises:
+            DuplicateKeyError: If a uniquely indexed field is already taken.
+        """
+        await self.collection.insert_one({**encode(data, self.id_fields), "version": 1})
+        await self._record_write([data], 1)
+        return 1
+
+    async def update(self, id: str, data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Overwrite the fields of an existing document in a single round trip.
+
+        Args:
+            id (str): The ID of the document.
+            data (Dict[str, Any]): The fields to set.
+            expected_version (Optional[int]): Only update if the document is at this version.
+
+        Returns:
+            The updated document with its new version, or None if no document
+            has the given ID (and version).
+
+        Raises:
+            DuplicateKeyError: If a uniquely indexed field is already taken.
+        """
+        query = {self.id_field: match(id)}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        # The document before the update tells the stats counters what changed
+        before = await self.collection.find_one_and_update(
+            query,
+            {"$set": encode(data, self.id_fields), "$inc": {"version": 1}},
+            projection=self.document_projection,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            return None
+        updated = {**before, **{field: value for field, value in data.items() if field in self.projection}}
+        updated["version"] = before.get("version", 0) + 1
+        await self._invalidate(id)
+        await asyncio.gather(self._record_change(), self._count_update(before, updated))
+        return updated
+
+    async def delete(self, id: str, expected_version: Optional[int] = None) -> bool:
+        """Delete a document in a single round trip, optionally only at a given version, and report whether it was deleted."""
+        query = {self.id_field: match(id)}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        deleted = await self.collection.find_one_and_delete(query, projection=self.counted_projection)
+        if deleted is not None:
+            await self._invalidate(id)
+            await self._record_write([deleted], -1)
+        return deleted is not None
+
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> Dict[int, int]:
+        """
+        Insert documents in one unordered batch.
+
+        Returns:
+            The Mongo error code of every document that was not inserted, keyed by position.
+        """
+        failures = await insert_unordered(self.collection, [{**encode(doc, self.id_fields), "version": 1} for doc in docs])
+        if len(failures) < len(docs):
+            await self._record_write([doc for position, doc in enumerate(docs) if position not in failures], 1)
+        return failures
+
+    async def update_many(self, updates: List[Tuple[str, Dict[str, Any]]]) -> Dict[int, int]:
+        """
+        Apply (id, fields) updates in one unordered batch.
+
+        Returns:
+            The Mongo error code of every update that failed, keyed by position.
+        """
+        failures = await update_unordered(self.collection, self.id_field, [(match(id), encode(data, self.id_fields)) for id, data in updates])
+        await self._invalidate(*(id for id, _ in updates))
+        if len(failures) < len(updates):
+            await self._record_change()
+        return failures
+
+    async def _delete_read(self, docs: List[Dict[str, Any]]) -> int:
+        """
+        Delete documents that were just read, by _id, and update the counters for the ones deleted.
+
+        Returns:
+            The number of documents deleted.
+        """
+        result = await self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}})
+        if result.deleted_count == len(docs):
+            await self._record_write(docs, -1)
+        elif result.deleted_count:
+            # A concurrent delete removed some of them in between, so counting all of them would count those twice
+            await asyncio.gather(self._record_change(), self._count_unknown(docs, result.deleted_count))
+        return result.deleted_count
+
+    async def delete_many(self, ids: Iterable[str]) -> Set[str]:
+        """
+        Delete the given documents and return the IDs of those removed.
+
+        The documents are read first and then deleted by _id. If a concurrent
+        delete removed some of them in between, which ones is not known, and
+        the IDs of all of them are returned: each is gone either way.
+        """
+        ids = list(ids)
+        # Read first, for the stats counters, then delete exactly what was read
+        docs = await self.collection.find({self.id_field: match_many(ids)}, self.counted_projection).to_list(length=None)
+        deleted = await self._delete_read(docs) if docs else 0
+        await self._invalidate(*ids)
+        return {doc[self.id_field] for doc in docs} if deleted else set()
@@ -0,0 +1,40 @@
+from typing import Any, Dict, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+def _write_errors(error: BulkWriteError) -> Dict[int, int]:
+    """Map the position of each failed operation to its Mongo error code."""
+    return {write_error["index"]: write_error["code"] for write_error in error.details.get("writeErrors", [])}
+
+async def insert_unordered(collection: AsyncIOMotorCollection, docs: List[Dict[str, Any]]) -> Dict[int, int]:
+    """
+    Insert documents in one unordered batch.
+
+    Returns:
+        The error code of every document that was not inserted, keyed by its position.
+    """
+    if not docs:
+        return {}
+    try:
+        await collection.insert_many([dict(doc) for doc in docs], ordered=False)
+    except BulkWriteError as e:
+        return _write_errors(e)
+    return {}
+
+async def update_unordered(collection: AsyncIOMotorCollection, key: str, updates: List[Tuple[str, Dict[str, Any]]]) -> Dict[int, int]:
+    """
+    Apply $set updates addressed by the given key field in one unordered batch,
+    incrementing the version of every updated document.
+
+    Returns:
+        The error code of every update that failed, keyed by its position.
+    """
+    if not updates:
+        return {}
+    try:
+        await collection.bulk_write([UpdateOne({key: value}, {"$set": data, "$inc": {"version": 1}}) for value, data in updates], ordered=False)
+    except BulkWriteError as e:
+        return _write_errors(e)
+    return {}
@@ -0,0 +1,133 @@
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from cache import ReadThroughCache
+from fields import Fields
+from ids import match_many
+from repositories.base import Repository
+
+# Fields returned to API clients
+POST_PROJECTION = {"_id": 0, "post_id": 1, "title": 1, "content": 1, "user_id": 1}
+
+class PostRepository(Repository):
+    """
+    Async data access for the posts collection.
+
+    Uniquely indexed fields: post_id, title.
+
+    Every successful write is passed on to the search backend, if there is one,
+    so that an in-process search index stays current.
+    """
+
+    collection_name = 'posts'
+    id_field = 'post_id'
+    id_fields = ('post_id', 'user_id')
+    projection = POST_PROJECTION
+    counted_fields = ('user_id',)
+
+    def __init__(self, db: AsyncIOMotorDatabase, cache: Optional[ReadThroughCache] = None, search=None):
+        super().__init__(db, cache)
+        self.search = search
+
+    async def _count(self, docs: List[Dict[str, Any]], sign: int) -> None:
+        await self.stats.record_posts(docs, sign)
+
+    async def _count_unknown(self, docs: List[Dict[str, Any]], deleted: int) -> None:
+        # The total is known, but not whose posts were deleted, so the authors' counters are recounted
+        await asyncio.gather(
+            self.stats.record(posts=-deleted),
+            self.stats.recount_user_posts({doc["user_id"] for doc in docs}),
+        )
+
+    async def _count_update(self, before: Dict[str, Any], after: Dict[str, Any]) -> None:
+        # A post moved to another author moves between their counters
+        if before.get("user_id") != after.get("user_id"):
+            await self.stats.record(posts_by_user={before["user_id"]: -1, after["user_id"]: 1})
+
+    async def insert(self, data: Dict[str, Any]) -> int:
+        version = await super().insert(data)
+        if self.search is not None:
+            self.search.index(data)
+        return version
+
+    async def update(self, id: str, data: Dict[str, Any], expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        updated = await super().update(id, data, expected_version)
+        if updated is not None and self.search is not None:
+            self.search.index(updated)
+        return updated
+
+    async def delete(self, id: str, expected_version: Optional[int] = None) -> bool:
+        deleted = await super().delete(id, expected_version)
+        if deleted and self.search is not None:
+            self.search.remove([id])
+        return deleted
+
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> Dict[int, int]:
+        failures = await super().insert_many(docs)
+        if self.search is not None:
+            for position, doc in enumerate(docs):
+                if position not in failures:
+                    self.search.index(doc)
+        return failures
+
+    async def update_many(self, updates: List[Tuple[str, Dict[str, Any]]]) -> Dict[int, int]:
+        # The authors before the update, for the stats counters of posts that change author
+        authors = {
+            doc[self.id_field]: doc["user_id"]
+            async for doc in self.collection.find({self.id_field: match_many(id for id, _ in updates)}, {"_id": 0, self.id_field: 1, "user_id": 1})
+        }
+        failures = await super().update_many(updates)
+        moved: Dict[str, int] = {}
+        for position, (id, data) in enumerate(updates):
+            if position not in failures and id in authors and authors[id] != data["user_id"]:
+                moved[authors[id]] = moved.get(authors[id], 0) - 1
+                moved[data["user_id"]] = moved.get(data["user_id"], 0) + 1
+        await self.stats.record(posts_by_user=moved)
+        if self.search is not None:
+            for position, (id, data) in enumerate(updates):
+                if position not in failures:
+                    self.search.index({**data, self.id_field: id})
+        return failures
+
+    async def delete_many(self, ids: Iterable[str]) -> Set[str]:
+        ids = list(ids)
+        deleted = await super().delete_many(ids)
+        if self.search is not None:
+            self.search.remove(ids)
+        return deleted
+
+    async def delete_by_users(self, user_ids: List[str], limit: int) -> Tuple[int, bool]:
+        """
+        Delete up to `limit` of the oldest posts by the given users.
+
+        The oldest posts are found on the (user_id, _id) index, and exactly
+        those are deleted by _id with one delete_many, so each call does a
+        bounded amount of work however many posts the users have, and a post
+        written meanwhile is left for the next call, which counts it.
+
+        Returns:
+            The number of posts deleted, and whether the users have more.
+        """
+        query: Dict[str, Any] = {"user_id": match_many(user_ids)}
+        docs = await self.collection.find(query, self.counted_projection).sort("_id", 1).limit(limit + 1).to_list(length=limit + 1)
+        chunk = docs[:limit]
+        if not chunk:
+            return 0, False
+        deleted = await self._delete_read(chunk)
+        post_ids = [doc["post_id"] for doc in chunk]
+        await self._invalidate(*post_ids)
+        if self.search is not None:
+            self.search.remove(post_ids)
+        return deleted, len(docs) > limit
+
+    async def search_page(self, q: str, user_id: Optional[str], limit: int, offset: int, fields: Fields = None) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        Return one page of posts matching a full-text query, best match first, with only the selected fields.
+
+        Returns:
+            The page of posts with their scores, and whether more results follow.
+        """
+        hits = await self.search.search(q, user_id, limit + 1, offset, fields)
+        return hits[:limit], len(hits) > limit
@@ -0,0 +1,179 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import DeleteMany, ReplaceOne, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ids import match_many
+from routing import routed
+
+TOTALS_ID = 'totals'
+
+# Prefix of the _id of each user's counters
+USER_PREFIX = 'users:'
+
+# Counters written per bulk_write by a reconcile
+RECONCILE_BATCH_SIZE = 1000
+
+# _id of the lock held while reconciling, so that only one process recounts at a time
+RECONCILE_LOCK_ID = 'reconcile_lock'
+
+# Age after which a lock is taken to be left by a process that died while reconciling
+RECONCILE_LOCK_SECONDS = 3600
+
+class StatsRepository:
+    """
+    Async data access for the stats collection, a handful of counters.
+
+    One `totals` document counts all users and all posts, and one document
+    per user counts that user's posts. The user and post repositories update
+    them with `$inc` as they write, so each is read in one query instead of
+    by counting a collection. A user without a document has no posts.
+    `reconcile` recounts everything from the collections, to repair drift.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db['stats']
+        self.users = db['users']
+        self.posts = db['posts']
+
+    async def record(
+        self,
+        users: int = 0,
+        posts: int = 0,
+        posts_by_user: Optional[Dict[str, int]] = None,
+        deleted_users: Iterable[str] = (),
+    ) -> None:
+        """
+        Apply counter changes in one round trip.
+
+        Args:
+            users (int): Users created (positive) or deleted (negative).
+            posts (int): Posts created (positive) or deleted (negative).
+            posts_by_user (Optional[Dict[str, int]]): Change of each user's post count.
+            deleted_users (Iterable[str]): Users whose counters are removed.
+        """
+        operations: List[Any] = []
+        totals = {name: count for name, count in (("users", users), ("posts", posts)) if count}
+        if totals:
+            operations.append(UpdateOne({"_id": TOTALS_ID}, {"$inc": totals}, upsert=True))
+        for user_id, count in (posts_by_user or {}).items():
+            if count:
+                # Only an increment creates a user's counter, so that the posts
+                # of a deleted user, deleted after it, do not bring it back
+                operations.append(UpdateOne(
+                    {"_id": USER_PREFIX + user_id},
+                    {"$inc": {"posts": count}, "$setOnInsert": {"user_id": user_id}, "$unset": {"stale": ""}},
+                    upsert=count > 0,
+                ))
+        deleted_users = [USER_PREFIX + user_id for user_id in deleted_users]
+        if deleted_users:
+            operations.append(DeleteMany({"_id": {"$in": deleted_users}}))
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def record_posts(self, posts: List[Dict[str, Any]], sign: int) -> None:
+        """Count posts as created (sign 1) or deleted (sign -1), in total and per author."""
+        by_user = Counter(post["user_id"] for post in posts)
+        await self.record(posts=sign * len(posts), posts_by_user={user_id: sign * count for user_id, count in by_user.items()})
+
+    async def recount_user_posts(self, user_ids: Iterable[str]) -> None:
+        """
+        Recount the post counters of some users from the posts collection.
+
+        For deletes that cannot tell whose posts they removed. Only existing
+        counters are set, so that a user deleted meanwhile does not get one
+        back.
+        """
+        user_ids = list(user_ids)
+        counts: Counter = Counter()
+        async for group in self.posts.aggregate([
+            {"$match": {"user_id": match_many(user_ids)}},
+            {"$group": {"_id": "$user_id", "posts": {"$sum": 1}}},
+        ]):
+            counts[group["_id"]] += group["posts"]
+        operations = [UpdateOne({"_id": USER_PREFIX + user_id}, {"$set": {"posts": counts[user_id]}}) for user_id in user_ids]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def totals(self) -> Dict[str, int]:
+        """Return the number of users and of posts."""
+        async with routed(self.collection) as (collection, session):
+            totals = await collection.find_one({"_id": TOTALS_ID}, session=session)
+        return {"users": totals.get("users", 0), "posts": totals.get("posts", 0)} if totals else {"users": 0, "posts": 0}
+
+    async def user_posts(self, user_id: str) -> int:
+        """Return the number of posts by a user."""
+        async with routed(self.collection) as (collection, session):
+            stats = await collection.find_one({"_id": USER_PREFIX + user_id}, {"posts": 1}, session=session)
+        return stats["posts"] if stats else 0
+
+    async def reconciled(self) -> bool:
+        """Check whether the counters have been counted from the collections at least once."""
+        return await self.collection.find_one({"_id": TOTALS_ID, "reconciled_at": {"$exists": True}}, {"_id": 1}) is not None
+
+    async def _lock(self, now: datetime) -> bool:
+        """Take the reconcile lock, unless another process holds it, and report whether it was taken."""
+        try:
+            # A held lock does not match, so the upsert collides with it on _id
+            await self.collection.update_one(
+                {"_id": RECONCILE_LOCK_ID, "locked_at": {"$lt": now - timedelta(seconds=RECONCILE_LOCK_SECONDS)}},
+                {"$set": {"locked_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def reconcile(self) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Recount every counter from the users and posts collections.
+
+        Posts are counted per author by one aggregation, so only one count per
+        author leaves the server, and the counters are written back in
+        batches. An author whose posts hold their ID in both the binary and
+        the legacy string form, during an ID migration, comes back as two
+        counts under the same string, which are added up. Counters of users
+        that no longer have posts are marked stale beforehand and removed
+        afterwards. A write made while the aggregation runs may be counted
+        twice or not at all, until the next run.
+
+        Only one process reconciles at a time. Workers that start together
+        check whether the counters need a recount, and all but the first to
+        take the lock skip it.
+
+        Returns:
+            The totals before and after, or None if another process is reconciling.
+        """
+        # Mongo keeps milliseconds, and the lock is released by matching its time
+        now = datetime.now(timezone.utc)
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        if not await self._lock(now):
+            return None
+        try:
+            return await self._recount()
+        finally:
+            await self.collection.delete_one({"_id": RECONCILE_LOCK_ID, "locked_at": now})
+
+    async def _recount(self) -> Dict[str, Dict[str, int]]:
+        before = await self.totals()
+        await self.collection.update_many({"_id": {"$regex": f"^{USER_PREFIX}"}}, {"$set": {"stale": True}})
+        counts: Counter = Counter()
+        async for group in self.posts.aggregate([{"$group": {"_id": "$user_id", "posts": {"$sum": 1}}}]):
+            counts[group["_id"]] += group["posts"]
+        operations = [
+            ReplaceOne({"_id": USER_PREFIX + user_id}, {"user_id": user_id, "posts": posts}, upsert=True)
+            for user_id, posts in counts.items()
+        ]
+        for start in range(0, len(operations), RECONCILE_BATCH_SIZE):
+            await self.collection.bulk_write(operations[start:start + RECONCILE_BATCH_SIZE], ordered=False)
+        await self.collection.delete_many({"_id": {"$regex": f"^{USER_PREFIX}"}, "stale": True})
+        after = {"users": await self.users.count_documents({}), "posts": await self.posts.count_documents({})}
+        await self.collection.replace_one(
+            {"_id": TOTALS_ID},
+            {**after, "reconciled_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+        return {"before": before, "after": after}
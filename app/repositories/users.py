@@ -0,0 +1,27 @@
+from typing import Any, Dict, List
+
+from repositories.base import Repository
+
+# Fields returned to API clients
+USER_PROJECTION = {"_id": 0, "user_id": 1, "fullName": 1, "email": 1}
+
+class UserRepository(Repository):
+    """
+    Async data access for the users collection.
+
+    Uniquely indexed fields: user_id, email.
+    """
+
+    collection_name = 'users'
+    id_field = 'user_id'
+    id_fields = ('user_id',)
+    projection = USER_PROJECTION
+
+    async def _count(self, docs: List[Dict[str, Any]], sign: int) -> None:
+        # A deleted user's post counter goes with them
+        deleted = [doc[self.id_field] for doc in docs] if sign < 0 else ()
+        await self.stats.record(users=sign * len(docs), deleted_users=deleted)
+
+    async def _count_unknown(self, docs: List[Dict[str, Any]], deleted: int) -> None:
+        # Removing the post counters of users that are gone either way is safe to repeat
+        await self.stats.record(users=-deleted, deleted_users=[doc[self.id_field] for doc in docs])
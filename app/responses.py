@@ -0,0 +1,35 @@
+from typing import Any, AsyncIterator, Dict
+
+import orjson
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+def _default(value: Any) -> Any:
+    """Encode the BSON types orjson does not know about."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content: Any) -> bytes:
+    """Serialize Mongo documents or pydantic models straight to JSON bytes."""
+    if isinstance(content, BaseModel):
+        return content.__pydantic_serializer__.to_json(content)
+    return orjson.dumps(content, default=_default)
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response that encodes its content in a single pass.
+
+    Documents coming out of Mongo are already shaped by the repository
+    projections, so they are written to bytes by orjson as they are, without
+    a detour through pydantic models or the standard library encoder.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+async def ndjson_lines(docs: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Encode each document from an async iterator as one line of NDJSON."""
+    async for doc in docs:
+        yield orjson.dumps(doc, default=_default) + b"\n"
@@ -0,0 +1,88 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from typing import Optional
+
+from cache import ReadThroughCache
+from dependencies import get_cache, get_stats_repository, require_admin, require_profile_signature
+from models.stats_models import StatsReconciliation
+from profiling import list_profiles, profile_file
+from repositories.stats import StatsRepository
+from responses import FastJSONResponse
+
+router = APIRouter(prefix="/admin")
+
+@router.get("/cache")
+async def get_cache_stats(cache: Optional[ReadThroughCache] = Depends(get_cache)) -> FastJSONResponse:
+    """
+    Get cache statistics.
+
+    This endpoint returns the hit, miss and eviction counters of this worker's
+    entity cache, for sizing it.
+
+    Returns:
+        FastJSONResponse: The cache counters in JSON format, or enabled=false if caching is off.
+    """
+    if cache is None:
+        return FastJSONResponse(content={"enabled": False})
+    return FastJSONResponse(content={"enabled": True, **cache.stats()})
+
+@router.post("/stats:reconcile", response_model=StatsReconciliation, dependencies=[Depends(require_admin)])
+async def reconcile_stats(stats: StatsRepository = Depends(get_stats_repository)) -> FastJSONResponse:
+    """
+    Recount the stats.
+
+    This endpoint repairs any drift in the user and post counters by counting
+    the collections again: posts per user with one aggregation, whose counts
+    are written back in batches, and the totals with two counts. It reads every
+    post, so it is meant for maintenance, not for every request, and needs
+    the admin token.
+
+    Returns:
+        FastJSONResponse: The totals before and after the recount in JSON format.
+
+    Raises:
+        HTTPException: If another recount is running.
+    """
+    reconciliation = await stats.reconcile()
+    if reconciliation is None:
+        raise HTTPException(status_code=409, detail="A recount is already running")
+    return FastJSONResponse(content=reconciliation)
+
+@router.get("/profiles", dependencies=[Depends(require_profile_signature)])
+async def get_profiles() -> FastJSONResponse:
+    """
+    List request profiles.
+
+    This endpoint returns the summaries of the profiles kept in the profile
+    directory, newest first: the request, its wall clock time split into
+    phases, and the names of its speedscope and pstats files. It needs a
+    signed X-Profile header, and is not found while profiling is off.
+
+    Returns:
+        FastJSONResponse: The profile summaries in JSON format.
+    """
+    return FastJSONResponse(content={"profiles": list_profiles()})
+
+@router.get("/profiles/{name}", dependencies=[Depends(require_profile_signature)])
+async def get_profile_file(name: str) -> FileResponse:
+    """
+    Download a profile.
+
+    This endpoint returns one speedscope (`.speedscope.json`) or pstats
+    (`.pstats`) file listed by GET /admin/profiles. Speedscope files open at
+    https://www.speedscope.app, and pstats files with `python -m pstats`.
+    Like the listing, it needs a signed X-Profile header.
+
+    Args:
+        name (str): The file name.
+
+    Returns:
+        FileResponse: The profile file.
+
+    Raises:
+        HTTPException: If there is no such profile file.
+    """
+    path = profile_file(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
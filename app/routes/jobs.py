@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from models.job_models import JobStatus
+from jobs import JobRunner
+from responses import FastJSONResponse
+from dependencies import get_job_runner
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, jobs: JobRunner = Depends(get_job_runner)) -> FastJSONResponse:
+    """
+    Get a background job.
+
+    This endpoint returns the status and progress of a job, such as the one
+    deleting the posts of a deleted user. Finished jobs are kept for a week.
+
+    Args:
+        job_id (str): The unique identifier of the job.
+
+    Returns:
+        FastJSONResponse: The job's status in JSON format.
+
+    Raises:
+        HTTPException: If the job is not found.
+    """
+    job = await jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return FastJSONResponse(content=job)
@@ -0,0 +1,20 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from metrics import render_metrics
+
+router = APIRouter()
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """
+    Get Prometheus metrics.
+
+    This endpoint returns the request, Mongo command and pool metrics in the
+    Prometheus text format, for scraping.
+
+    Returns:
+        Response: The metrics in the Prometheus text format.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
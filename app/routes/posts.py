@@ -1,140 +1,467 @@
-from fastapi import APIRouter, status, HTTPException
-from fastapi.responses import JSONResponse
-from uuid import uuid1
-from bson import json_util
-import json
-from typing import List
+from fastapi import APIRouter, Body, Depends, Header, Query, status, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from ids import new_id
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from typing import Any, Dict, List, Literal, Optional, Union
 
-from models.post_models import Post, PostResponse, PostList
-from dev_init import mongo_client
+from models.post_models import PartialPostResponse, Post, PostResponse, PostList, PostSearchResults, PostUpdateItem
+from models.bulk_models import BulkDelete, BulkItemResult, BulkResult
+from repositories.posts import PostRepository
+from repositories.users import UserRepository
+from responses import FastJSONResponse, ndjson_lines
+from dependencies import get_feed, get_post_fields, get_post_repository, get_post_writer, get_user_loader, get_user_repository
+from coalescer import WriteCoalescer
+from feed import PostFeed, event_stream
+from fields import Fields, require, select
+from loaders import UserLoader
+from pagination import DEFAULT_PAGE_SIZE, MAX_OFFSET, MAX_PAGE_SIZE, decode_cursor, decode_offset, encode_offset
+from bulk import MAX_BULK_ITEMS, summarize, validate_items, write_failure
+from conditional import cache_headers, collection_etag, document_etag, etag_matches, if_match_version, not_modified
 
 router = APIRouter()
 
-mongo_client = mongo_client()
-posts = mongo_client['posts']
-users = mongo_client['users']
-
-@router.post("/posts", status_code=status.HTTP_200_OK)
-async def create_post(post: Post) -> JSONResponse:
+@router.post("/posts", response_model=PostResponse, status_code=status.HTTP_200_OK)
+async def create_post(
+    post: Post,
+    posts: Union[WriteCoalescer, PostRepository] = Depends(get_post_writer),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
     """
     Create a new post.
 
-    This endpoint creates a new post with the provided information.
+    This endpoint creates a new post with the provided information. With
+    WRITE_COALESCING on, the insert is batched with concurrent creates.
 
     Args:
         post (Post): The post information for creation.
 
     Returns:
-        JSONResponse: The created post's information in JSON format.
+        FastJSONResponse: The created post's information in JSON format.
 
     Raises:
         HTTPException: If the user does not exist or if a post with the same title already exists.
     """
-    user_exists = users.find_one({"user_id": post.user_id})
+    user_exists = await users.exists(post.user_id)
     if not user_exists:
         raise HTTPException(status_code=400, detail="User does not exist")
     
-    post_exists = posts.find_one({"title": post.title})
-    if post_exists:
-        raise HTTPException(status_code=400, detail="Post already exists")
-    
-    post_id = str(uuid1())
+    post_id = new_id()
     post_data = post.model_dump()
     post_data['post_id'] = post_id
-    posts.insert_one(post_data)
-    return JSONResponse(content=PostResponse(**post_data).model_dump(), status_code=200)
+    try:
+        version = await posts.insert(post_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Post already exists")
+    return FastJSONResponse(content=post_data, headers={"ETag": document_etag(version)})
 
-@router.get("/posts")
-async def get_posts() -> JSONResponse:
+@router.get("/posts", response_model=PostList)
+async def get_posts(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of posts to return"),
+    cursor: Optional[str] = Query(None, description="The next_cursor value from the previous page"),
+    stream: bool = Query(False, description="Stream every post as NDJSON instead of returning a page"),
+    expand: Optional[Literal["user"]] = Query(None, description="Set to user to embed each post's author"),
+    user_id: Optional[str] = Query(None, description="Only return posts by this user"),
+    fields: Fields = Depends(get_post_fields),
+    if_none_match: Optional[str] = Header(None),
+    posts: PostRepository = Depends(get_post_repository),
+    user_loader: UserLoader = Depends(get_user_loader),
+) -> FastJSONResponse:
     """
     Get all posts.
 
-    This endpoint retrieves information for all posts.
+    This endpoint retrieves posts one page at a time, in creation order,
+    optionally only those by one user.
+    With stream=true it instead streams every post after the cursor as
+    newline-delimited JSON. The ETag changes whenever any post is written, so
+    a matching If-None-Match is answered with 304 without running the query.
+    With expand=user every post embeds its author, fetched with one batched
+    query per page. With fields= only the selected fields are read from Mongo
+    and returned, so a list of titles does not carry the post contents.
+
+    Args:
+        limit (int): The maximum number of posts in the page.
+        cursor (Optional[str]): The cursor returned with the previous page.
+        stream (bool): Whether to stream all posts as NDJSON.
+        expand (Optional[str]): "user" to embed each post's author.
+        user_id (Optional[str]): Only return posts by this user.
+        fields (Fields): The fields to return, or None for all of them.
+        if_none_match (Optional[str]): The ETag of a previously fetched copy.
 
     Returns:
-        JSONResponse: A list containing information for all posts in JSON format.
+        FastJSONResponse: A page of posts and the cursor for the next page in JSON format.
 
     Raises:
-        HTTPException: If an error occurs while retrieving the posts.
+        HTTPException: If the cursor is invalid or an error occurs while retrieving the posts.
     """
+    after = decode_cursor(cursor) if cursor else None
+    # An expanded list also changes when an author changes
+    change_count = await posts.change_counter("users") if expand else await posts.change_counter()
+    etag = collection_etag(change_count, limit, cursor, stream, expand, user_id, fields)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    query = {"user_id": user_id} if user_id is not None else None
+    if expand:
+        # Embedding the author needs the author's ID
+        fields = require(fields, "user_id")
+    if stream:
+        documents = posts.stream_all(after, query, fields)
+        if expand:
+            documents = user_loader.embed_stream(documents)
+        return StreamingResponse(
+            ndjson_lines(documents),
+            media_type="application/x-ndjson",
+            headers=cache_headers(etag),
+        )
     try:
-        all_posts = list(posts.find({}, {"_id": 0, "post_id": 1, "title": 1, "content": 1, "user_id": 1}))
-        json_compatible_posts = json.loads(json_util.dumps(all_posts))
-        return JSONResponse(content=PostList(posts=json_compatible_posts).model_dump())
+        page, next_cursor = await posts.list_page(limit, after, query, fields)
+        if expand:
+            await user_loader.embed(page)
+        return FastJSONResponse(content={"posts": page, "next_cursor": next_cursor}, headers=cache_headers(etag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-@router.get("/posts/{post_id}")
-async def get_post_by_id(post_id: str) -> JSONResponse:
+@router.get("/users/{user_id}/posts", response_model=PostList)
+async def get_posts_by_user(
+    user_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of posts to return"),
+    cursor: Optional[str] = Query(None, description="The next_cursor value from the previous page"),
+    fields: Fields = Depends(get_post_fields),
+    if_none_match: Optional[str] = Header(None),
+    posts: PostRepository = Depends(get_post_repository),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
+    """
+    Get a user's posts.
+
+    This endpoint retrieves the posts written by one user, one page at a time,
+    in creation order. Each page is a range scan of the (user_id, _id) index,
+    so its cost depends on the page size and not on the number of posts.
+    With fields= only the selected fields are read from Mongo and returned.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+        limit (int): The maximum number of posts in the page.
+        cursor (Optional[str]): The cursor returned with the previous page.
+        fields (Fields): The fields to return, or None for all of them.
+        if_none_match (Optional[str]): The ETag of a previously fetched copy.
+
+    Returns:
+        FastJSONResponse: A page of the user's posts and the cursor for the next page in JSON format.
+
+    Raises:
+        HTTPException: If the cursor is invalid or the user is not found.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    etag = collection_etag(await posts.change_counter(), "user", user_id, limit, cursor, fields)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    page, next_cursor = await posts.list_page(limit, after, {"user_id": user_id}, fields)
+    # Only an empty first page needs the extra query to tell an unknown user from one with no posts
+    if not page and after is None and not await users.exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    return FastJSONResponse(content={"posts": page, "next_cursor": next_cursor}, headers=cache_headers(etag))
+
+# Declared before /posts/{post_id}, which would otherwise match "search" as a post ID
+@router.get("/posts/search", response_model=PostSearchResults)
+async def search_posts(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to search post titles and content for"),
+    user_id: Optional[str] = Query(None, description="Only return posts by this user"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of posts to return"),
+    cursor: Optional[str] = Query(None, description="The next_cursor value from the previous page"),
+    fields: Fields = Depends(get_post_fields),
+    if_none_match: Optional[str] = Header(None),
+    posts: PostRepository = Depends(get_post_repository),
+) -> FastJSONResponse:
+    """
+    Search posts.
+
+    This endpoint returns the posts whose title or content match any of the
+    query words, best match first, one page at a time. Title matches rank above
+    content matches. With fields= only the selected fields and the score are
+    returned.
+
+    Args:
+        q (str): The words to search for.
+        user_id (Optional[str]): Only return posts by this user.
+        limit (int): The maximum number of posts in the page.
+        cursor (Optional[str]): The cursor returned with the previous page.
+        fields (Fields): The fields to return, or None for all of them.
+        if_none_match (Optional[str]): The ETag of a previously fetched copy.
+
+    Returns:
+        FastJSONResponse: A page of matching posts with their scores and the cursor for the next page in JSON format.
+
+    Raises:
+        HTTPException: If the cursor is invalid.
+    """
+    offset = decode_offset(cursor) if cursor else 0
+    etag = collection_etag(await posts.change_counter(), "search", q, user_id, limit, offset, fields)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    hits, more = await posts.search_page(q, user_id, limit, offset, fields)
+    next_offset = offset + len(hits)
+    next_cursor = encode_offset(next_offset) if more and next_offset <= MAX_OFFSET else None
+    return FastJSONResponse(content={"posts": hits, "next_cursor": next_cursor}, headers=cache_headers(etag))
+
+# Declared before /posts/{post_id} for the same reason
+@router.get("/posts/stream", response_class=StreamingResponse)
+async def stream_post_changes(
+    after: Optional[str] = Query(None, description="Resume after this event ID, for clients that cannot send Last-Event-ID"),
+    last_event_id: Optional[str] = Header(None),
+    feed: PostFeed = Depends(get_feed),
+) -> StreamingResponse:
+    """
+    Stream post changes.
+
+    This endpoint pushes a Server-Sent Event for every post created, updated
+    or deleted, from any worker, as it happens, instead of clients polling
+    GET /posts. Each event's id is a resume token: a client that reconnects
+    with Last-Event-ID, as EventSource does, receives the events it missed.
+
+    Args:
+        after (Optional[str]): The last event ID received, if the client cannot send Last-Event-ID.
+        last_event_id (Optional[str]): The last event ID received, sent by EventSource on reconnect.
+
+    Returns:
+        StreamingResponse: A text/event-stream of create, update and delete events.
+
+    Raises:
+        HTTPException: If MongoDB does not run as a replica set, which change streams need.
+    """
+    try:
+        subscription = await feed.subscribe(last_event_id or after)
+    except OperationFailure:
+        raise HTTPException(status_code=503, detail="The post feed needs MongoDB to run as a replica set")
+    return StreamingResponse(
+        event_stream(subscription),
+        media_type="text/event-stream",
+        # Keep proxies from buffering or caching the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/posts/{post_id}", response_model=PartialPostResponse)
+async def get_post_by_id(
+    post_id: str,
+    expand: Optional[Literal["user"]] = Query(None, description="Set to user to embed the post's author"),
+    fields: Fields = Depends(get_post_fields),
+    if_none_match: Optional[str] = Header(None),
+    posts: PostRepository = Depends(get_post_repository),
+    user_loader: UserLoader = Depends(get_user_loader),
+) -> FastJSONResponse:
     """
     Get a post by ID.
 
     This endpoint retrieves information for a specific post based on its post ID.
+    A matching If-None-Match is answered with 304 and no body. With expand=user
+    the post embeds its author, and the ETag also covers the author's version.
+    With fields= only the selected fields are returned; the post is still read
+    in full, so that every selection shares one cache entry.
 
     Args:
         post_id (str): The unique identifier of the post.
+        expand (Optional[str]): "user" to embed the post's author.
+        fields (Fields): The fields to return, or None for all of them.
+        if_none_match (Optional[str]): The ETag of a previously fetched copy.
 
     Returns:
-        JSONResponse: The post's information in JSON format.
+        FastJSONResponse: The post's information in JSON format.
 
     Raises:
         HTTPException: If the post is not found.
     """
-    post = posts.find_one({"post_id": post_id}, {"_id": 0, "post_id": 1, "title": 1, "content": 1, "user_id": 1})
-    if post:
-        return JSONResponse(content=PostResponse(**post).model_dump())
-    else:
+    post = await posts.find_by_id(post_id)
+    if not post:
         raise HTTPException(status_code=404, detail="Post not found")
+    version = post.pop("version", 0)
+    variant = (fields,) if fields else ()
+    if expand:
+        post = select(post, require(fields, "user_id"))
+        author_version = await user_loader.embed_one(post)
+        etag = document_etag(version, expand, author_version, *variant)
+    else:
+        post = select(post, fields)
+        etag = document_etag(version, *variant)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return FastJSONResponse(content=post, headers=cache_headers(etag))
 
-@router.put("/posts/{post_id}")
-async def update_post(post_id: str, post: Post) -> JSONResponse:
+@router.put("/posts/{post_id}", response_model=PostResponse)
+async def update_post(
+    post_id: str,
+    post: Post,
+    if_match: Optional[str] = Header(None),
+    posts: PostRepository = Depends(get_post_repository),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
     """
     Update a post.
 
-    This endpoint updates the information for an existing post.
+    This endpoint updates the information for an existing post. With If-Match, the
+    update only applies if the post is still at the version of that ETag.
 
     Args:
         post_id (str): The unique identifier of the post to update.
         post (Post): The updated post information.
+        if_match (Optional[str]): The ETag the post must still have.
 
     Returns:
-        JSONResponse: The updated post's information in JSON format.
+        FastJSONResponse: The updated post's information in JSON format.
 
     Raises:
-        HTTPException: If the post is not found or if the user does not exist.
+        HTTPException: If the post is not found, if the user does not exist, if
+            another post already has the same title or if the post changed since
+            the If-Match ETag.
     """
-    post_exists = posts.find_one({"post_id": post_id})
-    if not post_exists:
-        raise HTTPException(status_code=404, detail="Post not found")
-
-    user_exists = users.find_one({"user_id": post.user_id})
+    expected_version = if_match_version(if_match)
+    user_exists = await users.exists(post.user_id)
     if not user_exists:
+        # A missing post is reported before a missing user, so the post is only looked up on this path
+        if not await posts.exists(post_id):
+            raise HTTPException(status_code=404, detail="Post not found")
         raise HTTPException(status_code=400, detail="User does not exist")
     
     updated_post = post.model_dump()
     updated_post['post_id'] = post_id
-    posts.update_one({"post_id": post_id}, {"$set": updated_post})
-    return JSONResponse(content=PostResponse(**updated_post).model_dump())
+    try:
+        updated_post = await posts.update(post_id, updated_post, expected_version)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Post already exists")
+    if not updated_post:
+        if expected_version is not None and await posts.exists(post_id):
+            raise HTTPException(status_code=412, detail="Precondition failed")
+        raise HTTPException(status_code=404, detail="Post not found")
+    etag = document_etag(updated_post.pop("version"))
+    return FastJSONResponse(content=updated_post, headers={"ETag": etag})
 
-@router.delete("/posts/{post_id}", status_code=status.HTTP_200_OK)
-async def delete_post(post_id: str) -> JSONResponse:
+@router.delete("/posts/{post_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_post(
+    post_id: str,
+    if_match: Optional[str] = Header(None),
+    posts: PostRepository = Depends(get_post_repository),
+) -> Response:
     """
     Delete a post.
 
-    This endpoint deletes a post based on its post ID.
+    This endpoint deletes a post based on its post ID. With If-Match, the post is
+    only deleted if it is still at the version of that ETag.
 
     Args:
         post_id (str): The unique identifier of the post to delete.
+        if_match (Optional[str]): The ETag the post must still have.
 
     Returns:
-        JSONResponse: A confirmation message in JSON format.
+        Response: An empty 204 response.
 
     Raises:
-        HTTPException: If the post is not found.
+        HTTPException: If the post is not found or changed since the If-Match ETag.
     """
-    post_exists = posts.find_one({"post_id": post_id})
-    if not post_exists:
+    expected_version = if_match_version(if_match)
+    deleted = await posts.delete(post_id, expected_version)
+    if not deleted:
+        if expected_version is not None and await posts.exists(post_id):
+            raise HTTPException(status_code=412, detail="Precondition failed")
         raise HTTPException(status_code=404, detail="Post not found")
-    
-    posts.delete_one({"post_id": post_id})
-    return JSONResponse(content={"message": "Post deleted successfully"}, status_code=204)
\ No newline at end of file
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/posts:bulk", response_model=BulkResult)
+async def create_posts_bulk(
+    items: List[Dict[str, Any]] = Body(..., min_length=1, max_length=MAX_BULK_ITEMS),
+    posts: PostRepository = Depends(get_post_repository),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
+    """
+    Create posts in bulk.
+
+    This endpoint validates every post on its own, checks all authors with a single
+    $in query and inserts the valid posts in one unordered batch. A rejected post
+    does not stop the others.
+
+    Args:
+        items (List[Dict[str, Any]]): The posts to create, in Post format.
+
+    Returns:
+        FastJSONResponse: The result of every item, in request order, in JSON format.
+    """
+    valid, results = validate_items(Post, items)
+    found_users = await users.existing_ids({post.user_id for _, post in valid})
+
+    docs, positions = [], []
+    for index, post in valid:
+        if post.user_id not in found_users:
+            results[index] = BulkItemResult(index=index, status=400, detail="User does not exist")
+            continue
+        post_data = post.model_dump()
+        post_data['post_id'] = new_id()
+        docs.append(post_data)
+        positions.append(index)
+
+    failures = await posts.insert_many(docs)
+    for position, index in enumerate(positions):
+        if position in failures:
+            results[index] = write_failure(index, failures[position], "Post already exists")
+        else:
+            results[index] = BulkItemResult(index=index, status=200, id=docs[position]['post_id'])
+    return FastJSONResponse(content=summarize(results))
+
+@router.put("/posts:bulk", response_model=BulkResult)
+async def update_posts_bulk(
+    items: List[Dict[str, Any]] = Body(..., min_length=1, max_length=MAX_BULK_ITEMS),
+    posts: PostRepository = Depends(get_post_repository),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
+    """
+    Update posts in bulk.
+
+    This endpoint checks all authors and all target posts with one query each, then
+    applies every valid update in one unordered batch.
+
+    Args:
+        items (List[Dict[str, Any]]): The updates, in PostUpdateItem format.
+
+    Returns:
+        FastJSONResponse: The result of every item, in request order, in JSON format.
+    """
+    valid, results = validate_items(PostUpdateItem, items)
+    found_users = await users.existing_ids({post.user_id for _, post in valid})
+    found_posts = await posts.existing_ids({post.post_id for _, post in valid})
+
+    updates, positions = [], []
+    for index, post in valid:
+        if post.user_id not in found_users:
+            results[index] = BulkItemResult(index=index, status=400, id=post.post_id, detail="User does not exist")
+        elif post.post_id not in found_posts:
+            results[index] = BulkItemResult(index=index, status=404, id=post.post_id, detail="Post not found")
+        else:
+            positions.append(index)
+            updates.append((post.post_id, post.model_dump()))
+
+    failures = await posts.update_many(updates)
+    for position, index in enumerate(positions):
+        post_id = updates[position][0]
+        if position in failures:
+            results[index] = write_failure(index, failures[position], "Post already exists", post_id)
+        else:
+            results[index] = BulkItemResult(index=index, status=200, id=post_id)
+    return FastJSONResponse(content=summarize(results))
+
+@router.post("/posts:bulkDelete", response_model=BulkResult)
+async def delete_posts_bulk(body: BulkDelete, posts: PostRepository = Depends(get_post_repository)) -> FastJSONResponse:
+    """
+    Delete posts in bulk.
+
+    This endpoint deletes every listed post with a single delete_many, and
+    reports an ID deleted when the delete removed the post.
+
+    Args:
+        body (BulkDelete): The IDs of the posts to delete.
+
+    Returns:
+        FastJSONResponse: The result of every ID, in request order, in JSON format.
+    """
+    deleted = await posts.delete_many(body.ids)
+    results = {
+        index: BulkItemResult(index=index, status=204, id=post_id) if post_id in deleted
+        else BulkItemResult(index=index, status=404, id=post_id, detail="Post not found")
+        for index, post_id in enumerate(body.ids)
+    }
+    return FastJSONResponse(content=summarize(results))
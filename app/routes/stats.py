@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from models.stats_models import Stats, UserStats
+from repositories.stats import StatsRepository
+from repositories.users import UserRepository
+from responses import FastJSONResponse
+from dependencies import get_stats_repository, get_user_repository
+
+router = APIRouter()
+
+@router.get("/stats", response_model=Stats)
+async def get_stats(stats: StatsRepository = Depends(get_stats_repository)) -> FastJSONResponse:
+    """
+    Get the number of users and posts.
+
+    This endpoint reads counters that every create and delete keeps up to
+    date, so it costs one single-document read however large the collections
+    grow.
+
+    Returns:
+        FastJSONResponse: The user and post totals in JSON format.
+    """
+    return FastJSONResponse(content=await stats.totals())
+
+@router.get("/users/{user_id}/stats", response_model=UserStats)
+async def get_user_stats(
+    user_id: str,
+    stats: StatsRepository = Depends(get_stats_repository),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
+    """
+    Get a user's stats.
+
+    This endpoint returns the number of posts by a user, from a counter kept
+    up to date by every post write.
+
+    Args:
+        user_id (str): The unique identifier of the user.
+
+    Returns:
+        FastJSONResponse: The user's post count in JSON format.
+
+    Raises:
+        HTTPException: If the user is not found.
+    """
+    posts = await stats.user_posts(user_id)
+    # Only a user without posts has no counter, so only then is the user looked up
+    if not posts and not await users.exists(user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+    return FastJSONResponse(content={"user_id": user_id, "posts": posts})
@@ -1,130 +1,315 @@
-from fastapi import APIRouter, status, HTTPException, Request
-from fastapi.responses import JSONResponse
-from uuid import uuid1
-from bson import json_util
-import json
-from typing import List, Dict, Any
+from fastapi import APIRouter, Body, Depends, Header, Query, status, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from ids import new_id
+from pymongo.errors import DuplicateKeyError
+from typing import List, Dict, Any, Optional, Union
 
-from models.user_models import UserRegister, UserResponse, UserList
+from models.user_models import PartialUserResponse, UserRegister, UserResponse, UserList, UserUpdateItem
+from models.bulk_models import BulkDelete, BulkItemResult, BulkResult
+from models.job_models import JobStatus
+from repositories.users import UserRepository
+from jobs import JobRunner
 
-from dev_init import mongo_client
+from responses import FastJSONResponse, ndjson_lines
+from dependencies import get_job_runner, get_user_fields, get_user_repository, get_user_writer
+from coalescer import WriteCoalescer
+from fields import Fields, select
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor
+from bulk import MAX_BULK_ITEMS, summarize, validate_items, write_failure
+from conditional import cache_headers, collection_etag, document_etag, etag_matches, if_match_version, not_modified
 
 router = APIRouter()
 
-mongo_client = mongo_client()
-users = mongo_client['users']
-
-@router.post("/users", status_code=status.HTTP_201_CREATED)
-async def create_user(user: UserRegister) -> JSONResponse:
+@router.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+async def create_user(
+    user: UserRegister,
+    users: Union[WriteCoalescer, UserRepository] = Depends(get_user_writer),
+) -> FastJSONResponse:
     """
     Create a new user.
 
-    This endpoint creates a new user with the provided information.
+    This endpoint creates a new user with the provided information. With
+    WRITE_COALESCING on, the insert is batched with concurrent creates.
 
     Args:
         user (UserRegister): The user information for registration.
 
     Returns:
-        JSONResponse: The created user's information in JSON format.
+        FastJSONResponse: The created user's information in JSON format.
 
     Raises:
         HTTPException: If a user with the same email already exists.
     """
-    user_exists = users.find_one({"email": user.email})
-    if user_exists:
-        raise HTTPException(status_code=400, detail="User already exists")
-    
-    user_id = str(uuid1())
+    user_id = new_id()
     user_data = user.model_dump()
     user_data['user_id'] = user_id
-    users.insert_one(user_data)
-    return JSONResponse(content=UserResponse(**user_data).model_dump())
+    try:
+        version = await users.insert(user_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
+    return FastJSONResponse(content=user_data, headers={"ETag": document_etag(version)})
 
-@router.get("/users")
-async def get_all_users() -> JSONResponse:
+@router.get("/users", response_model=UserList)
+async def get_all_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Maximum number of users to return"),
+    cursor: Optional[str] = Query(None, description="The next_cursor value from the previous page"),
+    stream: bool = Query(False, description="Stream every user as NDJSON instead of returning a page"),
+    fields: Fields = Depends(get_user_fields),
+    if_none_match: Optional[str] = Header(None),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
     """
     Get all users.
 
-    This endpoint retrieves information for all registered users.
+    This endpoint retrieves registered users one page at a time, in creation order.
+    With stream=true it instead streams every user after the cursor as
+    newline-delimited JSON. The ETag changes whenever any user is written, so
+    a matching If-None-Match is answered with 304 without running the query.
+    With fields= only the selected fields are read from Mongo and returned.
+
+    Args:
+        limit (int): The maximum number of users in the page.
+        cursor (Optional[str]): The cursor returned with the previous page.
+        stream (bool): Whether to stream all users as NDJSON.
+        fields (Fields): The fields to return, or None for all of them.
+        if_none_match (Optional[str]): The ETag of a previously fetched copy.
 
     Returns:
-        JSONResponse: A list containing information for all users in JSON format.
+        FastJSONResponse: A page of users and the cursor for the next page in JSON format.
 
     Raises:
-        HTTPException: If an error occurs while retrieving the users.
+        HTTPException: If the cursor is invalid or an error occurs while retrieving the users.
     """
+    after = decode_cursor(cursor) if cursor else None
+    etag = collection_etag(await users.change_counter(), limit, cursor, stream, fields)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    if stream:
+        return StreamingResponse(
+            ndjson_lines(users.stream_all(after, fields=fields)),
+            media_type="application/x-ndjson",
+            headers=cache_headers(etag),
+        )
     try:
-        all_users = list(users.find({}, {"_id": 0, "user_id": 1, "fullName": 1, "email": 1}))
-        json_compatible_users = json.loads(json_util.dumps(all_users))
-        return JSONResponse(content={"users": json_compatible_users})
+        page, next_cursor = await users.list_page(limit, after, fields=fields)
+        return FastJSONResponse(content={"users": page, "next_cursor": next_cursor}, headers=cache_headers(etag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-@router.get("/users/{user_id}")
-async def get_user_by_id(user_id: str) -> JSONResponse:
+@router.get("/users/{user_id}", response_model=PartialUserResponse)
+async def get_user_by_id(
+    user_id: str,
+    fields: Fields = Depends(get_user_fields),
+    if_none_match: Optional[str] = Header(None),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
     """
     Get a user by ID.
 
     This endpoint retrieves information for a specific user based on their user ID.
+    A matching If-None-Match is answered with 304 and no body. With fields= only
+    the selected fields are returned; the user is still read in full, so that
+    every selection shares one cache entry.
 
     Args:
         user_id (str): The unique identifier of the user.
+        fields (Fields): The fields to return, or None for all of them.
+        if_none_match (Optional[str]): The ETag of a previously fetched copy.
 
     Returns:
-        JSONResponse: The user's information in JSON format.
+        FastJSONResponse: The user's information in JSON format.
 
     Raises:
         HTTPException: If the user is not found.
     """
-    user = users.find_one({"user_id": user_id}, {"_id": 0, "user_id": 1, "fullName": 1, "email": 1})
-    if user:
-        return JSONResponse(content=user)
-    else:
+    user = await users.find_by_id(user_id)
+    if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    version = user.pop("version", 0)
+    # Each selection is its own representation, so it gets its own ETag
+    etag = document_etag(version, fields) if fields else document_etag(version)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return FastJSONResponse(content=select(user, fields), headers=cache_headers(etag))
 
-@router.put("/users/{user_id}")
-async def update_user(user_id: str, user: UserRegister) -> JSONResponse:
+@router.put("/users/{user_id}", response_model=UserResponse)
+async def update_user(
+    user_id: str,
+    user: UserRegister,
+    if_match: Optional[str] = Header(None),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
     """
     Update a user.
 
-    This endpoint updates the information for an existing user.
+    This endpoint updates the information for an existing user. With If-Match, the
+    update only applies if the user is still at the version of that ETag.
 
     Args:
         user_id (str): The unique identifier of the user to update.
         user (UserRegister): The updated user information.
+        if_match (Optional[str]): The ETag the user must still have.
 
     Returns:
-        JSONResponse: The updated user's information in JSON format.
+        FastJSONResponse: The updated user's information in JSON format.
 
     Raises:
-        HTTPException: If the user is not found.
+        HTTPException: If the user is not found, the email belongs to another user
+            or the user changed since the If-Match ETag.
     """
-    user_exists = users.find_one({"user_id": user_id})
-    if not user_exists:
-        raise HTTPException(status_code=404, detail="User not found")
+    expected_version = if_match_version(if_match)
     updated_user = user.model_dump()
     updated_user['user_id'] = user_id
-    users.update_one({"user_id": user_id}, {"$set": updated_user})
-    return JSONResponse(content=UserResponse(**updated_user).model_dump())
+    try:
+        updated_user = await users.update(user_id, updated_user, expected_version)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already exists")
+    if not updated_user:
+        if expected_version is not None and await users.exists(user_id):
+            raise HTTPException(status_code=412, detail="Precondition failed")
+        raise HTTPException(status_code=404, detail="User not found")
+    etag = document_etag(updated_user.pop("version"))
+    return FastJSONResponse(content=updated_user, headers={"ETag": etag})
 
-@router.delete("/users/{user_id}", status_code=status.HTTP_200_OK)
-async def delete_user(user_id: str) -> JSONResponse:
+@router.delete(
+    "/users/{user_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    responses={202: {"model": JobStatus, "description": "The user was deleted and a job is deleting their posts"}},
+)
+async def delete_user(
+    user_id: str,
+    if_match: Optional[str] = Header(None),
+    users: UserRepository = Depends(get_user_repository),
+    jobs: JobRunner = Depends(get_job_runner),
+) -> Response:
     """
     Delete a user.
 
-    This endpoint deletes a user based on their user ID.
+    This endpoint deletes a user based on their user ID, together with their
+    posts. With If-Match, the user is only deleted if it is still at the version
+    of that ETag. If the user has more posts than can be deleted within the
+    request, the rest are deleted by a background job, whose status is at the
+    Location of the 202 response.
 
     Args:
         user_id (str): The unique identifier of the user to delete.
+        if_match (Optional[str]): The ETag the user must still have.
 
     Returns:
-        JSONResponse: A confirmation message in JSON format.
+        Response: An empty 204 response, or a 202 response with the job deleting the posts.
 
     Raises:
-        HTTPException: If the user is not found.
+        HTTPException: If the user is not found or changed since the If-Match ETag.
     """
-    user_exists = users.find_one({"user_id": user_id})
-    if not user_exists:
+    expected_version = if_match_version(if_match)
+    deleted = await users.delete(user_id, expected_version)
+    if not deleted:
+        if expected_version is not None and await users.exists(user_id):
+            raise HTTPException(status_code=412, detail="Precondition failed")
         raise HTTPException(status_code=404, detail="User not found")
-    users.delete_one({"user_id": user_id})
-    return JSONResponse(content={"message": "User deleted successfully"}, status_code=204)
\ No newline at end of file
+    job = await jobs.delete_posts_of([user_id])
+    if job is not None:
+        return FastJSONResponse(status_code=status.HTTP_202_ACCEPTED, content=job, headers={"Location": f"/jobs/{job['job_id']}"})
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/users:bulk", response_model=BulkResult)
+async def create_users_bulk(
+    items: List[Dict[str, Any]] = Body(..., min_length=1, max_length=MAX_BULK_ITEMS),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
+    """
+    Create users in bulk.
+
+    This endpoint validates every user on its own and inserts the valid ones in a
+    single unordered batch. An invalid or duplicate user does not stop the others.
+
+    Args:
+        items (List[Dict[str, Any]]): The users to create, in UserRegister format.
+
+    Returns:
+        FastJSONResponse: The result of every item, in request order, in JSON format.
+    """
+    valid, results = validate_items(UserRegister, items)
+    docs = []
+    for _, user in valid:
+        user_data = user.model_dump()
+        user_data['user_id'] = new_id()
+        docs.append(user_data)
+
+    failures = await users.insert_many(docs)
+    for position, (index, _) in enumerate(valid):
+        if position in failures:
+            results[index] = write_failure(index, failures[position], "User already exists")
+        else:
+            results[index] = BulkItemResult(index=index, status=201, id=docs[position]['user_id'])
+    return FastJSONResponse(content=summarize(results))
+
+@router.put("/users:bulk", response_model=BulkResult)
+async def update_users_bulk(
+    items: List[Dict[str, Any]] = Body(..., min_length=1, max_length=MAX_BULK_ITEMS),
+    users: UserRepository = Depends(get_user_repository),
+) -> FastJSONResponse:
+    """
+    Update users in bulk.
+
+    This endpoint checks which users exist with a single query, then applies every
+    valid update in one unordered batch.
+
+    Args:
+        items (List[Dict[str, Any]]): The updates, in UserUpdateItem format.
+
+    Returns:
+        FastJSONResponse: The result of every item, in request order, in JSON format.
+    """
+    valid, results = validate_items(UserUpdateItem, items)
+    found = await users.existing_ids({user.user_id for _, user in valid})
+
+    updates, positions = [], []
+    for index, user in valid:
+        if user.user_id not in found:
+            results[index] = BulkItemResult(index=index, status=404, id=user.user_id, detail="User not found")
+            continue
+        positions.append(index)
+        updates.append((user.user_id, user.model_dump()))
+
+    failures = await users.update_many(updates)
+    for position, index in enumerate(positions):
+        user_id = updates[position][0]
+        if position in failures:
+            results[index] = write_failure(index, failures[position], "User already exists", user_id)
+        else:
+            results[index] = BulkItemResult(index=index, status=200, id=user_id)
+    return FastJSONResponse(content=summarize(results))
+
+@router.post("/users:bulkDelete", response_model=BulkResult)
+async def delete_users_bulk(
+    body: BulkDelete,
+    users: UserRepository = Depends(get_user_repository),
+    jobs: JobRunner = Depends(get_job_runner),
+) -> FastJSONResponse:
+    """
+    Delete users in bulk.
+
+    This endpoint deletes every listed user with a single delete_many, together
+    with their posts. An ID is reported deleted, and its posts deleted, when
+    the delete removed the user. If the users have more posts than can be
+    deleted within the request, the rest are deleted by a background job,
+    given as job_id.
+
+    Args:
+        body (BulkDelete): The IDs of the users to delete.
+
+    Returns:
+        FastJSONResponse: The result of every ID, in request order, in JSON format.
+    """
+    deleted = await users.delete_many(body.ids)
+    results = {
+        index: BulkItemResult(index=index, status=204, id=user_id) if user_id in deleted
+        else BulkItemResult(index=index, status=404, id=user_id, detail="User not found")
+        for index, user_id in enumerate(body.ids)
+    }
+    summary = summarize(results)
+    job = await jobs.delete_posts_of(list(deleted))
+    if job is not None:
+        summary.job_id = job["job_id"]
+    return FastJSONResponse(content=summary)
@@ -0,0 +1,225 @@
+"""
+Read routing: which replica set members serve each class of endpoint, with read-your-writes.
+
+Every request is sorted into a class: `list` for pages, exports and
+searches, `read` for other reads, and `write` for everything else. Each read
+class has its own read preference, so that the heavy list scans can move to
+secondaries while point reads stay on the primary. Write requests, and the
+reads they make, always go to the primary.
+
+A secondary may not have replicated a write the client has just made. So
+the response to a write carries X-Operation-Time, the latest operation time
+this worker has seen from Mongo, which covers the write. A client that sends
+it back reads through a causally consistent session, and a secondary waits
+until it has replicated that far before it answers. Reads echo the header
+back, so a client can simply send the last one it got. A time this worker
+has not seen yet, which another worker has just handed out, is read from the
+primary instead, because the driver could not send a secondary a cluster
+time that recent.
+
+Routing is only installed when a class reads from something other than the
+primary. By default, every read goes to the primary and routing costs
+nothing.
+
+Configuration is read from the environment:
+
+    READ_PREFERENCE_LIST         read preference of lists, exports and searches (primary)
+    READ_PREFERENCE_READ         read preference of other reads (primary)
+    READ_MAX_STALENESS_SECONDS   do not read from secondaries further behind than this; at least 90 (unset)
+
+A read preference is one of primary, primaryPreferred, secondary,
+secondaryPreferred and nearest.
+"""
+import os
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from bson.timestamp import Timestamp
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+from pymongo import monitoring
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+
+from admission import LIST_PATHS
+
+# Header carrying operation times to clients and back
+OPERATION_TIME_HEADER = b"x-operation-time"
+
+# Read preferences by name, as in connection strings
+READ_MODES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest,
+}
+
+# The driver refuses smaller staleness bounds
+MIN_MAX_STALENESS_SECONDS = 90
+
+def read_preference(name: str, max_staleness: int = -1) -> Any:
+    """
+    Build a read preference from its name.
+
+    Args:
+        name (str): One of READ_MODES.
+        max_staleness (int): Seconds a secondary may lag behind and still be read from, or -1 for no bound.
+
+    Returns:
+        The pymongo read preference. The staleness bound does not apply to primary.
+
+    Raises:
+        ValueError: If the name is unknown or the bound is below MIN_MAX_STALENESS_SECONDS.
+    """
+    if name not in READ_MODES:
+        raise ValueError(f"Unknown read preference: {name}")
+    if max_staleness != -1 and max_staleness < MIN_MAX_STALENESS_SECONDS:
+        raise ValueError(f"READ_MAX_STALENESS_SECONDS must be at least {MIN_MAX_STALENESS_SECONDS}")
+    if name == "primary":
+        return Primary()
+    return READ_MODES[name](max_staleness=max_staleness)
+
+READ_MAX_STALENESS_SECONDS = int(os.getenv('READ_MAX_STALENESS_SECONDS', '-1'))
+
+# Read preference of each class of request
+READ_PREFERENCES: Dict[str, Any] = {
+    "list": read_preference(os.getenv('READ_PREFERENCE_LIST', 'primary'), READ_MAX_STALENESS_SECONDS),
+    "read": read_preference(os.getenv('READ_PREFERENCE_READ', 'primary'), READ_MAX_STALENESS_SECONDS),
+    "write": Primary(),
+}
+
+READ_ROUTING = any(preference != Primary() for preference in READ_PREFERENCES.values())
+
+def read_class(method: str, path: str) -> str:
+    """Return the class of a request: list, read or write."""
+    if method not in ("GET", "HEAD"):
+        return "write"
+    return "list" if LIST_PATHS.match(path) else "read"
+
+def encode_operation_time(operation_time: Timestamp) -> str:
+    """Encode an operation time for the X-Operation-Time header."""
+    return f"{operation_time.time}.{operation_time.inc}"
+
+def decode_operation_time(value: str) -> Optional[Timestamp]:
+    """Decode an X-Operation-Time header, or return None if it is malformed."""
+    try:
+        seconds, increment = value.split(".")
+        return Timestamp(int(seconds), int(increment))
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+class RequestRoute:
+    """The read preference of a request, and the operation time its reads must follow."""
+
+    __slots__ = ("read_preference", "after")
+
+    def __init__(self, read_preference: Any, after: Optional[Timestamp] = None):
+        self.read_preference = read_preference
+        self.after = after
+
+# The route of the request being handled; tasks a request starts inherit it
+CURRENT_ROUTE: ContextVar[Optional[RequestRoute]] = ContextVar("current_route", default=None)
+
+_latest_lock = threading.Lock()
+_latest: Optional[Timestamp] = None
+
+def latest_operation_time() -> Optional[Timestamp]:
+    """Return the latest operation time in any reply this worker got, or None before the first."""
+    return _latest
+
+class OperationTimeListener(monitoring.CommandListener):
+    """
+    Keeps the latest operation time of the replies to this worker's commands.
+
+    The driver sends every command the latest cluster time it has seen, which
+    is never behind the latest operation time, so a secondary accepts reads
+    that must follow it.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        global _latest
+        # Standalone servers send no operation time
+        operation_time = event.reply.get("operationTime")
+        if operation_time is None:
+            return
+        # Replies arrive on several driver threads at once
+        with _latest_lock:
+            if _latest is None or operation_time > _latest:
+                _latest = operation_time
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        pass
+
+def routing_listeners() -> List[monitoring.CommandListener]:
+    """Return the pymongo event listeners to register on the client, if reads are routed."""
+    return [OperationTimeListener()] if READ_ROUTING else []
+
+@asynccontextmanager
+async def routed(collection: AsyncIOMotorCollection) -> AsyncIterator[Tuple[AsyncIOMotorCollection, Optional[AsyncIOMotorClientSession]]]:
+    """
+    Route the reads made in the block by the read preference of the current request.
+
+    Yields:
+        The collection with the request's read preference, and the session to
+        pass to each read: a causally consistent one when the client sent an
+        operation time, otherwise None. Outside a request, and for requests
+        that read from the primary, the collection itself and None.
+    """
+    route = CURRENT_ROUTE.get()
+    if route is None or route.read_preference == Primary():
+        yield collection, None
+        return
+    after = route.after
+    latest = latest_operation_time()
+    if after is not None and (latest is None or after > latest):
+        # A secondary would reject a time newer than any the driver can send it, but the primary has the write
+        yield collection, None
+        return
+    collection = collection.with_options(read_preference=route.read_preference)
+    if after is None:
+        yield collection, None
+        return
+    async with await collection.database.client.start_session(causal_consistency=True) as session:
+        session.advance_operation_time(after)
+        yield collection, session
+
+class ReadRoutingMiddleware:
+    """
+    ASGI middleware setting the read route of each request and passing operation times to and from clients.
+
+    Write responses get the latest operation time of the worker, and read
+    responses the one the client sent, if any.
+    """
+
+    def __init__(self, app, read_preferences: Optional[Dict[str, Any]] = None):
+        self.app = app
+        self.read_preferences = read_preferences or READ_PREFERENCES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_class = read_class(scope["method"], scope["path"])
+        after = None
+        for name, value in scope["headers"]:
+            if name == OPERATION_TIME_HEADER:
+                after = decode_operation_time(value.decode("latin-1"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                operation_time = latest_operation_time() if request_class == "write" else after
+                if operation_time is not None:
+                    header = (OPERATION_TIME_HEADER, encode_operation_time(operation_time).encode())
+                    message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
+
+        token = CURRENT_ROUTE.set(RequestRoute(self.read_preferences[request_class], after))
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            CURRENT_ROUTE.reset(token)
@@ -0,0 +1,156 @@
+"""
+Full-text search over post titles and content.
+
+Two backends answer the same queries:
+
+    mongo   a Mongo text index on title and content (default)
+    memory  an in-process inverted index, built from the posts collection at
+            startup and kept current by the post repository
+
+The memory backend needs no index build on the server and is meant for tests
+and small single-worker deployments. It holds every post in memory, and each
+worker has its own copy, so writes handled by one worker are not visible to
+searches on another.
+
+Both match any of the query terms and rank by relevance, with title matches
+weighted above content matches. The Mongo backend also understands quoted
+phrases, negated terms and stemming; the memory backend ignores those.
+
+Configuration is read from the environment:
+
+    SEARCH_BACKEND   mongo (default) or memory
+"""
+import heapq
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from fields import Fields, projection_for, select
+from ids import match
+from repositories.posts import POST_PROJECTION
+from routing import routed
+
+# Relative weight of a title match over a content match, in both backends
+TITLE_WEIGHT = 5
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its of on or that the this to was were will with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase terms, without stopwords."""
+    return [term for term in _TOKEN.findall(text.lower()) if term not in _STOPWORDS]
+
+class MongoTextSearch:
+    """
+    Search backed by the `title_content_text` index.
+
+    Results are ranked by Mongo's textScore. Writes need no extra work because
+    Mongo maintains the index itself.
+    """
+
+    def __init__(self, collection: AsyncIOMotorCollection):
+        self.collection = collection
+
+    async def search(self, q: str, user_id: Optional[str], limit: int, offset: int = 0, fields: Fields = None) -> List[Dict[str, Any]]:
+        """Return up to `limit` posts matching the query after skipping `offset`, best match first, each with its score."""
+        query: Dict[str, Any] = {"$text": {"$search": q}}
+        if user_id is not None:
+            query["user_id"] = match(user_id)
+        projection = {**projection_for(fields, POST_PROJECTION), "score": {"$meta": "textScore"}}
+        async with routed(self.collection) as (collection, session):
+            cursor = (
+                collection.find(query, projection, session=session)
+                .sort([("score", {"$meta": "textScore"}), ("_id", 1)])
+                .skip(offset)
+                .limit(limit)
+            )
+            return await cursor.to_list(length=limit)
+
+    async def rebuild(self) -> None:
+        pass
+
+    def index(self, post: Dict[str, Any]) -> None:
+        pass
+
+    def remove(self, post_ids: Iterable[str]) -> None:
+        pass
+
+class InMemorySearch:
+    """
+    Inverted index of post terms kept in process memory.
+
+    Each term maps to the posts containing it and a length-normalized weight.
+    A query scores every post that contains at least one term by the sum of
+    weight * idf over the matched terms.
+    """
+
+    def __init__(self, collection: Optional[AsyncIOMotorCollection] = None):
+        self.collection = collection
+        self._posts: Dict[str, Dict[str, Any]] = {}
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._terms: Dict[str, List[str]] = {}
+
+    async def rebuild(self) -> None:
+        """Index every post in the collection, replacing the current contents."""
+        self._posts.clear()
+        self._postings.clear()
+        self._terms.clear()
+        if self.collection is None:
+            return
+        async for post in self.collection.find({}, POST_PROJECTION):
+            self.index(post)
+
+    def index(self, post: Dict[str, Any]) -> None:
+        """Add a post, or replace the indexed copy of it."""
+        post_id = post["post_id"]
+        self.remove([post_id])
+        title_terms, content_terms = tokenize(post["title"]), tokenize(post["content"])
+        weights = Counter(content_terms)
+        for term in title_terms:
+            weights[term] += TITLE_WEIGHT
+        norm = math.sqrt(len(title_terms) + len(content_terms)) or 1.0
+        for term, weight in weights.items():
+            self._postings[term][post_id] = weight / norm
+        self._terms[post_id] = list(weights)
+        self._posts[post_id] = {field: post[field] for field in ("post_id", "title", "content", "user_id")}
+
+    def remove(self, post_ids: Iterable[str]) -> None:
+        """Drop posts from the index. Unknown IDs are ignored."""
+        for post_id in post_ids:
+            for term in self._terms.pop(post_id, ()):
+                postings = self._postings[term]
+                postings.pop(post_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._posts.pop(post_id, None)
+
+    async def search(self, q: str, user_id: Optional[str], limit: int, offset: int = 0, fields: Fields = None) -> List[Dict[str, Any]]:
+        """Return up to `limit` posts matching the query after skipping `offset`, best match first, each with its score."""
+        total = len(self._posts)
+        scores: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(q)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for post_id, weight in postings.items():
+                scores[post_id] += weight * idf
+        if user_id is not None:
+            scores = {post_id: score for post_id, score in scores.items() if self._posts[post_id]["user_id"] == user_id}
+        ranked: List[Tuple[float, str]] = heapq.nsmallest(offset + limit, ((-score, post_id) for post_id, score in scores.items()))
+        return [{**select(self._posts[post_id], fields), "score": -negative} for negative, post_id in ranked[offset:]]
+
+def search_from_env(collection: AsyncIOMotorCollection):
+    """Build the search backend configured by SEARCH_BACKEND for the posts collection."""
+    backend = os.getenv('SEARCH_BACKEND', 'mongo').lower()
+    if backend == 'mongo':
+        return MongoTextSearch(collection)
+    if backend == 'memory':
+        return InMemorySearch(collection)
+    raise ValueError(f"Unknown SEARCH_BACKEND: {backend}")
@@ -0,0 +1,134 @@
+import sys
+import asyncio
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from admission import AdmissionMiddleware, ConcurrencyLimiter, RateLimiter, classify, client_key
+from responses import FastJSONResponse
+
+def make_app(concurrency=1, class_limits=None, rate=0.0, burst=0.0, delay=0.2):
+    app = FastAPI()
+    app.add_middleware(
+        AdmissionMiddleware,
+        concurrency=concurrency,
+        class_limits=class_limits or {"list": (1, 1000), "read": (1, 50), "write": (1, 500)},
+        rate=rate,
+        burst=burst,
+    )
+
+    @app.get("/posts")
+    async def list_posts():
+        await asyncio.sleep(delay)
+        return FastJSONResponse(content={"posts": []})
+
+    @app.get("/posts/{post_id}")
+    async def get_post(post_id: str):
+        await asyncio.sleep(delay)
+        return FastJSONResponse(content={"post_id": post_id})
+
+    @app.get("/metrics")
+    async def metrics():
+        await asyncio.sleep(delay)
+        return FastJSONResponse(content={})
+
+    return app
+
+async def get_all(app, paths):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await asyncio.gather(*(client.get(path) for path in paths))
+
+# Test sorting requests into classes
+def test_classify():
+    assert classify("GET", "/posts") == "list"
+    assert classify("GET", "/users/abc/posts") == "list"
+    assert classify("GET", "/posts/search") == "list"
+    assert classify("GET", "/posts/abc") == "read"
+    assert classify("POST", "/posts:bulk") == "list"
+    assert classify("POST", "/posts") == "write"
+    assert classify("DELETE", "/users/abc") == "write"
+    assert classify("GET", "/posts/stream") is None
+    assert classify("GET", "/metrics") is None
+    assert classify("POST", "/admin/stats:reconcile") is None
+
+# Test that a released slot goes to the oldest waiter, and that waiting gives up after the timeout
+@pytest.mark.asyncio
+async def test_limiter_handoff_and_timeout():
+    limiter = ConcurrencyLimiter(1)
+    assert await limiter.acquire(0)
+    first = asyncio.create_task(limiter.acquire(1))
+    second = asyncio.create_task(limiter.acquire(1))
+    await asyncio.sleep(0)
+    assert limiter.waiting == 2
+    limiter.release(0.1)
+    assert await first
+    assert not second.done()
+    limiter.release(0.1)
+    assert await second
+    assert limiter.service_time == pytest.approx(0.1)
+
+    # The slot is still held, so this request runs out of time
+    assert not await limiter.acquire(0.01)
+    limiter.release(None)
+    assert limiter.active == 0 and limiter.waiting == 0
+
+# Test that requests are shed with 503 and Retry-After once their wait would exceed the budget
+@pytest.mark.asyncio
+async def test_overload_sheds_with_retry_after():
+    app = make_app()
+    responses = await get_all(app, ["/posts/a", "/posts/b", "/posts/c"])
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200, 503, 503]
+    rejected = next(response for response in responses if response.status_code == 503)
+    assert int(rejected.headers["retry-after"]) >= 1
+    assert rejected.json() == {"detail": "Server overloaded"}
+
+    # The predicted wait is now known, so a queued request is shed at once
+    app = make_app(class_limits={"list": (1, 1000), "read": (1, 300), "write": (1, 500)})
+    await get_all(app, ["/posts/a"])
+    responses = await get_all(app, ["/posts/a", "/posts/b", "/posts/c"])
+    assert sorted(response.status_code for response in responses) == [200, 200, 503]
+
+# Test that lists and point reads are limited separately
+@pytest.mark.asyncio
+async def test_classes_have_separate_limits():
+    app = make_app(concurrency=10, class_limits={"list": (1, 50), "read": (10, 50), "write": (1, 50)})
+    responses = await get_all(app, ["/posts", "/posts", "/posts/a", "/posts/b", "/posts/c"])
+    assert [response.status_code for response in responses].count(503) == 1
+    assert all(response.status_code == 200 for response in responses[2:])
+
+# Test that exempt endpoints are never limited
+@pytest.mark.asyncio
+async def test_exempt_paths():
+    responses = await get_all(make_app(), ["/metrics"] * 5)
+    assert all(response.status_code == 200 for response in responses)
+
+# Test per-client token buckets
+def test_rate_limit():
+    limiter = RateLimiter(rate=2, burst=2)
+    assert limiter.take("a", 0.0) == 0
+    assert limiter.take("a", 0.0) == 0
+    assert limiter.take("a", 0.0) == pytest.approx(0.5)
+    assert limiter.take("b", 0.0) == 0
+    assert limiter.take("a", 1.0) == 0
+
+    with TestClient(make_app(concurrency=10, rate=1, burst=1, delay=0)) as client:
+        assert client.get("/posts/a").status_code == 200
+        response = client.get("/posts/a")
+        assert response.status_code == 429
+        assert response.headers["retry-after"] == "1"
+
+# Test identifying clients by address, forwarded address or API key
+def test_client_key():
+    scope = {"client": ("10.0.0.1", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4, 10.0.0.9"), (b"x-api-key", b"k1")]}
+    assert client_key(scope, "ip", False) == "10.0.0.1"
+    assert client_key(scope, "ip", True) == "10.0.0.9"
+    assert client_key(scope, "api_key", False) == "key:k1"
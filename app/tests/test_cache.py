@@ -0,0 +1,102 @@
+import sys
+import asyncio
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+
+from cache import LRUCache, ReadThroughCache, cache_from_env
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# Test that entries expire after their TTL
+@pytest.mark.asyncio
+async def test_lru_entries_expire():
+    clock = FakeClock()
+    cache = LRUCache(max_entries=10, ttl_seconds=5, clock=clock)
+    await cache.set("user:1", {"user_id": "1"})
+    assert await cache.get("user:1") == (True, {"user_id": "1"})
+    clock.now = 5
+    assert await cache.get("user:1") == (False, None)
+
+# Test that the least recently used entry is evicted first
+@pytest.mark.asyncio
+async def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2, ttl_seconds=60)
+    await cache.set("a", 1)
+    await cache.set("b", 2)
+    await cache.get("a")
+    await cache.set("c", 3)
+    assert (await cache.get("b"))[0] is False
+    assert (await cache.get("a"))[0] is True
+    assert cache.evictions == 1
+
+# Test that concurrent misses on one key share a single load
+@pytest.mark.asyncio
+async def test_concurrent_misses_load_once():
+    cache = ReadThroughCache(LRUCache())
+    loads = 0
+
+    async def loader():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return {"post_id": "p1"}
+
+    results = await asyncio.gather(*(cache.get_or_load("post:p1", loader) for _ in range(20)))
+    assert all(result == {"post_id": "p1"} for result in results)
+    assert loads == 1
+    assert await cache.get_or_load("post:p1", loader) == {"post_id": "p1"}
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 19, 1)
+
+# Test that a load overlapping an invalidation is not cached
+@pytest.mark.asyncio
+async def test_invalidation_during_load_is_not_cached():
+    cache = ReadThroughCache(LRUCache())
+    release = asyncio.Event()
+
+    async def stale_loader():
+        await release.wait()
+        return {"title": "old"}
+
+    load = asyncio.create_task(cache.get_or_load("post:p1", stale_loader))
+    await asyncio.sleep(0)
+    await cache.invalidate("post:p1")
+    release.set()
+    assert await load == {"title": "old"}
+
+    async def fresh_loader():
+        return {"title": "new"}
+
+    assert await cache.get_or_load("post:p1", fresh_loader) == {"title": "new"}
+
+# Test that missing documents are not cached
+@pytest.mark.asyncio
+async def test_missing_documents_are_not_cached():
+    cache = ReadThroughCache(LRUCache())
+
+    async def loader():
+        return None
+
+    assert await cache.get_or_load("user:missing", loader) is None
+    assert cache.backend.size() == 0
+
+# Test that the per-worker memory cache is only used by a single worker
+def test_memory_cache_needs_one_worker(monkeypatch):
+    monkeypatch.delenv("CACHE_BACKEND", raising=False)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert isinstance(cache_from_env().backend, LRUCache)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    assert cache_from_env() is None
+    monkeypatch.setenv("CACHE_BACKEND", "memory")
+    with pytest.raises(ValueError):
+        cache_from_env()
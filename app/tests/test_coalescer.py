@@ -0,0 +1,76 @@
+import sys
+import asyncio
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from bulk import DUPLICATE_KEY
+from coalescer import WriteCoalescer
+
+class FakeRepository:
+    """Records each insert_many batch and rejects repeated titles like a unique index."""
+
+    def __init__(self):
+        self.batches = []
+        self.titles = set()
+
+    async def insert(self, data):
+        self.batches.append([data])
+        return 1
+
+    async def insert_many(self, docs):
+        self.batches.append(docs)
+        failures = {}
+        for position, doc in enumerate(docs):
+            if doc["title"] in self.titles:
+                failures[position] = DUPLICATE_KEY
+            self.titles.add(doc["title"])
+        return failures
+
+# Test that concurrent inserts are written as one batch once the delay passes
+@pytest.mark.asyncio
+async def test_concurrent_inserts_share_a_batch():
+    repository = FakeRepository()
+    coalescer = WriteCoalescer(repository, max_batch=100, max_delay_ms=5)
+    versions = await asyncio.gather(*(coalescer.insert({"title": f"post {i}"}) for i in range(10)))
+    assert versions == [1] * 10
+    assert [len(batch) for batch in repository.batches] == [10]
+
+# Test that a full batch is written without waiting for the delay
+@pytest.mark.asyncio
+async def test_full_batch_flushes_immediately():
+    repository = FakeRepository()
+    coalescer = WriteCoalescer(repository, max_batch=4, max_delay_ms=10_000)
+    await asyncio.wait_for(asyncio.gather(*(coalescer.insert({"title": f"post {i}"}) for i in range(8))), timeout=1)
+    assert [len(batch) for batch in repository.batches] == [4, 4]
+
+# Test that only the duplicate insert fails
+@pytest.mark.asyncio
+async def test_each_caller_gets_its_own_result():
+    repository = FakeRepository()
+    coalescer = WriteCoalescer(repository, max_batch=100, max_delay_ms=5)
+    results = await asyncio.gather(
+        coalescer.insert({"title": "same"}),
+        coalescer.insert({"title": "same"}),
+        coalescer.insert({"title": "other"}),
+        return_exceptions=True,
+    )
+    assert results[0] == 1 and results[2] == 1
+    assert isinstance(results[1], DuplicateKeyError)
+
+# Test that closing writes the waiting inserts and later ones go straight through
+@pytest.mark.asyncio
+async def test_close_flushes_pending():
+    repository = FakeRepository()
+    coalescer = WriteCoalescer(repository, max_batch=100, max_delay_ms=10_000)
+    waiting = [asyncio.create_task(coalescer.insert({"title": f"post {i}"})) for i in range(3)]
+    await asyncio.sleep(0)
+    await coalescer.close()
+    assert await asyncio.gather(*waiting) == [1, 1, 1]
+    assert await coalescer.insert({"title": "late"}) == 1
+    assert [len(batch) for batch in repository.batches] == [3, 1]
@@ -0,0 +1,94 @@
+import sys
+import json
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, available_encodings, negotiate
+from responses import FastJSONResponse
+
+POSTS = [{"post_id": str(i), "title": f"Post {i}", "content": "Compressible text " * 20} for i in range(50)]
+
+def make_app(encodings=("zstd", "br", "gzip")):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, encodings=available_encodings(encodings), min_size=1024)
+
+    @app.get("/large")
+    async def large():
+        return FastJSONResponse(content={"posts": POSTS}, headers={"ETag": '"c1-abc"'})
+
+    @app.get("/small")
+    async def small():
+        return FastJSONResponse(content={"ok": True})
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for post in POSTS:
+                yield json.dumps(post).encode() + b"\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/events")
+    async def events():
+        async def lines():
+            yield b"data: hello\n\n" * 200
+        return StreamingResponse(lines(), media_type="text/event-stream")
+
+    return app
+
+# Test picking the encoding from Accept-Encoding
+def test_negotiate():
+    offered = ["zstd", "br", "gzip"]
+    assert negotiate("gzip, deflate", offered) == "gzip"
+    assert negotiate("gzip, br", offered) == "br"
+    assert negotiate("gzip;q=1.0, br;q=0.5", offered) == "gzip"
+    assert negotiate("*", offered) == "zstd"
+    assert negotiate("*;q=0, gzip", offered) == "gzip"
+    assert negotiate("gzip;q=0", offered) is None
+    assert negotiate("identity", offered) is None
+
+# Test that a large JSON body is gzipped with an ETag of its own
+def test_gzip_whole_response():
+    with TestClient(make_app(["gzip"])) as client:
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"c1-abc-gzip"'
+    assert int(response.headers["content-length"]) < len(json.dumps({"posts": POSTS}))
+    assert response.json() == {"posts": POSTS}
+
+# Test that small bodies and clients that accept no offered encoding get plain responses
+def test_uncompressed_responses():
+    with TestClient(make_app(["gzip"])) as client:
+        assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
+        assert response.headers["etag"] == '"c1-abc"'
+        assert "content-encoding" not in client.get("/events", headers={"Accept-Encoding": "gzip"}).headers
+
+# Test that a streamed response is compressed incrementally
+def test_gzip_stream():
+    with TestClient(make_app(["gzip"])) as client:
+        response = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert [json.loads(line) for line in response.text.splitlines()] == POSTS
+
+# Test the optional encodings when their packages are installed
+@pytest.mark.parametrize("encoding, package", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(encoding, package):
+    pytest.importorskip(package)
+    with TestClient(make_app()) as client:
+        response = client.get("/large", headers={"Accept-Encoding": f"gzip;q=0.5, {encoding}"})
+        assert response.headers["content-encoding"] == encoding
+        assert response.json() == {"posts": POSTS}
+        response = client.get("/stream", headers={"Accept-Encoding": encoding})
+        assert response.headers["content-encoding"] == encoding
+        assert [json.loads(line) for line in response.text.splitlines()] == POSTS
@@ -0,0 +1,140 @@
+import sys
+import os
+import asyncio
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+from feed import PostFeed, format_event
+
+# Load environment variables
+load_dotenv()
+
+def replica_set_configured() -> bool:
+    """Change streams need MONGO_HOST to be a replica set member."""
+    try:
+        with MongoClient(os.getenv('MONGO_HOST'), serverSelectionTimeoutMS=2000) as client:
+            return "setName" in client.admin.command("hello")
+    except Exception:
+        return False
+
+requires_replica_set = pytest.mark.skipif(not replica_set_configured(), reason="MONGO_HOST is not a replica set")
+
+class FakeChangeStream:
+    """Hands out the changes put on it, like a change stream with no history."""
+
+    def __init__(self):
+        self.changes = asyncio.Queue()
+
+    async def try_next(self):
+        return None
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.changes.get()
+
+class FakeDatabase:
+    async def command(self, *args, **kwargs):
+        return {"ok": 1}
+
+class FakeCollection:
+    name = "posts"
+
+    def __init__(self):
+        self.database = FakeDatabase()
+        self.stream = FakeChangeStream()
+
+    def watch(self, pipeline, **kwargs):
+        return self.stream
+
+def insert_change(n: int):
+    return {"_id": {"_data": f"{n:04d}"}, "operationType": "insert", "fullDocument": {"post_id": f"post{n}", "title": f"Post {n}"}}
+
+async def publish(collection: FakeCollection, *numbers: int):
+    for n in numbers:
+        collection.stream.changes.put_nowait(insert_change(n))
+    # Let the feed's consumer task fan the changes out
+    await asyncio.sleep(0.01)
+
+# Test that every subscriber receives every change
+@pytest.mark.asyncio
+async def test_changes_fan_out_to_every_subscriber():
+    collection = FakeCollection()
+    feed = PostFeed(collection)
+    first, second = await feed.subscribe(), await feed.subscribe()
+    await publish(collection, 1)
+    for subscription in (first, second):
+        event = await subscription.next(1)
+        assert (event.id, event.type, event.data["post_id"]) == ("0001", "create", "post1")
+    assert format_event(event).startswith(b"id: 0001\nevent: create\ndata: {")
+    await feed.close()
+
+# Test that a reconnecting client gets the buffered events it missed, then live ones
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_events():
+    collection = FakeCollection()
+    feed = PostFeed(collection)
+    await feed.subscribe()
+    await publish(collection, 1, 2, 3)
+    subscription = await feed.subscribe(last_event_id="0001")
+    await publish(collection, 4)
+    received = [(await subscription.next(1)).id for _ in range(3)]
+    assert received == ["0002", "0003", "0004"]
+    await feed.close()
+
+# Test that a subscriber that falls too far behind is disconnected
+@pytest.mark.asyncio
+async def test_slow_subscriber_is_dropped():
+    collection = FakeCollection()
+    feed = PostFeed(collection, queue_size=2)
+    subscription = await feed.subscribe()
+    await publish(collection, 1, 2, 3)
+    assert await subscription.next(1) is None
+    assert subscription.closed
+    await feed.close()
+
+# Test that changes made through Mongo reach a subscriber, and that another worker resumes from an event ID
+@requires_replica_set
+@pytest.mark.asyncio
+async def test_feed_resumes_from_event_id():
+    client = AsyncIOMotorClient(os.getenv('MONGO_HOST'))
+    posts = client['takehome']['posts']
+    feed = PostFeed(posts)
+    try:
+        subscription = await feed.subscribe()
+        await posts.insert_one({"post_id": "feed_post_1", "title": "Feed Post 1", "content": "c", "user_id": "feed_user"})
+        created = await subscription.next(10)
+        assert created.type == "create" and created.data["post"]["title"] == "Feed Post 1"
+
+        await posts.update_one({"post_id": "feed_post_1"}, {"$set": {"content": "updated"}})
+        await posts.delete_one({"post_id": "feed_post_1"})
+
+        # A fresh feed has none of these events buffered, so it catches up with a change stream of its own
+        other_worker = PostFeed(posts)
+        resumed = await other_worker.subscribe(last_event_id=created.id)
+        events = [await resumed.next(10) for _ in range(2)]
+        assert [event.type for event in events] == ["update", "delete"]
+        assert events[0].data["post"]["content"] == "updated"
+        await other_worker.close()
+    finally:
+        await posts.delete_many({"post_id": "feed_post_1"})
+        await feed.close()
+        client.close()
@@ -0,0 +1,135 @@
+import sys
+import os
+import uuid
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import bson
+import pytest
+from bson.binary import Binary, UuidRepresentation
+from bson.codec_options import CodecOptions
+from fastapi.testclient import TestClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+# Load environment variables
+load_dotenv()
+
+# Import app
+from main import app
+import ids
+from ids import MONGO_CODEC_OPTIONS, match, match_many, to_db, uuid7
+from migrate_ids import migrate_collection
+
+@pytest.fixture
+def client():
+    # Entering the client runs the app lifespan, which opens the Mongo client
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def mongo_client():
+    mongo_client = MongoClient(os.getenv('MONGO_HOST'))
+    yield mongo_client
+    mongo_client.close()
+
+@pytest.fixture
+def clean_db(mongo_client):
+    test_db = mongo_client['takehome']
+    yield test_db
+
+# Test that UUIDv7s are valid, time ordered and strictly increasing within a process
+def test_uuid7_ordering():
+    values = [uuid7() for _ in range(5000)]
+    assert all(value.version == 7 and value.variant == uuid.RFC_4122 for value in values)
+    assert values == sorted(values)
+    assert len(set(values)) == len(values)
+    assert str(values[-1]) > str(values[0])
+
+# Test that only canonical UUID strings are stored as binary
+def test_to_db_forms():
+    value = str(uuid7())
+    assert to_db(value, 'uuid7') == Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+    assert to_db(value, 'uuid1') == value
+    assert to_db(value.upper(), 'uuid7') == value.upper()
+    assert to_db("test_user_id", 'uuid7') == "test_user_id"
+
+# Test that lookups match both forms while legacy lookup is on
+def test_match_forms(monkeypatch):
+    value = str(uuid7())
+    binary = Binary.from_uuid(uuid.UUID(value), UuidRepresentation.STANDARD)
+    monkeypatch.setattr(ids, "ID_LEGACY_LOOKUP", True)
+    assert match(value) == {"$in": [binary, value]}
+    assert match("test_user_id") == "test_user_id"
+    assert match_many([value, "test_user_id"]) == {"$in": [binary, value, "test_user_id"]}
+    monkeypatch.setattr(ids, "ID_LEGACY_LOOKUP", False)
+    assert match(value) == to_db(value)
+
+# Test that the client options decode binary IDs, nested ones included, to strings
+def test_codec_decodes_to_strings():
+    value = str(uuid7())
+    raw = bson.encode({"user_id": to_db(value, 'uuid7'), "posts": [{"post_id": to_db(value, 'uuid7')}]})
+    options = CodecOptions(uuid_representation=UuidRepresentation.STANDARD, type_registry=MONGO_CODEC_OPTIONS["type_registry"])
+    assert bson.decode(raw, codec_options=options) == {"user_id": value, "posts": [{"post_id": value}]}
+
+# Test that new users are stored with the strategy's IDs and shown as strings
+@pytest.mark.asyncio
+async def test_created_ids_round_trip(client, clean_db):
+    response = client.post("/users", json={"fullName": "Id User", "email": "iduser@example.com"})
+    assert response.status_code == 200
+    user_id = response.json()["user_id"]
+    try:
+        stored = clean_db.users.find_one({"user_id": match(user_id)})
+        assert stored["user_id"] == to_db(user_id)
+        assert uuid.UUID(user_id).version == (7 if ids.ID_STRATEGY == 'uuid7' else 1)
+        assert client.get(f"/users/{user_id}").json()["user_id"] == user_id
+    finally:
+        clean_db.users.delete_one({"user_id": match(user_id)})
+
+# Test that users stored with legacy string IDs are still found
+@pytest.mark.asyncio
+async def test_legacy_ids_are_found(client, clean_db):
+    legacy = str(uuid.uuid1())
+    clean_db.users.insert_one({"fullName": "Legacy User", "email": "legacyuser@example.com", "user_id": legacy, "version": 1})
+    try:
+        response = client.get(f"/users/{legacy}")
+        assert response.status_code == 200
+        assert response.json()["user_id"] == legacy
+    finally:
+        clean_db.users.delete_one({"user_id": legacy})
+
+# Test that the migration rewrites legacy IDs and leaves other IDs alone
+@pytest.mark.asyncio
+async def test_migration_rewrites_legacy_ids(clean_db):
+    legacy_post, legacy_user = str(uuid.uuid1()), str(uuid.uuid1())
+    collection = clean_db["ids_migration"]
+    collection.insert_many([
+        {"post_id": legacy_post, "user_id": legacy_user, "version": 3},
+        {"post_id": "readable_post_id", "user_id": legacy_user, "version": 1},
+        {"post_id": "plain_post_id", "user_id": "plain_user_id", "version": 1},
+    ])
+    motor_client = AsyncIOMotorClient(os.getenv('MONGO_HOST'), uuidRepresentation="standard")
+    try:
+        migrated = motor_client["takehome"]["ids_migration"]
+        dry_run = await migrate_collection(migrated, ("post_id", "user_id"), 'uuid7', batch_size=2, dry_run=True)
+        assert dry_run == {"migrated": 2, "raced": 0, "not_uuid": 1}
+        assert collection.count_documents({"user_id": legacy_user}) == 2
+
+        counts = await migrate_collection(migrated, ("post_id", "user_id"), 'uuid7', batch_size=2)
+        assert counts == {"migrated": 2, "raced": 0, "not_uuid": 1}
+        first = collection.find_one({"post_id": to_db(legacy_post, 'uuid7')})
+        assert first["user_id"] == to_db(legacy_user, 'uuid7')
+        assert first["version"] == 3
+        assert collection.find_one({"post_id": "readable_post_id"})["user_id"] == to_db(legacy_user, 'uuid7')
+        assert collection.find_one({"post_id": "plain_post_id"})["user_id"] == "plain_user_id"
+
+        # Migrating back to uuid1 restores the strings
+        await migrate_collection(migrated, ("post_id", "user_id"), 'uuid1')
+        assert collection.find_one({"post_id": legacy_post})["user_id"] == legacy_user
+    finally:
+        motor_client.close()
+        collection.drop()
@@ -0,0 +1,43 @@
+import sys
+import asyncio
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+from dev_init import mongo_client, DATABASE_NAME
+from indexes import ensure_indexes, find_blocking_sorts, find_collscans
+
+# Test that every query shape the routers issue is served by an index
+def test_no_query_shape_is_a_collscan():
+    client = mongo_client()
+
+    async def check():
+        db = client[DATABASE_NAME]
+        await ensure_indexes(db)
+        return await find_collscans(db)
+
+    try:
+        assert asyncio.run(check()) == []
+    finally:
+        client.close()
+
+# Test that no query shape sorts in memory, so pages cost the same at any collection size
+def test_no_query_shape_sorts_in_memory():
+    client = mongo_client()
+
+    async def check():
+        db = client[DATABASE_NAME]
+        await ensure_indexes(db)
+        return await find_blocking_sorts(db)
+
+    try:
+        assert asyncio.run(check()) == []
+    finally:
+        client.close()
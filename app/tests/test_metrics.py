@@ -0,0 +1,71 @@
+import sys
+import os
+from datetime import timedelta
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+from fastapi.testclient import TestClient
+from dotenv import load_dotenv
+from prometheus_client import REGISTRY
+from pymongo import MongoClient, monitoring
+
+# Load environment variables
+load_dotenv()
+
+# Import app
+from main import app
+from metrics import CommandMetrics
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def clean_db():
+    mongo_client = MongoClient(os.getenv('MONGO_HOST'))
+    yield mongo_client['takehome']
+    mongo_client.close()
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+# Test that requests are labeled by route template, not by raw path
+def test_requests_labeled_by_route_template(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Metrics User", "email": "metrics@example.com", "user_id": "metricsid"})
+    before = sample("http_requests_total", method="GET", route="/users/{user_id}", status="200")
+    client.get("/users/metricsid")
+    client.get("/no/such/path")
+    assert sample("http_requests_total", method="GET", route="/users/{user_id}", status="200") == before + 1
+    assert sample("http_requests_total", method="GET", route="unmatched", status="404") >= 1
+
+    body = client.get("/metrics").text
+    assert 'route="/users/{user_id}"' in body
+    assert "/users/metricsid" not in body
+    assert 'http_request_duration_seconds_bucket' in body
+    clean_db.users.delete_one({"user_id": "metricsid"})
+
+# Test that Mongo commands issued by a request are timed per collection
+def test_mongo_commands_recorded(client, clean_db):
+    before = sample("mongo_command_duration_seconds_count", collection="posts", command="find", outcome="success")
+    client.get("/posts/nonexistentid")
+    assert sample("mongo_command_duration_seconds_count", collection="posts", command="find", outcome="success") > before
+    assert sample("mongo_pool_checkout_wait_seconds_count", outcome="success") > 0
+
+# Test that the command listener pairs started and finished events by request
+def test_command_listener_labels_collection():
+    listener = CommandMetrics()
+    address = ("localhost", 27017)
+    labels = {"collection": "listenertest", "command": "getMore", "outcome": "success"}
+    before = sample("mongo_command_duration_seconds_count", **labels)
+
+    listener.started(monitoring.CommandStartedEvent({"getMore": 123, "collection": "listenertest"}, "takehome", 7, address, 1))
+    listener.succeeded(monitoring.CommandSucceededEvent(timedelta(milliseconds=3), {"ok": 1}, "getMore", 7, address, 1))
+
+    assert sample("mongo_command_duration_seconds_count", **labels) == before + 1
+    assert sample("mongo_command_duration_seconds_sum", **labels) >= 0.003
+    assert listener._collections == {}
@@ -1,5 +1,6 @@
 import sys
 import os
+import json
 from pathlib import Path
 
 # Add the parent directory of 'app' to the Python path
@@ -10,17 +11,46 @@ import pytest
 from fastapi.testclient import TestClient
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 
 # Load environment variables
 load_dotenv()
 
 # Import app
+import main
 from main import app
+from dev_init import mongo_client_options
+from ids import match, match_many
 
 @pytest.fixture
 def client():
-    return TestClient(app)
+    # Entering the client runs the app lifespan, which opens the Mongo client
+    with TestClient(app) as client:
+        yield client
+
+class CommandRecorder(monitoring.CommandListener):
+    """Records the collection of every find the app sends."""
+
+    def __init__(self):
+        self.finds = []
+
+    def started(self, event):
+        if event.command_name == "find":
+            self.finds.append(event.command["find"])
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+@pytest.fixture
+def recorded_client(monkeypatch):
+    # The app's Mongo client reports its commands to the recorder
+    recorder = CommandRecorder()
+    monkeypatch.setattr(main, "mongo_client", lambda: AsyncIOMotorClient(os.getenv('MONGO_HOST'), event_listeners=[recorder], **mongo_client_options()))
+    with TestClient(app) as client:
+        yield client, recorder
 
 @pytest.fixture
 def mongo_client():
@@ -50,10 +80,10 @@ async def test_create_post(client, clean_db):
     assert data["user_id"] == "test_user_id"
 
     # Verify post was added to the database
-    post = clean_db.posts.find_one({"post_id": data["post_id"]})
+    post = clean_db.posts.find_one({"post_id": match(data["post_id"])})
     assert post is not None
     # remove the post from the database
-    clean_db.posts.delete_one({"post_id": data["post_id"]})
+    clean_db.posts.delete_one({"post_id": match(data["post_id"])})
 
     # remove the user from the database
     clean_db.users.delete_one({"user_id": "test_user_id"})
@@ -76,7 +106,7 @@ async def test_create_duplicate_post(client, clean_db):
     )
     assert response.status_code == 400
     assert response.json()["detail"] == "Post already exists"
-    clean_db.posts.delete_one({"post_id": init_post_id})
+    clean_db.posts.delete_one({"post_id": match(init_post_id)})
     clean_db.users.delete_one({"user_id": "test_user_id"})
 
 # Test creating a post with a non-existent user
@@ -150,6 +180,22 @@ async def test_update_post(client, clean_db):
     clean_db.posts.delete_one({"post_id": "test_post_id"})
     clean_db.users.delete_one({"user_id": "test_user_id"})
 
+# Test that updating a missing post is 404 before a missing user is 400
+@pytest.mark.asyncio
+async def test_update_post_missing_post_and_user(client, clean_db):
+    update = {"title": "Nowhere Post", "content": "No post, no user", "user_id": "missing_user_id"}
+    response = client.put("/posts/missing_post_id", json=update)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Post not found"
+
+    clean_db.posts.insert_one({"title": "Orphan Update", "content": "Exists", "user_id": "missing_user_id", "post_id": "orphan_update_id"})
+    try:
+        response = client.put("/posts/orphan_update_id", json=update)
+        assert response.status_code == 400
+        assert response.json()["detail"] == "User does not exist"
+    finally:
+        clean_db.posts.delete_one({"post_id": "orphan_update_id"})
+
 
 # Test deleting a post
 @pytest.mark.asyncio
@@ -177,3 +223,295 @@ async def test_delete_nonexistent_post(client, clean_db):
 
 
     
+
+# Test paging through posts with a cursor
+@pytest.mark.asyncio
+async def test_get_posts_paginated(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Test User", "email": "test@gmail.com", "user_id": "test_user_id"})
+    post_ids = ["page_post_1", "page_post_2", "page_post_3"]
+    for i, post_id in enumerate(post_ids):
+        clean_db.posts.insert_one({"title": f"Page Post {i}", "content": "Paged", "user_id": "test_user_id", "post_id": post_id})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/posts", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["posts"]) <= 2
+        seen.extend(post["post_id"] for post in data["posts"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert [post_id for post_id in seen if post_id in post_ids] == post_ids
+    clean_db.posts.delete_many({"post_id": {"$in": post_ids}})
+    clean_db.users.delete_one({"user_id": "test_user_id"})
+
+# Test streaming all posts as NDJSON
+@pytest.mark.asyncio
+async def test_stream_posts(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Test User", "email": "test@gmail.com", "user_id": "test_user_id"})
+    clean_db.posts.insert_one({"title": "Stream Post", "content": "Streamed", "user_id": "test_user_id", "post_id": "stream_post_id"})
+    response = client.get("/posts", params={"stream": True})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert any(post["post_id"] == "stream_post_id" for post in lines)
+    clean_db.posts.delete_one({"post_id": "stream_post_id"})
+    clean_db.users.delete_one({"user_id": "test_user_id"})
+
+# Test creating, updating and deleting posts in bulk
+@pytest.mark.asyncio
+async def test_bulk_posts(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Test User", "email": "test@gmail.com", "user_id": "test_user_id"})
+
+    response = client.post(
+        "/posts:bulk",
+        json=[
+            {"title": "Bulk Post One", "content": "First", "user_id": "test_user_id"},
+            {"title": "Bulk Post Two", "content": "Second", "user_id": "non_existent_user_id"},
+            {"title": "Bulk Post One", "content": "Duplicate", "user_id": "test_user_id"},
+            {"title": "", "content": "Invalid", "user_id": "test_user_id"},
+        ]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 1
+    created, missing_user, duplicate, invalid = data["results"]
+    assert created["status"] == 200
+    assert missing_user["detail"] == "User does not exist"
+    assert duplicate["detail"] == "Post already exists"
+    assert invalid["status"] == 422
+    post_id = created["id"]
+
+    response = client.put(
+        "/posts:bulk",
+        json=[
+            {"post_id": post_id, "title": "Bulk Post Updated", "content": "Updated", "user_id": "test_user_id"},
+            {"post_id": "non_existent_post_id", "title": "Bulk Post Missing", "content": "Missing", "user_id": "test_user_id"},
+        ]
+    )
+    assert [result["status"] for result in response.json()["results"]] == [200, 404]
+    assert clean_db.posts.find_one({"post_id": match(post_id)})["title"] == "Bulk Post Updated"
+
+    response = client.post("/posts:bulkDelete", json={"ids": [post_id, "non_existent_post_id"]})
+    assert [result["status"] for result in response.json()["results"]] == [204, 404]
+    assert clean_db.posts.find_one({"post_id": match(post_id)}) is None
+    clean_db.users.delete_one({"user_id": "test_user_id"})
+
+# Test conditional GET and If-Match on a post
+@pytest.mark.asyncio
+async def test_post_etags(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Etag Author", "email": "etagauthor@example.com", "user_id": "etagauthorid"})
+    clean_db.posts.insert_one({"title": "Etag Post", "content": "Etag content", "user_id": "etagauthorid", "post_id": "etagpostid"})
+
+    response = client.get("/posts/etagpostid")
+    etag = response.headers["etag"]
+    assert "version" not in response.json()
+    assert client.get("/posts/etagpostid", headers={"If-None-Match": etag}).status_code == 304
+
+    update = {"title": "Etag Post", "content": "New content", "user_id": "etagauthorid"}
+    response = client.put("/posts/etagpostid", json=update, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert client.put("/posts/etagpostid", json=update, headers={"If-Match": etag}).status_code == 412
+
+    list_etag = client.get("/posts").headers["etag"]
+    assert client.get("/posts", headers={"If-None-Match": list_etag}).status_code == 304
+    client.delete("/posts/etagpostid")
+    assert client.get("/posts", headers={"If-None-Match": list_etag}).status_code == 200
+    clean_db.users.delete_one({"user_id": "etagauthorid"})
+
+# Test that the ETag of a compressed post works with If-None-Match and If-Match
+@pytest.mark.asyncio
+async def test_compressed_post_etag(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Gzip Author", "email": "gzipauthor@example.com", "user_id": "gzipauthorid"})
+    clean_db.posts.insert_one({"title": "Gzip Post", "content": "Long content " * 200, "user_id": "gzipauthorid", "post_id": "gzippostid"})
+    try:
+        response = client.get("/posts/gzippostid", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        etag = response.headers["etag"]
+        assert etag.startswith('"') and etag.endswith('-gzip"')
+        assert client.get("/posts/gzippostid", headers={"Accept-Encoding": "gzip", "If-None-Match": etag}).status_code == 304
+
+        update = {"title": "Gzip Post", "content": "Short now", "user_id": "gzipauthorid"}
+        response = client.put("/posts/gzippostid", json=update, headers={"If-Match": etag})
+        assert response.status_code == 200
+        assert client.put("/posts/gzippostid", json=update, headers={"If-Match": etag}).status_code == 412
+    finally:
+        clean_db.posts.delete_one({"post_id": "gzippostid"})
+        clean_db.users.delete_one({"user_id": "gzipauthorid"})
+
+# Test embedding the author with expand=user
+@pytest.mark.asyncio
+async def test_get_posts_expand_user(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Expand Author", "email": "expand@example.com", "user_id": "expandauthorid"})
+    clean_db.posts.insert_one({"title": "Expand Post", "content": "Expanded", "user_id": "expandauthorid", "post_id": "expandpostid"})
+    clean_db.posts.insert_one({"title": "Orphan Post", "content": "No author", "user_id": "missingauthorid", "post_id": "orphanpostid"})
+
+    response = client.get("/posts/expandpostid", params={"expand": "user"})
+    assert response.status_code == 200
+    assert response.json()["user"] == {"user_id": "expandauthorid", "fullName": "Expand Author", "email": "expand@example.com"}
+    assert "user" not in client.get("/posts/expandpostid").json()
+    assert client.get("/posts/orphanpostid", params={"expand": "user"}).json()["user"] is None
+
+    posts = client.get("/posts", params={"expand": "user", "limit": 1000}).json()["posts"]
+    by_id = {post["post_id"]: post for post in posts}
+    assert by_id["expandpostid"]["user"]["fullName"] == "Expand Author"
+    assert by_id["orphanpostid"]["user"] is None
+
+    lines = [json.loads(line) for line in client.get("/posts", params={"expand": "user", "stream": True}).text.splitlines()]
+    assert any(post["post_id"] == "expandpostid" and post["user"]["user_id"] == "expandauthorid" for post in lines)
+
+    assert client.get("/posts", params={"expand": "comments"}).status_code == 422
+    clean_db.posts.delete_many({"post_id": {"$in": ["expandpostid", "orphanpostid"]}})
+    clean_db.users.delete_one({"user_id": "expandauthorid"})
+
+# Test that expanding a page of posts costs one users query, not one per post
+@pytest.mark.asyncio
+async def test_expand_user_batches_author_lookups(recorded_client, clean_db):
+    client, recorder = recorded_client
+    user_ids = [f"batchauthor{i}" for i in range(5)]
+    clean_db.users.insert_many([{"fullName": "Batch Author", "email": f"batchauthor{i}@example.com", "user_id": user_id} for i, user_id in enumerate(user_ids)])
+    clean_db.posts.insert_many([
+        {"title": f"Batch Post {i}", "content": "Batched", "user_id": user_ids[i % 5], "post_id": f"batchpost{i}"}
+        for i in range(20)
+    ])
+    try:
+        recorder.finds.clear()
+        response = client.get("/posts", params={"expand": "user", "limit": 1000})
+        assert response.status_code == 200
+        assert recorder.finds.count("users") == 1
+    finally:
+        clean_db.posts.delete_many({"post_id": {"$regex": "^batchpost"}})
+        clean_db.users.delete_many({"user_id": {"$in": user_ids}})
+
+# Test that an expanded post's ETag changes when its author changes
+@pytest.mark.asyncio
+async def test_expanded_post_etag_follows_author(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Etag Author", "email": "expandetag@example.com", "user_id": "expandetagid"})
+    clean_db.posts.insert_one({"title": "Expand Etag", "content": "Expanded", "user_id": "expandetagid", "post_id": "expandetagpostid"})
+
+    etag = client.get("/posts/expandetagpostid", params={"expand": "user"}).headers["etag"]
+    list_etag = client.get("/posts", params={"expand": "user"}).headers["etag"]
+    client.put("/users/expandetagid", json={"fullName": "Renamed Author", "email": "expandetag@example.com"})
+
+    response = client.get("/posts/expandetagpostid", params={"expand": "user"}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["user"]["fullName"] == "Renamed Author"
+    assert client.get("/posts", params={"expand": "user"}, headers={"If-None-Match": list_etag}).status_code == 200
+    clean_db.posts.delete_one({"post_id": "expandetagpostid"})
+    clean_db.users.delete_one({"user_id": "expandetagid"})
+
+# Test searching posts with the configured backend and with the in-memory backend
+@pytest.mark.parametrize("backend", ["configured", "memory"])
+def test_search_posts(client, clean_db, backend):
+    if backend == "memory":
+        from search import InMemorySearch
+        client.app.state.search = InMemorySearch()
+    clean_db.users.insert_one({"fullName": "Search Author", "email": "searchauthor@example.com", "user_id": "searchauthorid"})
+    clean_db.users.insert_one({"fullName": "Other Author", "email": "searchother@example.com", "user_id": "searchotherid"})
+    created = []
+    for title, content, user_id in [
+        ("Xylophone tuning guide", "How to tune a xylophone at home", "searchauthorid"),
+        ("Weekend notes", "Bought a second-hand xylophone", "searchauthorid"),
+        ("Marimba or xylophone", "Comparing mallet instruments", "searchotherid"),
+        ("Unrelated post", "Nothing to see here", "searchauthorid"),
+    ]:
+        response = client.post("/posts", json={"title": f"{title} {backend}", "content": content, "user_id": user_id})
+        created.append(response.json()["post_id"])
+
+    response = client.get("/posts/search", params={"q": "xylophone"})
+    assert response.status_code == 200
+    hits = [hit for hit in response.json()["posts"] if hit["post_id"] in created]
+    assert {hit["post_id"] for hit in hits} == set(created[:3])
+    assert hits[-1]["post_id"] == created[1]
+    assert all(hit["score"] > 0 for hit in hits)
+
+    response = client.get("/posts/search", params={"q": "xylophone", "user_id": "searchotherid"})
+    assert [hit["post_id"] for hit in response.json()["posts"]] == [created[2]]
+
+    first = client.get("/posts/search", params={"q": "xylophone", "limit": 2}).json()
+    second = client.get("/posts/search", params={"q": "xylophone", "limit": 2, "cursor": first["next_cursor"]}).json()
+    assert not {hit["post_id"] for hit in first["posts"]} & {hit["post_id"] for hit in second["posts"]}
+
+    client.delete(f"/posts/{created[0]}")
+    response = client.get("/posts/search", params={"q": "xylophone", "user_id": "searchauthorid"})
+    assert [hit["post_id"] for hit in response.json()["posts"]] == [created[1]]
+
+    assert client.get("/posts/search", params={"q": "xylophone", "cursor": "bad"}).status_code == 400
+    assert client.get("/posts/search").status_code == 422
+    clean_db.posts.delete_many({"post_id": match_many(created)})
+    clean_db.users.delete_many({"user_id": {"$in": ["searchauthorid", "searchotherid"]}})
+
+# Test listing one user's posts, through both endpoints
+@pytest.mark.asyncio
+async def test_get_posts_by_user(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Prolific Author", "email": "prolific@example.com", "user_id": "prolificid"})
+    clean_db.users.insert_one({"fullName": "Quiet Author", "email": "quiet@example.com", "user_id": "quietid"})
+    post_ids = [f"prolificpost{i}" for i in range(5)]
+    clean_db.posts.insert_many([
+        {"title": f"Prolific Post {i}", "content": "Another one", "user_id": "prolificid", "post_id": post_id}
+        for i, post_id in enumerate(post_ids)
+    ])
+    clean_db.posts.insert_one({"title": "Someone Else", "content": "Not mine", "user_id": "quietotherid", "post_id": "otherpostid"})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/users/prolificid/posts", params=params).json()
+        seen.extend(post["post_id"] for post in data["posts"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == post_ids
+
+    response = client.get("/posts", params={"user_id": "prolificid"})
+    assert [post["post_id"] for post in response.json()["posts"]] == post_ids
+
+    response = client.get("/users/quietid/posts")
+    assert response.status_code == 200
+    assert response.json() == {"posts": [], "next_cursor": None}
+    assert client.get("/users/nonexistentid/posts").status_code == 404
+
+    clean_db.posts.delete_many({"post_id": {"$in": post_ids + ["otherpostid"]}})
+    clean_db.users.delete_many({"user_id": {"$in": ["prolificid", "quietid"]}})
+
+# Test selecting post fields with fields=
+@pytest.mark.asyncio
+async def test_get_posts_with_fields(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Sparse Author", "email": "sparse@example.com", "user_id": "sparseauthorid"})
+    clean_db.posts.insert_one({"title": "Sparse Post", "content": "A long body nobody asked for", "user_id": "sparseauthorid", "post_id": "sparsepostid"})
+
+    response = client.get("/posts", params={"fields": "title,post_id", "user_id": "sparseauthorid"})
+    assert response.status_code == 200
+    assert response.json()["posts"] == [{"post_id": "sparsepostid", "title": "Sparse Post"}]
+    assert response.headers["etag"] != client.get("/posts", params={"user_id": "sparseauthorid"}).headers["etag"]
+
+    lines = client.get("/posts", params={"fields": "title", "user_id": "sparseauthorid", "stream": True}).text.splitlines()
+    assert [json.loads(line) for line in lines] == [{"title": "Sparse Post"}]
+
+    response = client.get("/users/sparseauthorid/posts", params={"fields": "post_id"})
+    assert response.json()["posts"] == [{"post_id": "sparsepostid"}]
+
+    response = client.get("/posts/sparsepostid", params={"fields": "title"})
+    assert response.json() == {"title": "Sparse Post"}
+    full_etag = client.get("/posts/sparsepostid").headers["etag"]
+    assert response.headers["etag"] != full_etag
+    assert client.get("/posts/sparsepostid", params={"fields": "title"}, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    # Embedding the author keeps the author's ID
+    response = client.get("/posts/sparsepostid", params={"fields": "title", "expand": "user"})
+    assert response.json() == {"title": "Sparse Post", "user_id": "sparseauthorid", "user": {"user_id": "sparseauthorid", "fullName": "Sparse Author", "email": "sparse@example.com"}}
+
+    assert client.get("/posts", params={"fields": "title,password"}).status_code == 400
+    assert client.get("/posts", params={"fields": "user"}).status_code == 400
+    assert client.get("/posts", params={"fields": ","}).status_code == 400
+
+    clean_db.posts.delete_one({"post_id": "sparsepostid"})
+    clean_db.users.delete_one({"user_id": "sparseauthorid"})
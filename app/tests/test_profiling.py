@@ -0,0 +1,140 @@
+import sys
+import json
+import time
+import pstats
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from pydantic import BaseModel, field_validator
+
+import profiling
+from profiling import ProfilingMiddleware, list_profiles, profile_file, sign, verify
+from responses import FastJSONResponse
+from routes.admin import router as admin_router
+
+def spin(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+class SlowModel(BaseModel):
+    name: str
+
+    @field_validator("name")
+    @classmethod
+    def slow_check(cls, name: str) -> str:
+        # Validators are found by the FastAPI code that calls them
+        spin(0.05)
+        return name
+
+def make_app(directory, sample_rate=1.0, secret="", max_profiles=100):
+    app = FastAPI()
+    app.add_middleware(ProfilingMiddleware, sample_rate=sample_rate, secret=secret, directory=str(directory), max_profiles=max_profiles)
+
+    @app.post("/items")
+    async def create_item(item: SlowModel):
+        spin(0.05)
+        return FastJSONResponse(content={"name": item.name})
+
+    @app.get("/stream")
+    async def stream():
+        async def lines():
+            for i in range(3):
+                spin(0.02)
+                yield f"{i}\n".encode()
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return app
+
+# Test that a profiled request is split into phases and written as speedscope and pstats files
+def test_profile_phases_and_files(tmp_path):
+    with TestClient(make_app(tmp_path)) as client:
+        response = client.post("/items", json={"name": "x"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    [summary] = list_profiles(str(tmp_path))
+    assert summary["profile_id"] == profile_id
+    assert summary["route"] == "/items"
+    assert summary["status"] == 200
+    assert summary["trigger"] == "sampled"
+    phases = summary["phases_ms"]
+    assert phases["validation"] > 20
+    assert phases["app"] > 20
+    assert sum(phases.values()) >= summary["wall_ms"] * 0.99
+
+    speedscope = json.loads(Path(profile_file(summary["files"]["speedscope"], str(tmp_path))).read_text())
+    frames = speedscope["shared"]["frames"]
+    profile = speedscope["profiles"][0]
+    assert profile["type"] == "sampled"
+    assert len(profile["samples"]) == len(profile["weights"])
+    names = {frames[sample[-1]]["name"] for sample in profile["samples"]}
+    assert "spin" in names
+
+    stats = pstats.Stats(profile_file(summary["files"]["pstats"], str(tmp_path)))
+    spins = [entry for key, entry in stats.stats.items() if key[2] == "spin"]
+    assert spins and spins[0][3] > 0.05
+
+# Test that the task streaming a response body is profiled with its request
+def test_profile_follows_streaming_task(tmp_path):
+    with TestClient(make_app(tmp_path)) as client:
+        assert client.get("/stream").text == "0\n1\n2\n"
+    [summary] = list_profiles(str(tmp_path))
+    assert summary["phases_ms"]["app"] > 20
+
+# Test that only requests with a valid signed header are profiled when nothing is sampled
+def test_signed_header(tmp_path):
+    assert verify(sign("s3cret", 2_000), "s3cret", 1_000)
+    assert not verify(sign("s3cret", 2_000), "other", 1_000)
+    assert not verify(sign("s3cret", 500), "s3cret", 1_000)
+    assert not verify("garbage", "s3cret", 1_000)
+
+    with TestClient(make_app(tmp_path, sample_rate=0, secret="s3cret")) as client:
+        assert "x-profile-id" not in client.post("/items", json={"name": "x"}).headers
+        expired = {"X-Profile": sign("s3cret", int(time.time()) - 1)}
+        assert "x-profile-id" not in client.post("/items", json={"name": "x"}, headers=expired).headers
+        valid = {"X-Profile": sign("s3cret", int(time.time()) + 60)}
+        assert "x-profile-id" in client.post("/items", json={"name": "x"}, headers=valid).headers
+    assert [summary["trigger"] for summary in list_profiles(str(tmp_path))] == ["header"]
+
+# Test that old profiles are deleted and that only profile files can be fetched
+def test_profile_limit_and_names(tmp_path):
+    with TestClient(make_app(tmp_path, max_profiles=2)) as client:
+        for _ in range(3):
+            client.post("/items", json={"name": "x"})
+    assert len(list_profiles(str(tmp_path))) == 2
+    assert len(list(tmp_path.iterdir())) == 6
+    assert profile_file("../etc/passwd", str(tmp_path)) is None
+    assert profile_file("missing.pstats", str(tmp_path)) is None
+
+# Test that listing and downloading profiles needs a signed header, and that they are not found while profiling is off
+def test_profile_routes_require_signature(tmp_path, monkeypatch):
+    with TestClient(make_app(tmp_path)) as client:
+        client.post("/items", json={"name": "x"})
+    [summary] = list_profiles(str(tmp_path))
+    name = summary["profile_id"] + ".pstats"
+
+    app = FastAPI()
+    app.include_router(admin_router)
+    monkeypatch.setattr(profiling, "PROFILING_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILING_SECRET", "s3cret")
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    with TestClient(app) as client:
+        valid = {"X-Profile": sign("s3cret", int(time.time()) + 60)}
+        expired = {"X-Profile": sign("s3cret", int(time.time()) - 1)}
+        for path in ("/admin/profiles", f"/admin/profiles/{name}"):
+            assert client.get(path).status_code == 401
+            assert client.get(path, headers=expired).status_code == 401
+            assert client.get(path, headers={"X-Profile": sign("other", int(time.time()) + 60)}).status_code == 401
+            assert client.get(path, headers=valid).status_code == 200
+        assert client.get("/admin/profiles", headers=valid).json()["profiles"] == [summary]
+
+        monkeypatch.setattr(profiling, "PROFILING_ENABLED", False)
+        assert client.get("/admin/profiles", headers=valid).status_code == 404
+        assert client.get(f"/admin/profiles/{name}", headers=valid).status_code == 404
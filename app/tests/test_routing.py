@@ -0,0 +1,224 @@
+import sys
+import os
+import uuid
+from pathlib import Path
+from types import SimpleNamespace
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+from bson.timestamp import Timestamp
+from dotenv import load_dotenv
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import Primary, Secondary, SecondaryPreferred
+
+import routing
+from ids import MONGO_CODEC_OPTIONS
+from repositories.users import UserRepository
+from responses import FastJSONResponse
+from routing import (
+    CURRENT_ROUTE, OperationTimeListener, ReadRoutingMiddleware, RequestRoute,
+    decode_operation_time, encode_operation_time, latest_operation_time, read_class, read_preference, routed,
+)
+
+# Load environment variables
+load_dotenv()
+
+def secondaries_configured() -> bool:
+    """Secondary reads need MONGO_HOST to be a replica set with secondaries, such as a local three member set."""
+    try:
+        with MongoClient(os.getenv('MONGO_HOST'), serverSelectionTimeoutMS=2000) as client:
+            hello = client.admin.command("hello")
+            return "setName" in hello and len(hello.get("hosts", [])) > 1
+    except Exception:
+        return False
+
+requires_secondaries = pytest.mark.skipif(not secondaries_configured(), reason="MONGO_HOST is not a replica set with secondaries")
+
+def make_app():
+    app = FastAPI()
+    preferences = {"list": SecondaryPreferred(max_staleness=90), "read": Primary(), "write": Primary()}
+    app.add_middleware(ReadRoutingMiddleware, read_preferences=preferences)
+
+    def describe():
+        route = CURRENT_ROUTE.get()
+        return FastJSONResponse(content={"mode": route.read_preference.mongos_mode, "after": route.after and encode_operation_time(route.after)})
+
+    @app.get("/posts")
+    async def list_posts():
+        return describe()
+
+    @app.get("/posts/{post_id}")
+    async def get_post(post_id: str):
+        return describe()
+
+    @app.post("/posts")
+    async def create_post():
+        return describe()
+
+    return app
+
+class FakeSession:
+    def __init__(self):
+        self.operation_time = None
+        self.ended = False
+
+    def advance_operation_time(self, operation_time):
+        self.operation_time = operation_time
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.ended = True
+
+class FakeCollection:
+    """Records the read preference it is given and the sessions it starts."""
+
+    def __init__(self, read_preference=None):
+        self.read_preference = read_preference
+        self.sessions = []
+        self.database = SimpleNamespace(client=self)
+
+    def with_options(self, read_preference):
+        copy = FakeCollection(read_preference)
+        copy.sessions = self.sessions
+        return copy
+
+    async def start_session(self, causal_consistency):
+        assert causal_consistency
+        session = FakeSession()
+        self.sessions.append(session)
+        return session
+
+class ReadRecorder(monitoring.CommandListener):
+    """Records the server each find was sent to."""
+
+    def __init__(self):
+        self.finds = []
+
+    def started(self, event):
+        if event.command_name == "find":
+            self.finds.append("%s:%d" % event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+# Test that read preferences are built from their names and checked
+def test_read_preference():
+    assert read_preference("primary", 120) == Primary()
+    assert read_preference("secondaryPreferred", 120) == SecondaryPreferred(max_staleness=120)
+    assert read_preference("secondary") == Secondary()
+    with pytest.raises(ValueError):
+        read_preference("secondaries")
+    with pytest.raises(ValueError):
+        read_preference("nearest", 30)
+
+# Test that requests are sorted into list, read and write classes
+def test_read_class():
+    assert read_class("GET", "/posts") == "list"
+    assert read_class("GET", "/posts/search") == "list"
+    assert read_class("GET", "/users/abc/posts") == "list"
+    assert read_class("GET", "/posts/abc") == "read"
+    assert read_class("HEAD", "/users/abc") == "read"
+    assert read_class("POST", "/posts:bulk") == "write"
+    assert read_class("DELETE", "/posts/abc") == "write"
+
+# Test that operation times survive the header and malformed headers are ignored
+def test_operation_time_header():
+    assert decode_operation_time(encode_operation_time(Timestamp(1_700_000_000, 7))) == Timestamp(1_700_000_000, 7)
+    for value in ("", "17", "a.b", "1.2.3", "-1.0", f"{2**40}.0"):
+        assert decode_operation_time(value) is None
+
+# Test that the listener keeps the latest operation time only
+def test_listener_keeps_latest(monkeypatch):
+    monkeypatch.setattr(routing, "_latest", None)
+    listener = OperationTimeListener()
+    for reply in ({"ok": 1}, {"operationTime": Timestamp(10, 2)}, {"operationTime": Timestamp(10, 1)}):
+        listener.succeeded(SimpleNamespace(reply=reply))
+    assert latest_operation_time() == Timestamp(10, 2)
+
+# Test that each class gets its read preference and that operation times go back and forth
+def test_middleware(monkeypatch):
+    monkeypatch.setattr(routing, "_latest", Timestamp(100, 3))
+    with TestClient(make_app()) as client:
+        response = client.post("/posts")
+        assert response.json() == {"mode": "primary", "after": None}
+        token = response.headers["x-operation-time"]
+        assert token == "100.3"
+
+        response = client.get("/posts", headers={"X-Operation-Time": token})
+        assert response.json() == {"mode": "secondaryPreferred", "after": "100.3"}
+        assert response.headers["x-operation-time"] == "100.3"
+
+        response = client.get("/posts/abc")
+        assert response.json() == {"mode": "primary", "after": None}
+        assert "x-operation-time" not in response.headers
+        assert client.get("/posts", headers={"X-Operation-Time": "garbage"}).json()["after"] is None
+
+# Test that reads use a causally consistent session only when they leave the primary with an operation time
+@pytest.mark.asyncio
+async def test_routed(monkeypatch):
+    monkeypatch.setattr(routing, "_latest", Timestamp(100, 3))
+    collection = FakeCollection()
+
+    async def route(read_preference, after=None):
+        token = CURRENT_ROUTE.set(RequestRoute(read_preference, after))
+        try:
+            async with routed(collection) as (routed_collection, session):
+                return routed_collection, session
+        finally:
+            CURRENT_ROUTE.reset(token)
+
+    async with routed(collection) as (routed_collection, session):
+        assert routed_collection is collection and session is None
+    assert await route(Primary(), Timestamp(100, 1)) == (collection, None)
+
+    routed_collection, session = await route(Secondary())
+    assert routed_collection.read_preference == Secondary() and session is None
+
+    routed_collection, session = await route(Secondary(), Timestamp(100, 1))
+    assert routed_collection.read_preference == Secondary()
+    assert session.operation_time == Timestamp(100, 1) and session.ended
+
+    # A time newer than any this worker has seen is read from the primary
+    assert await route(Secondary(), Timestamp(100, 4)) == (collection, None)
+    assert len(collection.sessions) == 1
+
+# Test that reads from secondaries see the writes made just before, against a replica set with secondaries
+@requires_secondaries
+@pytest.mark.asyncio
+async def test_secondary_reads_follow_writes():
+    recorder = ReadRecorder()
+    client = AsyncIOMotorClient(os.getenv('MONGO_HOST'), event_listeners=[OperationTimeListener(), recorder], **MONGO_CODEC_OPTIONS)
+    users = UserRepository(client['takehome'])
+    primary = (await client.admin.command("hello"))["primary"]
+    user_ids = []
+    try:
+        for i in range(20):
+            user_id = str(uuid.uuid4())
+            token = CURRENT_ROUTE.set(RequestRoute(Primary()))
+            try:
+                await users.insert({"fullName": "Routed User", "email": f"routed{i}.{user_id}@example.com", "user_id": user_id})
+                user_ids.append(user_id)
+            finally:
+                CURRENT_ROUTE.reset(token)
+
+            token = CURRENT_ROUTE.set(RequestRoute(Secondary(), latest_operation_time()))
+            try:
+                user = await users.find_by_id(user_id)
+            finally:
+                CURRENT_ROUTE.reset(token)
+            assert user is not None and user["user_id"] == user_id
+        assert recorder.finds and primary not in recorder.finds
+    finally:
+        await users.delete_many(user_ids)
+        client.close()
@@ -0,0 +1,67 @@
+import sys
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+
+from search import InMemorySearch, tokenize
+
+def post(post_id, title, content, user_id="author"):
+    return {"post_id": post_id, "title": title, "content": content, "user_id": user_id}
+
+# Test that tokenizing lowercases and drops stopwords
+def test_tokenize():
+    assert tokenize("The Quick, brown FOX-es!") == ["quick", "brown", "fox", "es"]
+
+# Test that title matches rank above content matches
+@pytest.mark.asyncio
+async def test_title_matches_rank_first():
+    index = InMemorySearch()
+    index.index(post("content", "Cooking notes", "A recipe for sourdough bread and more about gardening"))
+    index.index(post("title", "Sourdough bread", "Notes from the weekend"))
+    index.index(post("other", "Gardening", "Tomatoes and peppers"))
+    hits = await index.search("sourdough", None, 10)
+    assert [hit["post_id"] for hit in hits] == ["title", "content"]
+    assert hits[0]["score"] > hits[1]["score"] > 0
+
+# Test that any query term matches and more matched terms rank higher
+@pytest.mark.asyncio
+async def test_any_term_matches():
+    index = InMemorySearch()
+    index.index(post("both", "Python and Mongo", "Using motor"))
+    index.index(post("one", "Python tips", "Generators"))
+    hits = await index.search("mongo python", None, 10)
+    assert [hit["post_id"] for hit in hits] == ["both", "one"]
+    assert await index.search("the and", None, 10) == []
+
+# Test filtering by author and paging with an offset
+@pytest.mark.asyncio
+async def test_user_filter_and_offset():
+    index = InMemorySearch()
+    for i in range(5):
+        index.index(post(f"p{i}", f"Search post {i}", "search " * (i + 1), user_id="even" if i % 2 == 0 else "odd"))
+    assert {hit["post_id"] for hit in await index.search("search", "odd", 10)} == {"p1", "p3"}
+    everything = [hit["post_id"] for hit in await index.search("search", None, 10)]
+    assert [hit["post_id"] for hit in await index.search("search", None, 2, offset=2)] == everything[2:4]
+
+# Test that only the selected fields are returned, with the score
+@pytest.mark.asyncio
+async def test_selected_fields():
+    index = InMemorySearch()
+    index.index(post("p1", "Sparse search", "A long body"))
+    hits = await index.search("sparse", None, 10, fields=("title",))
+    assert list(hits[0]) == ["title", "score"]
+
+# Test that updated and removed posts are reflected in results
+@pytest.mark.asyncio
+async def test_reindex_and_remove():
+    index = InMemorySearch()
+    index.index(post("p1", "Old title", "Old content"))
+    index.index(post("p1", "New title", "New content"))
+    assert await index.search("old", None, 10) == []
+    assert [hit["post_id"] for hit in await index.search("new", None, 10)] == ["p1"]
+    index.remove(["p1", "unknown"])
+    assert await index.search("new", None, 10) == []
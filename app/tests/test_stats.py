@@ -0,0 +1,158 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Add the parent directory of 'app' to the Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+# Import testing modules
+import pytest
+from fastapi.testclient import TestClient
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+
+# Load environment variables
+load_dotenv()
+
+# Import app
+from main import app
+import dependencies
+from ids import MONGO_CODEC_OPTIONS, match, match_many
+from repositories.posts import PostRepository
+from repositories.stats import RECONCILE_LOCK_ID
+
+@pytest.fixture
+def client():
+    # Entering the client runs the app lifespan, which opens the Mongo client
+    with TestClient(app) as client:
+        yield client
+
+@pytest.fixture
+def mongo_client():
+    mongo_client = MongoClient(os.getenv('MONGO_HOST'))
+    yield mongo_client
+    mongo_client.close()
+
+@pytest.fixture
+def clean_db(mongo_client):
+    test_db = mongo_client['takehome']
+    yield test_db
+
+def create_user(client, name):
+    response = client.post("/users", json={"fullName": "Stats User", "email": f"{name}@example.com"})
+    assert response.status_code == 200
+    return response.json()["user_id"]
+
+def create_post(client, user_id, title):
+    response = client.post("/posts", json={"title": title, "content": "Counted content", "user_id": user_id})
+    assert response.status_code == 200
+    return response.json()["post_id"]
+
+# Test that creates, author changes and deletes keep the counters current
+@pytest.mark.asyncio
+async def test_writes_update_counters(client, clean_db):
+    before = client.get("/stats").json()
+    author = create_user(client, "stats_author")
+    other = create_user(client, "stats_other")
+    post_ids = [create_post(client, author, f"Stats Post {i}") for i in range(3)]
+    try:
+        assert client.get("/stats").json() == {"users": before["users"] + 2, "posts": before["posts"] + 3}
+        assert client.get(f"/users/{author}/stats").json() == {"user_id": author, "posts": 3}
+        assert client.get(f"/users/{other}/stats").json() == {"user_id": other, "posts": 0}
+
+        # Moving a post to another author moves it between their counters
+        client.put(f"/posts/{post_ids[0]}", json={"title": "Stats Post 0", "content": "Moved", "user_id": other})
+        assert client.get(f"/users/{author}/stats").json()["posts"] == 2
+        assert client.get(f"/users/{other}/stats").json()["posts"] == 1
+
+        client.delete(f"/posts/{post_ids[1]}")
+        assert client.get(f"/users/{author}/stats").json()["posts"] == 1
+
+        # Deleting a user deletes their posts and their counter
+        client.delete(f"/users/{author}")
+        assert client.get(f"/users/{author}/stats").status_code == 404
+        assert client.get("/stats").json() == {"users": before["users"] + 1, "posts": before["posts"] + 1}
+    finally:
+        clean_db.posts.delete_many({"post_id": match_many(post_ids)})
+        clean_db.users.delete_many({"user_id": match_many([author, other])})
+        clean_db.stats.delete_many({"_id": {"$in": [f"users:{author}", f"users:{other}"]}})
+
+# Test that a bulk delete racing another delete of the same posts does not count them twice
+@pytest.mark.asyncio
+async def test_racing_deletes_count_once(client, clean_db, monkeypatch):
+    before = client.get("/stats").json()
+    author = create_user(client, "stats_racing")
+    post_ids = [create_post(client, author, f"Racing Post {i}") for i in range(4)]
+    motor_client = AsyncIOMotorClient(os.getenv('MONGO_HOST'), **MONGO_CODEC_OPTIONS)
+    posts = PostRepository(motor_client['takehome'])
+    original = posts.collection.delete_many
+
+    # Another request deletes one of the posts between the read and the delete
+    async def racing_delete_many(filter, *args, **kwargs):
+        assert client.delete(f"/posts/{post_ids[0]}").status_code == 204
+        return await original(filter, *args, **kwargs)
+
+    monkeypatch.setattr(posts.collection, "delete_many", racing_delete_many)
+    try:
+        # Which of them this delete removed is not known, and each is gone either way
+        assert await posts.delete_many(post_ids[:3]) == set(post_ids[:3])
+        assert client.get("/stats").json() == {"users": before["users"] + 1, "posts": before["posts"] + 1}
+        assert client.get(f"/users/{author}/stats").json()["posts"] == 1
+    finally:
+        motor_client.close()
+        clean_db.posts.delete_many({"post_id": match_many(post_ids)})
+        clean_db.users.delete_many({"user_id": match(author)})
+        clean_db.stats.delete_many({"_id": f"users:{author}"})
+
+@pytest.fixture
+def admin_token(monkeypatch):
+    monkeypatch.setattr(dependencies, "ADMIN_TOKEN", "test-admin-token")
+    return {"Authorization": "Bearer test-admin-token"}
+
+# Test that reconciling repairs counters that drifted from the collections
+@pytest.mark.asyncio
+async def test_reconcile_repairs_drift(client, clean_db, admin_token):
+    author = create_user(client, "stats_drift")
+    post_ids = [create_post(client, author, f"Drift Post {i}") for i in range(2)]
+    try:
+        clean_db.stats.update_one({"_id": f"users:{author}"}, {"$set": {"posts": 40}})
+        clean_db.stats.update_one({"_id": "totals"}, {"$inc": {"users": 7}})
+        clean_db.stats.insert_one({"_id": "users:gone", "user_id": "gone", "posts": 3})
+
+        response = client.post("/admin/stats:reconcile", headers=admin_token)
+        assert response.status_code == 200
+        assert response.json()["after"] == {
+            "users": clean_db.users.count_documents({}),
+            "posts": clean_db.posts.count_documents({}),
+        }
+        assert client.get(f"/users/{author}/stats").json()["posts"] == 2
+        assert client.get("/stats").json() == response.json()["after"]
+        assert clean_db.stats.find_one({"_id": "users:gone"}) is None
+    finally:
+        clean_db.posts.delete_many({"post_id": match_many(post_ids)})
+        clean_db.users.delete_many({"user_id": match(author)})
+        clean_db.stats.delete_many({"_id": f"users:{author}"})
+
+# Test that reconciling needs the admin token, and is off without one
+@pytest.mark.asyncio
+async def test_reconcile_requires_admin(client, monkeypatch):
+    monkeypatch.setattr(dependencies, "ADMIN_TOKEN", "")
+    assert client.post("/admin/stats:reconcile").status_code == 404
+    monkeypatch.setattr(dependencies, "ADMIN_TOKEN", "test-admin-token")
+    assert client.post("/admin/stats:reconcile").status_code == 401
+    assert client.post("/admin/stats:reconcile", headers={"Authorization": "Bearer wrong"}).status_code == 401
+
+# Test that only one recount runs at a time
+@pytest.mark.asyncio
+async def test_reconcile_lock(client, clean_db, admin_token):
+    clean_db.stats.insert_one({"_id": RECONCILE_LOCK_ID, "locked_at": datetime.now(timezone.utc)})
+    try:
+        assert client.post("/admin/stats:reconcile", headers=admin_token).status_code == 409
+        # A lock left by a process that died long ago is taken over
+        clean_db.stats.update_one({"_id": RECONCILE_LOCK_ID}, {"$set": {"locked_at": datetime.now(timezone.utc) - timedelta(days=1)}})
+        assert client.post("/admin/stats:reconcile", headers=admin_token).status_code == 200
+        assert clean_db.stats.find_one({"_id": RECONCILE_LOCK_ID}) is None
+    finally:
+        clean_db.stats.delete_one({"_id": RECONCILE_LOCK_ID})
@@ -1,5 +1,8 @@
 import sys
 import os
+import json
+import time
+import uuid
 from pathlib import Path
 
 # Add the parent directory of 'app' to the Python path
@@ -17,10 +20,14 @@ load_dotenv()
 
 # Import app
 from main import app
+import ids
+from ids import match, match_many
 
 @pytest.fixture
 def client():
-    return TestClient(app)
+    # Entering the client runs the app lifespan, which opens the Mongo client
+    with TestClient(app) as client:
+        yield client
 
 @pytest.fixture
 def mongo_client():
@@ -52,7 +59,7 @@ async def test_create_user(client, clean_db):
     # Verify user was added to the database
     user = clean_db.users.find_one({"email": "test@gmail.com"})
     user_id = user['user_id']
-    clean_db.users.delete_one({"user_id": user_id})
+    clean_db.users.delete_one({"user_id": match(user_id)})
     assert user is not None
 
 # Test creating a duplicate user
@@ -72,7 +79,7 @@ async def test_create_duplicate_user(client, clean_db):
     )
     assert response.status_code == 400
     assert response.json()["detail"] == "User already exists"
-    clean_db.users.delete_one({"user_id": init_user_id})
+    clean_db.users.delete_one({"user_id": match(init_user_id)})
 
 # Test getting all users
 @pytest.mark.asyncio
@@ -100,7 +107,7 @@ async def test_get_user_by_id(client, clean_db):
     assert user["user_id"] == user_id
     assert user["fullName"] == "Get User"
     assert user["email"] == "get@example.com"
-    clean_db.users.delete_one({"user_id": user_id})
+    clean_db.users.delete_one({"user_id": match(user_id)})
 
 # Test getting a non-existent user
 def test_get_nonexistent_user(client):
@@ -126,10 +133,10 @@ async def test_update_user(client, clean_db):
     assert updated_user["email"] == "updated@example.com"
 
     # Verify the update in the database
-    user = clean_db.users.find_one({"user_id": user_id})
+    user = clean_db.users.find_one({"user_id": match(user_id)})
     assert user["fullName"] == "Updated User"
     assert user["email"] == "updated@example.com"
-    clean_db.users.delete_one({"user_id": user_id})
+    clean_db.users.delete_one({"user_id": match(user_id)})
 
 # Test deleting a user
 @pytest.mark.asyncio
@@ -143,12 +150,241 @@ async def test_delete_user(client, clean_db):
     assert delete_response.status_code == 204
 
     # Verify the user was deleted from the database
-    user = clean_db.users.find_one({"user_id": user_id})
+    user = clean_db.users.find_one({"user_id": match(user_id)})
     assert user is None
-    clean_db.users.delete_one({"user_id": user_id})
+    clean_db.users.delete_one({"user_id": match(user_id)})
 
 # Test deleting a non-existent user
 def test_delete_nonexistent_user(client):
     response = client.delete("/users/nonexistentid")
     assert response.status_code == 404
-    assert response.json()["detail"] == "User not found"
\ No newline at end of file
+    assert response.json()["detail"] == "User not found"
+
+# Test paging through users with a cursor
+@pytest.mark.asyncio
+async def test_get_users_paginated(client, clean_db):
+    user_ids = ["pageid1", "pageid2", "pageid3"]
+    for i, user_id in enumerate(user_ids):
+        clean_db.users.insert_one({"fullName": "Page User", "email": f"page{i}@example.com", "user_id": user_id})
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/users", params=params)
+        assert response.status_code == 200
+        data = response.json()
+        assert len(data["users"]) <= 2
+        seen.extend(user["user_id"] for user in data["users"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert [user_id for user_id in seen if user_id in user_ids] == user_ids
+    assert len(seen) == len(set(seen))
+    clean_db.users.delete_many({"user_id": match_many(user_ids)})
+
+# Test streaming all users as NDJSON
+@pytest.mark.asyncio
+async def test_stream_users(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Stream User", "email": "stream@example.com", "user_id": "streamid"})
+    response = client.get("/users", params={"stream": True})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert any(user["user_id"] == "streamid" for user in lines)
+    clean_db.users.delete_one({"user_id": "streamid"})
+
+# Test an invalid cursor
+def test_get_users_invalid_cursor(client):
+    response = client.get("/users", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+# Test updating a user to an email that belongs to another user
+@pytest.mark.asyncio
+async def test_update_user_duplicate_email(client, clean_db):
+    clean_db.users.insert_one({"fullName": "First User", "email": "first@example.com", "user_id": "firstid"})
+    clean_db.users.insert_one({"fullName": "Second User", "email": "second@example.com", "user_id": "secondid"})
+
+    response = client.put(
+        "/users/secondid",
+        json={"fullName": "Second User", "email": "first@example.com"}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "User already exists"
+    clean_db.users.delete_many({"user_id": {"$in": ["firstid", "secondid"]}})
+
+# Test updating a non-existent user
+def test_update_nonexistent_user(client):
+    response = client.put(
+        "/users/nonexistentid",
+        json={"fullName": "Missing User", "email": "missing@example.com"}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "User not found"
+
+# Test creating, updating and deleting users in bulk
+@pytest.mark.asyncio
+async def test_bulk_users(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Existing User", "email": "bulkexisting@example.com", "user_id": "bulkexistingid"})
+
+    response = client.post(
+        "/users:bulk",
+        json=[
+            {"fullName": "Bulk One", "email": "bulkone@example.com"},
+            {"fullName": "Bulk Two", "email": "bulkexisting@example.com"},
+            {"fullName": "Bulk 3", "email": "bulkthree@example.com"},
+        ]
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["succeeded"] == 1
+    assert data["failed"] == 2
+    created, duplicate, invalid = data["results"]
+    assert created["status"] == 201
+    assert duplicate["status"] == 400 and duplicate["detail"] == "User already exists"
+    assert invalid["status"] == 400
+    new_id = created["id"]
+
+    response = client.put(
+        "/users:bulk",
+        json=[
+            {"user_id": new_id, "fullName": "Bulk Renamed", "email": "bulkone@example.com"},
+            {"user_id": "bulkmissingid", "fullName": "Missing User", "email": "bulkmissing@example.com"},
+        ]
+    )
+    assert [result["status"] for result in response.json()["results"]] == [200, 404]
+    assert clean_db.users.find_one({"user_id": match(new_id)})["fullName"] == "Bulk Renamed"
+
+    response = client.post("/users:bulkDelete", json={"ids": [new_id, "bulkexistingid", "bulkmissingid"]})
+    assert [result["status"] for result in response.json()["results"]] == [204, 204, 404]
+    assert clean_db.users.count_documents({"user_id": match_many([new_id, "bulkexistingid"])}) == 0
+
+# Test that a cached user is refreshed after an update
+@pytest.mark.asyncio
+async def test_get_user_after_update(client, clean_db):
+    user_id = "cacheid123"
+    clean_db.users.insert_one({"fullName": "Cached User", "email": "cached@example.com", "user_id": user_id})
+    assert client.get(f"/users/{user_id}").json()["fullName"] == "Cached User"
+
+    client.put(f"/users/{user_id}", json={"fullName": "Fresh User", "email": "cached@example.com"})
+    assert client.get(f"/users/{user_id}").json()["fullName"] == "Fresh User"
+
+    client.delete(f"/users/{user_id}")
+    assert client.get(f"/users/{user_id}").status_code == 404
+
+# Test conditional GET and If-Match on a user
+@pytest.mark.asyncio
+async def test_user_etags(client, clean_db):
+    user_id = "etagid123"
+    clean_db.users.insert_one({"fullName": "Etag User", "email": "etag@example.com", "user_id": user_id})
+
+    response = client.get(f"/users/{user_id}")
+    etag = response.headers["etag"]
+    assert "version" not in response.json()
+    response = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # If-Match compares strongly, so the weak form of the current ETag fails it
+    response = client.put(f"/users/{user_id}", json={"fullName": "Weak Etag", "email": "etag@example.com"}, headers={"If-Match": f"W/{etag}"})
+    assert response.status_code == 412
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+    response = client.put(f"/users/{user_id}", json={"fullName": "New Etag", "email": "etag@example.com"}, headers={"If-Match": etag})
+    assert response.status_code == 200
+    new_etag = response.headers["etag"]
+    assert new_etag != etag
+    assert client.get(f"/users/{user_id}", headers={"If-None-Match": etag}).status_code == 200
+
+    response = client.put(f"/users/{user_id}", json={"fullName": "Stale Etag", "email": "etag@example.com"}, headers={"If-Match": etag})
+    assert response.status_code == 412
+    response = client.delete(f"/users/{user_id}", headers={"If-Match": etag})
+    assert response.status_code == 412
+    response = client.delete(f"/users/{user_id}", headers={"If-Match": new_etag})
+    assert response.status_code == 204
+
+# Test that the user list ETag changes after a write
+@pytest.mark.asyncio
+async def test_users_list_etag(client, clean_db):
+    etag = client.get("/users").headers["etag"]
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/users", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == 200
+
+    user_id = client.post("/users", json={"fullName": "List Etag", "email": "listetag@example.com"}).json()["user_id"]
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 200
+    clean_db.users.delete_one({"user_id": match(user_id)})
+
+# Test that deleting a user with few posts deletes them within the request
+@pytest.mark.asyncio
+async def test_delete_user_deletes_posts(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Short Lived", "email": "shortlived@example.com", "user_id": "shortlivedid"})
+    clean_db.posts.insert_many([
+        {"title": f"Short Lived Post {i}", "content": "Soon gone", "user_id": "shortlivedid", "post_id": f"shortlivedpost{i}"}
+        for i in range(3)
+    ])
+
+    response = client.delete("/users/shortlivedid")
+    assert response.status_code == 204
+    assert clean_db.posts.count_documents({"user_id": "shortlivedid"}) == 0
+    assert client.get("/posts/shortlivedpost0").status_code == 404
+
+# Test that deleting a user with many posts hands them to a background job
+@pytest.mark.asyncio
+async def test_delete_user_starts_cascade_job(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Prolific Writer", "email": "prolificwriter@example.com", "user_id": "prolificwriterid"})
+    clean_db.posts.insert_many([
+        {"title": f"Prolific Writer Post {i}", "content": "So many words", "user_id": "prolificwriterid", "post_id": f"prolificwriterpost{i}"}
+        for i in range(7)
+    ])
+    jobs = client.app.state.jobs
+    jobs.inline_limit, jobs.chunk_size, jobs.pause_seconds = 2, 2, 0
+
+    response = client.delete("/users/prolificwriterid")
+    assert response.status_code == 202
+    job = response.json()
+    assert response.headers["location"] == f"/jobs/{job['job_id']}"
+    assert job["status"] == "running"
+    assert job["deleted_posts"] == 2
+    assert uuid.UUID(job["job_id"]).version == (7 if ids.ID_STRATEGY == 'uuid7' else 1)
+
+    for _ in range(100):
+        job = client.get(f"/jobs/{job['job_id']}").json()
+        if job["status"] != "running":
+            break
+        time.sleep(0.01)
+    assert job["status"] == "succeeded"
+    assert job["deleted_posts"] == 7
+    assert clean_db.posts.count_documents({"user_id": "prolificwriterid"}) == 0
+    assert client.get("/jobs/nonexistentjobid").status_code == 404
+
+    clean_db.jobs.delete_one({"_id": job["job_id"]})
+
+# Test selecting user fields with fields=
+@pytest.mark.asyncio
+async def test_get_users_with_fields(client, clean_db):
+    clean_db.users.insert_one({"fullName": "Sparse User", "email": "sparseuser@example.com", "user_id": "sparseuserid"})
+
+    response = client.get("/users/sparseuserid", params={"fields": "fullName"})
+    assert response.status_code == 200
+    assert response.json() == {"fullName": "Sparse User"}
+
+    # Page through every user, as the collection may hold users left by other tests
+    users = []
+    cursor = None
+    while True:
+        params = {"fields": "email", "limit": 100}
+        if cursor:
+            params["cursor"] = cursor
+        data = client.get("/users", params=params).json()
+        users.extend(data["users"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert {"email": "sparseuser@example.com"} in users
+    assert all(list(user) == ["email"] for user in users)
+
+    assert client.get("/users", params={"fields": "password"}).status_code == 400
+    clean_db.users.delete_one({"user_id": "sparseuserid"})
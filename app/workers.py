@@ -0,0 +1,24 @@
+from uvicorn.workers import UvicornWorker
+
+class ProductionWorker(UvicornWorker):
+    """
+    Uvicorn worker for gunicorn with the fast event loop and HTTP parser.
+
+    Requires uvloop and httptools, so a missing dependency fails at startup
+    instead of silently falling back to asyncio and h11.
+
+    On SIGTERM the worker stops accepting connections, waits for in-flight
+    requests (and the Mongo operations they are awaiting) to finish, then runs
+    the lifespan shutdown that closes the cache and the Mongo client. The wait
+    is capped a few seconds below gunicorn's graceful_timeout so that shutdown
+    can complete before gunicorn kills the worker.
+    """
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+    # Seconds reserved for the lifespan shutdown after the drain
+    SHUTDOWN_RESERVE_SECONDS = 5
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = max(1, self.cfg.graceful_timeout - self.SHUTDOWN_RESERVE_SECONDS)